@@ -0,0 +1,246 @@
+"""Re-run next-question/triage generation over stored sessions, e.g. after a prompt change.
+
+    cd backend
+    python -m app.batch --run-id prompt-v2 [--concurrency 8] [--query '{"done": true}']
+    python -m app.batch --fake 500          # against app/fakes.py, no OpenAI or MongoDB
+
+Sessions are streamed from the `sessions` collection with a cursor in _id order and
+their recent qas go through generate_next_question, at most --concurrency at a time.
+Results are written back with bulk UpdateOne writes under `<field>` (default
+`retriage`): next_question/done/form_type from the LLM, the local classifier's
+verdict, the run id and a timestamp. The live done/form_type are left alone.
+
+Resuming: after every bulk write the highest _id below which all sessions are
+written is saved to the checkpoint file, and the run continues from there. Sessions
+already carrying this run id are skipped too, so rerunning without a checkpoint
+only retries the ones that failed.
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from . import db
+from . import telemetry
+from .telemetry import logger
+
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+BATCH_WRITE_SIZE = int(os.getenv("BATCH_WRITE_SIZE", "100"))
+BATCH_PROGRESS_S = float(os.getenv("BATCH_PROGRESS_S", "5"))
+
+
+class Checkpoint:
+    """Last contiguous _id written, plus running totals, in a small JSON file."""
+
+    def __init__(self, path: Optional[str], run_id: str):
+        self.path = path
+        self.run_id = run_id
+        self.last_id: Optional[ObjectId] = None
+        self.totals = {"processed": 0, "written": 0, "failed": 0, "skipped": 0}
+
+    def load(self) -> bool:
+        if not self.path or not os.path.exists(self.path):
+            return False
+        with open(self.path) as f:
+            data = json.load(f)
+        if data.get("run_id") != self.run_id:
+            raise SystemExit(f"checkpoint {self.path} belongs to run {data.get('run_id')!r}, not {self.run_id!r}")
+        self.last_id = ObjectId(data["last_id"]) if data.get("last_id") else None
+        self.totals.update(data.get("totals", {}))
+        return True
+
+    def save(self):
+        if not self.path:
+            return
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w") as f:
+            json.dump({"run_id": self.run_id, "last_id": str(self.last_id) if self.last_id else None,
+                       "totals": self.totals, "saved_at": datetime.utcnow().isoformat()}, f)
+        os.replace(tmp, self.path)  # atomic: a crash never leaves a torn checkpoint
+
+
+class Progress:
+    def __init__(self, total: int, every: float = BATCH_PROGRESS_S):
+        self.total = total
+        self.every = every
+        self.started = time.monotonic()
+        self._last = 0.0
+
+    def report(self, totals: Dict, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last < self.every:
+            return
+        self._last = now
+        done = totals["processed"]
+        elapsed = now - self.started
+        rate = done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - done) / rate if rate and self.total > done else 0.0
+        logger.info("batch: %d/%d sessions (%d written, %d failed, %d skipped) %.1f/s, eta %.0fs",
+                    done, self.total, totals["written"], totals["failed"], totals["skipped"], rate, eta)
+
+
+async def _retriage(doc: Dict, bypass_cache: bool) -> Optional[Dict]:
+    """The new verdict for one session, or None when it has no answers yet."""
+    from .openai_client import generate_next_question
+    from .session_store import QAS_CONTEXT_WINDOW
+    from . import triage
+
+    prev_qas = (doc.get("qas") or [])[-QAS_CONTEXT_WINDOW:]
+    if not prev_qas:
+        return None
+    gen = await generate_next_question(prev_qas, doc.get("domain_questions"), bypass_cache=bypass_cache)
+    local = triage.get_classifier().classify(prev_qas)
+    return {
+        "next_question": gen.get("next_question"),
+        "done": bool(gen.get("done", False)),
+        "form_type": gen.get("form_type"),
+        "local_form_type": local.form_type,
+        "local_confidence": local.confidence,
+    }
+
+
+async def run(query: Optional[Dict] = None, run_id: str = "batch", field: str = "retriage",
+              concurrency: int = BATCH_CONCURRENCY, write_size: int = BATCH_WRITE_SIZE,
+              checkpoint_path: Optional[str] = None, limit: int = 0, bypass_cache: bool = True,
+              dry_run: bool = False) -> Dict:
+    """Re-triage every session matching `query`; returns the totals."""
+    from . import scheduler
+
+    # live traffic goes first when the batch shares a process (or a rate limit) with the API
+    scheduler.set_priority(scheduler.PRIORITY_BATCH)
+    sessions = db.get_db()["sessions"]
+    checkpoint = Checkpoint(checkpoint_path, run_id)
+    if checkpoint.load():
+        logger.info("batch: resuming run %s after %s", run_id, checkpoint.last_id)
+    totals = checkpoint.totals
+
+    selector = dict(query or {})
+    selector[f"{field}.run_id"] = {"$ne": run_id}
+    if checkpoint.last_id is not None:
+        selector["_id"] = {"$gt": checkpoint.last_id}
+    remaining = await sessions.count_documents(selector)
+    if limit:
+        remaining = min(remaining, limit)
+    progress = Progress(totals["processed"] + remaining)
+
+    sem = asyncio.Semaphore(concurrency)
+    # tasks in cursor order: results are written (and the checkpoint advanced) only up
+    # to the first session still in flight, so a crash never skips an unwritten one
+    in_flight: deque = deque()
+    writes: List[UpdateOne] = []
+    write_upto: Optional[ObjectId] = None
+
+    async def _one(doc: Dict) -> Optional[Dict]:
+        try:
+            return await _retriage(doc, bypass_cache)
+        finally:
+            sem.release()
+
+    async def _flush():
+        nonlocal writes
+        if writes and not dry_run:
+            await sessions.bulk_write(writes, ordered=False)
+        totals["written"] += len(writes)
+        writes = []
+        if write_upto is not None:
+            checkpoint.last_id = write_upto
+        checkpoint.save()
+
+    async def _collect(block: bool):
+        nonlocal write_upto
+        while in_flight and (block or in_flight[0][1].done()):
+            doc_id, task = in_flight.popleft()
+            try:
+                result = await task
+            except Exception as e:
+                totals["failed"] += 1
+                telemetry.event("batch_failed")
+                logger.warning("batch: session %s failed: %s", doc_id, e)
+                result = None
+            else:
+                if result is None:
+                    totals["skipped"] += 1
+                else:
+                    result.update(run_id=run_id, at=datetime.utcnow())
+                    writes.append(UpdateOne({"_id": doc_id}, {"$set": {field: result}}))
+            totals["processed"] += 1
+            write_upto = doc_id
+            if len(writes) >= write_size:
+                await _flush()
+            progress.report(totals)
+
+    cursor = sessions.find(selector, {"_id": 1, "session_id": 1, "qas": 1, "domain_questions": 1}).sort("_id", 1)
+    if limit:
+        cursor = cursor.limit(limit)
+    try:
+        async for doc in cursor:
+            await sem.acquire()
+            in_flight.append((doc["_id"], asyncio.create_task(_one(doc))))
+            await _collect(block=False)
+        await _collect(block=True)
+        await _flush()
+    finally:
+        for _, task in in_flight:
+            task.cancel()
+        progress.report(totals, force=True)
+    return totals
+
+
+async def _main(args) -> Dict:
+    if args.fake:
+        os.environ.setdefault("OPENAI_API_KEY", "fake")
+    from . import openai_client
+
+    if args.fake:
+        from . import fakes
+        fakes.install(openai=fakes.FakeOpenAI(latency=args.fake_latency_ms / 1000, jitter=args.fake_latency_ms / 4000),
+                      mongo=fakes.FakeMongoClient(latency=0.002))
+        from .routes import DEFAULT_QUESTIONS
+        await fakes.seed_sessions(db.get_db(), args.fake, DEFAULT_QUESTIONS)
+    await openai_client.startup()
+    try:
+        return await run(
+            query=json.loads(args.query) if args.query else None, run_id=args.run_id, field=args.field,
+            concurrency=args.concurrency, write_size=args.write_size,
+            checkpoint_path=None if args.no_checkpoint else (args.checkpoint or f"batch-{args.run_id}.checkpoint.json"),
+            limit=args.limit, bypass_cache=not args.use_cache, dry_run=args.dry_run,
+        )
+    finally:
+        await openai_client.shutdown()
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--run-id", default=datetime.utcnow().strftime("%Y%m%d"),
+                        help="tags written results; sessions already tagged are skipped (default: today)")
+    parser.add_argument("--query", help="extra Mongo filter on sessions, as JSON")
+    parser.add_argument("--field", default="retriage", help="session field the results are written to")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--write-size", type=int, default=BATCH_WRITE_SIZE, help="UpdateOne requests per bulk write")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: batch-<run-id>.checkpoint.json)")
+    parser.add_argument("--no-checkpoint", action="store_true")
+    parser.add_argument("--limit", type=int, default=0, help="stop after this many sessions")
+    parser.add_argument("--use-cache", action="store_true", help="allow LLM response cache hits")
+    parser.add_argument("--dry-run", action="store_true", help="generate but don't write")
+    parser.add_argument("--fake", type=int, default=0, metavar="N",
+                        help="run against app/fakes.py with N seeded sessions (no OpenAI or MongoDB)")
+    parser.add_argument("--fake-latency-ms", type=float, default=600)
+    args = parser.parse_args(argv)
+
+    telemetry.configure_logging()
+    totals = asyncio.run(_main(args))
+    print(json.dumps(totals))
+    if totals["failed"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
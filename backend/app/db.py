@@ -9,13 +9,18 @@ class Settings(BaseSettings):
     mongo_uri: str = os.getenv("MONGO_URI", "mongodb://localhost:27017/prescreener")
 
 settings = Settings()
+# connections the driver keeps open even when idle (the warm-up opens them up front)
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", "0"))
 
 _client: AsyncIOMotorClient | None = None
+_client_pid: int | None = None
 
 def get_client() -> AsyncIOMotorClient:
-    global _client
-    if _client is None:
-        _client = AsyncIOMotorClient(settings.mongo_uri)
+    global _client, _client_pid
+    # a client (and its pool) must not cross a fork: each uvicorn worker makes its own
+    if _client is None or (_client_pid is not None and _client_pid != os.getpid()):
+        _client = AsyncIOMotorClient(settings.mongo_uri, minPoolSize=MONGO_MIN_POOL_SIZE)
+        _client_pid = os.getpid()
     return _client
 
 def get_db():
@@ -27,3 +32,7 @@ def get_db():
     except Exception:
         dbname = "prescreener"
     return client[dbname]
+
+async def ping():
+    """One round trip to the server (connects the pool if it isn't yet)."""
+    await get_db().command("ping")
@@ -0,0 +1,524 @@
+import io
+import re
+import copy
+import json
+import time
+import wave
+import random
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import httpx
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+# In-process stand-ins for MongoDB, the OpenAI API and the TTS engine, so the app
+# can be benchmarked (bench/loadtest.py) or run offline without external services.
+# They cover what this app uses, not the full APIs. Call install() before the app
+# starts up. SCRIPTS and seed_sessions() are the scripted patients the benchmarks
+# and `python -m app.batch --fake` run against.
+
+
+# --- Mongo ---------------------------------------------------------------------------
+
+_MISSING = object()
+
+
+def _get_path(doc: Dict, path: str):
+    value: Any = doc
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+def _set_path(doc: Dict, path: str, value):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def _matches(doc: Dict, query: Dict) -> bool:
+    for key, cond in query.items():
+        if key == "$or":
+            if not any(_matches(doc, sub) for sub in cond):
+                return False
+            continue
+        value = _get_path(doc, key)
+        if isinstance(cond, dict) and cond and all(k.startswith("$") for k in cond):
+            if not all(_compare(op, value, arg) for op, arg in cond.items()):
+                return False
+        elif (None if value is _MISSING else value) != cond:
+            return False
+    return True
+
+
+_ORDERING = {
+    "$gt": lambda a, b: a > b,
+    "$gte": lambda a, b: a >= b,
+    "$lt": lambda a, b: a < b,
+    "$lte": lambda a, b: a <= b,
+}
+
+
+def _compare(op: str, value, arg) -> bool:
+    if op == "$exists":
+        return (value is not _MISSING) == bool(arg)
+    value = None if value is _MISSING else value
+    if op == "$in":
+        return value in arg
+    if op == "$nin":
+        return value not in arg
+    if op == "$ne":
+        return value != arg
+    if op in _ORDERING:
+        return value is not None and _ORDERING[op](value, arg)
+    raise NotImplementedError(f"fake query does not support {op}")
+
+
+def _sort_value(value):
+    # missing/null sort first, as in MongoDB
+    return (0, "") if value is _MISSING or value is None else (1, value)
+
+
+def _apply_update(doc: Dict, update: Dict, inserting: bool = False):
+    for path, value in update.get("$set", {}).items():
+        _set_path(doc, path, copy.deepcopy(value))
+    if inserting:
+        for path, value in update.get("$setOnInsert", {}).items():
+            _set_path(doc, path, copy.deepcopy(value))
+    for path, amount in update.get("$inc", {}).items():
+        current = _get_path(doc, path)
+        _set_path(doc, path, (0 if current is _MISSING else current) + amount)
+    for path in update.get("$unset", {}):
+        parent = _get_path(doc, path.rpartition(".")[0]) if "." in path else doc
+        if isinstance(parent, dict):
+            parent.pop(path.rpartition(".")[2], None)
+    for path, value in update.get("$push", {}).items():
+        current = _get_path(doc, path)
+        items = [] if current is _MISSING else list(current)
+        if isinstance(value, dict) and "$each" in value:
+            items.extend(copy.deepcopy(value["$each"]))
+            if "$slice" in value:
+                n = value["$slice"]
+                items = items[n:] if n < 0 else items[:n]
+        else:
+            items.append(copy.deepcopy(value))
+        _set_path(doc, path, items)
+
+
+def _project(doc: Dict, projection: Optional[Dict]) -> Dict:
+    doc = copy.deepcopy(doc)
+    if not projection:
+        return doc
+    include_id = projection.get("_id", 1)
+    slices = {k: v["$slice"] for k, v in projection.items() if isinstance(v, dict) and "$slice" in v}
+    fields = {k: v for k, v in projection.items() if k != "_id" and k not in slices}
+    if any(fields.values()) or (slices and not fields):
+        out = {k: doc[k] for k in list(fields) + list(slices) if k in doc}
+        if include_id and "_id" in doc:
+            out["_id"] = doc["_id"]
+    else:
+        out = {k: v for k, v in doc.items() if k not in fields}
+        if not include_id:
+            out.pop("_id", None)
+    for key, n in slices.items():
+        if isinstance(out.get(key), list):
+            out[key] = out[key][n:] if n < 0 else out[key][:n]
+    return out
+
+
+class FakeCursor:
+    def __init__(self, docs: List[Dict], projection: Optional[Dict], latency: float):
+        self._docs = docs
+        self._projection = projection
+        self._latency = latency
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key_or_list, direction: int = 1):
+        keys = [(key_or_list, direction)] if isinstance(key_or_list, str) else list(key_or_list)
+        for key, direction in reversed(keys):
+            self._docs.sort(key=lambda d: _sort_value(_get_path(d, key)), reverse=direction < 0)
+        return self
+
+    def skip(self, n: int):
+        self._skip = n
+        return self
+
+    def limit(self, n: int):
+        self._limit = n
+        return self
+
+    def _window(self) -> List[Dict]:
+        docs = self._docs[self._skip:]
+        if self._limit:
+            docs = docs[:self._limit]
+        return [_project(d, self._projection) for d in docs]
+
+    async def to_list(self, length: Optional[int] = None) -> List[Dict]:
+        await _sleep(self._latency)
+        docs = self._window()
+        return docs[:length] if length else docs
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        await _sleep(self._latency)
+        for doc in self._window():
+            yield doc
+
+
+class FakeCollection:
+    """Async subset of a motor collection over a list of dicts. `latency` (seconds)
+    is slept once per operation to model a network round trip."""
+
+    def __init__(self, name: str, latency: float = 0.0):
+        self.name = name
+        self.latency = latency
+        self.docs: List[Dict] = []
+        self.indexes: Dict[str, Dict] = {}  # name -> create_index options (not enforced)
+        self.operations = 0
+
+    async def _op(self):
+        self.operations += 1
+        await _sleep(self.latency)
+
+    def _find(self, query: Dict) -> Optional[Dict]:
+        for doc in self.docs:
+            if _matches(doc, query):
+                return doc
+        return None
+
+    async def create_index(self, keys, **kwargs):
+        await self._op()
+        name = "_".join(f"{k}_{v}" for k, v in keys) if not isinstance(keys, str) else keys
+        self.indexes[name] = kwargs
+        return name
+
+    async def insert_one(self, doc: Dict):
+        await self._op()
+        doc.setdefault("_id", ObjectId())
+        self.docs.append(copy.deepcopy(doc))
+        return type("InsertOneResult", (), {"inserted_id": doc["_id"]})()
+
+    async def insert_many(self, docs: List[Dict], ordered: bool = True):
+        await self._op()
+        for doc in docs:
+            doc.setdefault("_id", ObjectId())
+            self.docs.append(copy.deepcopy(doc))
+        return type("InsertManyResult", (), {"inserted_ids": [d["_id"] for d in docs]})()
+
+    async def find_one(self, query: Optional[Dict] = None, projection: Optional[Dict] = None):
+        await self._op()
+        doc = self._find(query or {})
+        return None if doc is None else _project(doc, projection)
+
+    def find(self, query: Optional[Dict] = None, projection: Optional[Dict] = None) -> FakeCursor:
+        self.operations += 1
+        docs = [d for d in self.docs if _matches(d, query or {})]
+        return FakeCursor(docs, projection, self.latency)
+
+    def _update(self, query: Dict, update: Dict, upsert: bool) -> tuple:
+        doc = self._find(query)
+        if doc is None:
+            if not upsert:
+                return None, 0, None
+            doc = {k: v for k, v in query.items() if not k.startswith("$") and not isinstance(v, dict)}
+            doc["_id"] = ObjectId()
+            _apply_update(doc, update, inserting=True)
+            self.docs.append(doc)
+            return doc, 0, doc["_id"]
+        _apply_update(doc, update)
+        return doc, 1, None
+
+    async def find_one_and_update(self, query: Dict, update: Dict, projection: Optional[Dict] = None,
+                                  return_document=ReturnDocument.BEFORE, upsert: bool = False):
+        await self._op()
+        before = copy.deepcopy(self._find(query))
+        doc, _, _ = self._update(query, update, upsert)
+        if doc is None:
+            return None
+        result = doc if return_document == ReturnDocument.AFTER else before
+        return None if result is None else _project(result, projection)
+
+    async def update_one(self, query: Dict, update: Dict, upsert: bool = False):
+        await self._op()
+        doc, matched, upserted_id = self._update(query, update, upsert)
+        return type("UpdateResult", (), {"matched_count": matched, "modified_count": matched, "upserted_id": upserted_id})()
+
+    async def delete_one(self, query: Dict):
+        await self._op()
+        doc = self._find(query)
+        if doc is not None:
+            self.docs.remove(doc)
+        return type("DeleteResult", (), {"deleted_count": int(doc is not None)})()
+
+    async def count_documents(self, query: Dict, limit: int = 0, **kwargs) -> int:
+        await self._op()
+        n = sum(1 for d in self.docs if _matches(d, query))
+        return min(n, limit) if limit else n
+
+    async def bulk_write(self, requests: list, ordered: bool = True):
+        """UpdateOne / InsertOne / DeleteOne requests in a single round trip."""
+        await self._op()
+        matched = modified = inserted = deleted = upserted = 0
+        for req in requests:
+            kind = type(req).__name__
+            if kind == "UpdateOne":
+                doc, n, upserted_id = self._update(req._filter, req._doc, bool(req._upsert))
+                matched += n
+                modified += n
+                upserted += int(upserted_id is not None)
+            elif kind == "InsertOne":
+                doc = req._doc
+                doc.setdefault("_id", ObjectId())
+                self.docs.append(copy.deepcopy(doc))
+                inserted += 1
+            elif kind == "DeleteOne":
+                doc = self._find(req._filter)
+                if doc is not None:
+                    self.docs.remove(doc)
+                    deleted += 1
+            else:
+                raise NotImplementedError(f"fake bulk_write does not support {kind}")
+        return type("BulkWriteResult", (), {
+            "matched_count": matched, "modified_count": modified, "inserted_count": inserted,
+            "deleted_count": deleted, "upserted_count": upserted,
+        })()
+
+
+class FakeDatabase:
+    def __init__(self, name: str, latency: float = 0.0):
+        self.name = name
+        self.latency = latency
+        self._collections: Dict[str, FakeCollection] = {}
+
+    async def command(self, name: str, **kwargs) -> Dict:
+        await _sleep(self.latency)
+        return {"ok": 1.0}
+
+    def __getitem__(self, name: str) -> FakeCollection:
+        if name not in self._collections:
+            self._collections[name] = FakeCollection(name, self.latency)
+        return self._collections[name]
+
+    def __getattr__(self, name: str) -> FakeCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+
+class FakeMongoClient:
+    """Stands in for AsyncIOMotorClient (db.get_client())."""
+
+    def __init__(self, latency: float = 0.0, default_db: str = "prescreener"):
+        self.latency = latency
+        self._default = default_db
+        self._dbs: Dict[str, FakeDatabase] = {}
+
+    def __getitem__(self, name: str) -> FakeDatabase:
+        if name not in self._dbs:
+            self._dbs[name] = FakeDatabase(name, self.latency)
+        return self._dbs[name]
+
+    def get_default_database(self) -> FakeDatabase:
+        return self[self._default]
+
+    def close(self):
+        pass
+
+
+# --- OpenAI --------------------------------------------------------------------------
+
+_DENTAL = re.compile(r"\b(?:tooth|teeth|gums?|dental|jaw|molar|cavity|filling)\b", re.IGNORECASE)
+
+
+class FakeOpenAI:
+    """OpenAI-compatible stub served through an httpx transport.
+
+    Chat completions sleep `latency` +/- `jitter` seconds (streamed replies send the
+    first token after `ttft_ratio` of that) and finish the interview with
+    probability `done_rate`; transcriptions sleep `stt_latency` and return one of
+    `transcripts`. Usage is reported from the prompt size (~4 chars per token).
+    A fraction `error_rate` of calls is rejected with 429 and `retry_after` seconds.
+    With `connect_latency`, a call that finds no idle keep-alive connection first pays
+    that much for a new one (TCP + TLS setup).
+    """
+
+    def __init__(self, latency: float = 0.6, jitter: float = 0.2, stt_latency: float = 0.8,
+                 done_rate: float = 0.35, ttft_ratio: float = 0.3, seed: Optional[int] = None,
+                 transcripts: Optional[List[str]] = None, error_rate: float = 0.0, retry_after: float = 0.1,
+                 connect_latency: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.stt_latency = stt_latency
+        self.done_rate = done_rate
+        self.ttft_ratio = ttft_ratio
+        self.rng = random.Random(seed)
+        self.transcripts = transcripts or ["I have had chest pain since yesterday"]
+        self.error_rate = error_rate
+        self.retry_after = retry_after
+        self.connect_latency = connect_latency
+        self._idle_connections = 0
+        self.calls = {"chat": 0, "stream": 0, "transcribe": 0, "prompt_tokens": 0, "throttled": 0, "connects": 0}
+
+    def transport(self) -> httpx.AsyncBaseTransport:
+        return httpx.MockTransport(self.handle)
+
+    def _delay(self, base: float) -> float:
+        return max(0.0, base + self.rng.uniform(-self.jitter, self.jitter)) if base else 0.0
+
+    def _reply(self, body: Dict) -> str:
+        messages = body.get("messages", [])
+        prompt = " ".join(m.get("content", "") for m in messages)
+        # only the next-question prompt asks for a form_type
+        followup = "form_type" not in (messages[0].get("content", "") if messages else "")
+        if self.rng.random() < self.done_rate:
+            form_type = None if followup else ("dentistry" if _DENTAL.search(prompt) else "cardiac")
+            return json.dumps({"next_question": None, "done": True, "form_type": form_type})
+        question = "Can you tell me more about when it happens?" if not followup else "Does anything make it better or worse?"
+        return json.dumps({"next_question": question, "done": False, "form_type": None})
+
+    def _usage(self, body: Dict, reply: str) -> Dict:
+        prompt_chars = sum(len(m.get("content", "")) for m in body.get("messages", []))
+        usage = {"prompt_tokens": prompt_chars // 4, "completion_tokens": max(1, len(reply) // 4)}
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        self.calls["prompt_tokens"] += usage["prompt_tokens"]
+        return usage
+
+    async def handle(self, request: httpx.Request) -> httpx.Response:
+        if not self.connect_latency:
+            return await self._handle(request)
+        if self._idle_connections:
+            self._idle_connections -= 1
+        else:
+            self.calls["connects"] += 1
+            await _sleep(self.connect_latency)
+        try:
+            return await self._handle(request)
+        finally:
+            self._idle_connections += 1
+
+    async def _handle(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.calls["throttled"] += 1
+            return httpx.Response(429, headers={"Retry-After": str(self.retry_after)},
+                                  json={"error": {"message": "fake: rate limited", "type": "rate_limit_exceeded"}})
+        if path.endswith("/audio/transcriptions"):
+            self.calls["transcribe"] += 1
+            await _sleep(self._delay(self.stt_latency))
+            return httpx.Response(200, json={"text": self.rng.choice(self.transcripts)})
+        if path.endswith("/models") and request.method == "GET":
+            return httpx.Response(200, json={"object": "list", "data": [{"id": "fake", "object": "model"}]})
+        if not path.endswith("/chat/completions"):
+            return httpx.Response(404, json={"error": {"message": f"fake: no route for {path}"}})
+        body = json.loads(request.content or b"{}")
+        reply = self._reply(body)
+        usage = self._usage(body, reply)
+        delay = self._delay(self.latency)
+        if not body.get("stream"):
+            self.calls["chat"] += 1
+            await _sleep(delay)
+            return httpx.Response(200, json={
+                "choices": [{"message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+        self.calls["stream"] += 1
+        return httpx.Response(200, headers={"content-type": "text/event-stream"},
+                              stream=_SSEStream(reply, usage, delay, self.ttft_ratio))
+
+
+class _SSEStream(httpx.AsyncByteStream):
+    def __init__(self, reply: str, usage: Dict, delay: float, ttft_ratio: float):
+        self.chunks = [reply[i:i + 8] for i in range(0, len(reply), 8)]
+        self.usage = usage
+        self.ttft = delay * ttft_ratio
+        self.step = (delay - self.ttft) / max(1, len(self.chunks))
+
+    async def __aiter__(self):
+        await _sleep(self.ttft)
+        for chunk in self.chunks:
+            yield ("data: " + json.dumps({"choices": [{"delta": {"content": chunk}}]}) + "\n\n").encode()
+            await _sleep(self.step)
+        yield ("data: " + json.dumps({"choices": [], "usage": self.usage}) + "\n\n").encode()
+        yield b"data: [DONE]\n\n"
+
+
+# --- TTS -----------------------------------------------------------------------------
+
+def silent_wav(seconds: float, rate: int = 16000) -> bytes:
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(rate)
+        w.writeframes(b"\x00\x00" * int(seconds * rate))
+    return buf.getvalue()
+
+
+class FakeTTS:
+    """Blocking render that sleeps `seconds_per_char` per character (run in a thread,
+    like the uncached pyttsx3 path) and returns a silent WAV of speaking length."""
+
+    def __init__(self, seconds_per_char: float = 0.004):
+        self.seconds_per_char = seconds_per_char
+        self.renders = 0
+
+    def render(self, text: str, voice_rate: int = 150, voice: Optional[str] = None) -> bytes:
+        self.renders += 1
+        time.sleep(self.seconds_per_char * len(text))
+        # ~15 chars per second of speech at 150 wpm
+        return silent_wav(len(text) / 15.0 * 150 / max(voice_rate, 1))
+
+
+# --- patients --------------------------------------------------------------------------
+
+# answers per scripted patient (typed, or returned by the fake transcriber); vague ones keep the LLM busy
+SCRIPTS = [
+    ["I've had a sharp pain in my chest when I climb stairs", "About two weeks", "Yes, my father had heart problems"],
+    ["My back tooth hurts when I drink something cold", "Since last month", "No, never"],
+    ["I just haven't been feeling well lately", "It comes and goes, mostly in the evening", "I get a bit dizzy and tired"],
+    ["Something is off, I can't really describe it", "My jaw aches sometimes", "It is worse when I chew"],
+]
+
+
+async def seed_sessions(db, n: int, questions: List[str]):
+    """Insert n finished-looking sessions (fake-0 ... fake-<n-1>) answered from SCRIPTS."""
+    docs = []
+    for i in range(n):
+        script = SCRIPTS[i % len(SCRIPTS)]
+        qas = [{"question": q, "answer": a, "timestamp": datetime.utcnow()}
+               for q, a in zip(questions, script[:1 + i % len(script)])]
+        docs.append({"session_id": f"fake-{i}", "patient_name": f"Patient {i}", "domain_questions": questions,
+                     "qas": qas, "qa_count": len(qas), "created_at": datetime.utcnow(), "done": False})
+    await db["sessions"].insert_many(docs)
+
+
+# --- wiring --------------------------------------------------------------------------
+
+async def _sleep(seconds: float):
+    if seconds > 0:
+        await asyncio.sleep(seconds)
+
+
+def install(openai: Optional[FakeOpenAI] = None, mongo: Optional[FakeMongoClient] = None,
+            tts_engine: Optional[FakeTTS] = None) -> Dict:
+    """Point the app at the fakes. Call before the app's startup event runs."""
+    from . import db, openai_client
+    from .utils import tts
+
+    openai = openai or FakeOpenAI()
+    mongo = mongo or FakeMongoClient()
+    tts_engine = tts_engine or FakeTTS()
+    db._client = mongo
+    openai_client._default_transport = openai.transport()
+    # render in a thread instead of the pyttsx3 worker pool
+    tts.TTS_POOL_SIZE = 0
+    tts._render_uncached = tts_engine.render
+    return {"openai": openai, "mongo": mongo, "tts": tts_engine}
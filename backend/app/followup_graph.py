@@ -0,0 +1,387 @@
+"""Precomputed follow-up questions per form type, walked locally before the LLM.
+
+Each form type has a versioned JSON graph in FOLLOWUP_GRAPH_DIR (default
+app/followup_graphs/<form_type>.json):
+
+    {"form_type": "cardiac", "version": 3, "fields": [...form field names...],
+     "questions": {"family": "Do you have a family history ...?", ...},
+     "nodes": {"tail": {...}},                      # shared subtrees ({"$ref": "tail"})
+     "branches": [{"when": {"chestPainOnExertion": "yes"}, "root": NODE}, ...]}
+    NODE = {"ask": "<question id>" | null, "next": {"yes": NODE, "no": NODE, "*": NODE}}
+
+A follow-up conversation is walked from the root of the first branch whose `when`
+matches the submitted form: each asked question must be the node's `ask`, and the
+answer (classified yes / no / anything else) picks the child, with "*" as the
+catch-all. The node reached holds the next question, or `"ask": null` for done.
+If the conversation leaves the tree, the next matching branch is tried, and if no
+branch covers it the caller asks the LLM as before.
+
+    cd backend
+    python -m app.followup_graph report                 # how many LLM calls the graphs replace
+    python -m app.followup_graph build --form-type cardiac [--min-support 5]
+
+`build` mines logged follow-up sessions (their `followup` field records the form
+type and the choice fields of the form) for questions that were asked in the same
+state often enough, writes the graph with the next version number, and keeps the
+hand-written (`"source": "seed"`) branches behind the mined ones.
+"""
+import os
+import re
+import sys
+import json
+import hashlib
+import asyncio
+import argparse
+from collections import Counter, defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from .telemetry import logger
+
+FOLLOWUP_GRAPH_MODE = os.getenv("FOLLOWUP_GRAPH_MODE", "on").lower()  # on | off
+FOLLOWUP_GRAPH_DIR = os.getenv("FOLLOWUP_GRAPH_DIR", os.path.join(os.path.dirname(__file__), "followup_graphs"))
+
+_YES = re.compile(r"^\W*(?:yes|yeah|yep|yup|i do|i have|i did|i am|correct|definitely|sometimes)\b", re.IGNORECASE)
+_NO = re.compile(r"^\W*(?:no|nope|nah|never|not really|none|nothing|i don'?t|i haven'?t|i didn'?t|i'?m not)\b", re.IGNORECASE)
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+
+_graphs: Optional[Dict[str, Dict]] = None
+_counters: Dict[str, Counter] = defaultdict(Counter)
+
+
+def answer_class(answer: Optional[str]) -> str:
+    answer = answer or ""
+    if _NO.match(answer):
+        return "no"
+    if _YES.match(answer):
+        return "yes"
+    return "*"
+
+
+def normalize(question: Optional[str]) -> str:
+    return _NON_WORD.sub(" ", (question or "").lower()).strip()
+
+
+def _value(raw) -> str:
+    return str(raw).strip().lower() if raw not in (None, "", [], {}) else ""
+
+
+def _resolve(node, nodes: Dict, depth: int = 0) -> Dict:
+    """Inline {"$ref": name} subtrees."""
+    if depth > 32:
+        raise ValueError("follow-up graph nesting too deep (a $ref cycle?)")
+    if "$ref" in node:
+        node = nodes[node["$ref"]]
+    return {"ask": node.get("ask"), "next": {cls: _resolve(child, nodes, depth + 1)
+                                             for cls, child in (node.get("next") or {}).items()}}
+
+
+def load(path: str) -> Dict:
+    with open(path) as f:
+        graph = json.load(f)
+    nodes = graph.get("nodes") or {}
+    graph["branches"] = [dict(branch, root=_resolve(branch["root"], nodes)) for branch in graph["branches"]]
+    graph["_normalized"] = {qid: normalize(text) for qid, text in graph["questions"].items()}
+    return graph
+
+
+def get_graphs() -> Dict[str, Dict]:
+    global _graphs
+    if _graphs is None:
+        graphs = {}
+        if os.path.isdir(FOLLOWUP_GRAPH_DIR):
+            for name in sorted(os.listdir(FOLLOWUP_GRAPH_DIR)):
+                if not name.endswith(".json"):
+                    continue
+                try:
+                    graph = load(os.path.join(FOLLOWUP_GRAPH_DIR, name))
+                except Exception as e:
+                    logger.warning("follow-up graph %s not loaded: %s", name, e)
+                    continue
+                graphs[graph["form_type"]] = graph
+        _graphs = graphs
+    return _graphs
+
+
+def set_graphs(graphs: Optional[Dict[str, Dict]]):
+    """Use these graphs (form_type -> loaded graph); None reloads from FOLLOWUP_GRAPH_DIR."""
+    global _graphs
+    _graphs = graphs
+
+
+def infer_form_type(form_data: Dict) -> Optional[str]:
+    """The form's own `type` if there is a graph for it, else the form type whose
+    fields the submitted form fills most, if any."""
+    declared = _value((form_data or {}).get("type"))
+    if declared in get_graphs():
+        return declared
+    filled = {key for key, raw in (form_data or {}).items() if _value(raw)}
+    best, best_overlap = None, 0
+    for form_type, graph in get_graphs().items():
+        overlap = len(filled & set(graph.get("fields", ())))
+        if overlap > best_overlap:
+            best, best_overlap = form_type, overlap
+    return best
+
+
+def _matches(when: Dict, form_data: Dict) -> bool:
+    for field, expected in when.items():
+        allowed = expected if isinstance(expected, list) else [expected]
+        if _value(form_data.get(field)) not in [str(v).lower() for v in allowed]:
+            return False
+    return True
+
+
+def _walk_tree(graph: Dict, node: Dict, prev_qas: List[Dict]) -> Optional[Dict]:
+    for qa in prev_qas:
+        ask = node["ask"]
+        if ask is None or graph["_normalized"].get(ask) != normalize(qa.get("question")):
+            return None
+        cls = answer_class(qa.get("answer"))
+        node = node["next"].get(cls) or node["next"].get("*")
+        if node is None:
+            return None
+    return node
+
+
+def walk(form_type: Optional[str], prev_qas: List[Dict], form_data: Dict, max_questions: int = 5) -> Optional[Dict]:
+    """The follow-up reply the graph gives for this conversation, or None when the
+    graph doesn't cover it (or there is no graph, or the mode is off). Past
+    max_questions it is left to the caller, which ends the follow-up anyway."""
+    if FOLLOWUP_GRAPH_MODE != "on" or not prev_qas or len(prev_qas) >= max_questions:
+        return None
+    graph = get_graphs().get(form_type or "")
+    counters = _counters[form_type or "unknown"]
+    counters["walks"] += 1
+    if graph is None:
+        counters["no_graph"] += 1
+        return None
+    for branch in graph["branches"]:
+        if not _matches(branch.get("when") or {}, form_data or {}):
+            continue
+        node = _walk_tree(graph, branch["root"], prev_qas)
+        if node is None:
+            continue
+        if node["ask"] is None:
+            counters["graph_done"] += 1
+            return {"next_question": None, "done": True}
+        counters["graph_questions"] += 1
+        return {"next_question": graph["questions"][node["ask"]], "done": False}
+    counters["uncovered"] += 1
+    return None
+
+
+def stats() -> Dict:
+    out = {"mode": FOLLOWUP_GRAPH_MODE, "versions": {ft: g.get("version") for ft, g in get_graphs().items()}}
+    for form_type, counters in _counters.items():
+        walks = counters["walks"]
+        saved = counters["graph_questions"] + counters["graph_done"]
+        out[form_type] = dict(counters, llm_calls_saved=saved, reduction=round(saved / walks, 4) if walks else 0.0)
+    return out
+
+
+# --- offline: mine logged sessions, report coverage -------------------------------
+
+def form_signature(form_type: Optional[str], form_data: Dict) -> Dict[str, str]:
+    """The choice-valued form fields (yes / no / unsure ...) a follow-up is keyed on."""
+    graph = get_graphs().get(form_type or "")
+    form_data = form_data or {}
+    out = {}
+    for field in graph["fields"] if graph else form_data:
+        value = _value(form_data.get(field))
+        if value and len(value) <= 12 and " " not in value:
+            out[field] = value
+    return out
+
+
+def _question_id(text: str, known: Dict[str, str]) -> str:
+    norm = normalize(text)
+    if norm not in known:
+        known[norm] = "q_" + hashlib.sha1(norm.encode("utf-8")).hexdigest()[:8]
+    return known[norm]
+
+
+def build(sessions: List[Dict], previous: Dict, min_support: int = 5, min_share: float = 0.5) -> Dict:
+    """A new graph version from logged follow-up sessions ({qas, followup} docs).
+
+    States are (form signature, questions asked and answer classes so far); the
+    next question asked in a state becomes the graph's choice when at least
+    `min_support` sessions reached the state and `min_share` of them asked it
+    (or finished there). Wording has to match after normalization, so mostly
+    questions from the seed graph, the opening questions and LLM cache hits repeat.
+    """
+    known = {normalize(text): qid for qid, text in previous.get("questions", {}).items()}
+    texts: Dict[str, Counter] = defaultdict(Counter)
+    # signature -> path -> Counter(next qid or None for done)
+    states: Dict[Tuple, Dict[Tuple, Counter]] = defaultdict(lambda: defaultdict(Counter))
+    for doc in sessions:
+        followup = doc.get("followup") or {}
+        qas = [qa for qa in doc.get("qas") or [] if qa.get("question")]
+        if not qas:
+            continue
+        signature = tuple(sorted((followup.get("form") or {}).items()))
+        path: Tuple = ()
+        for qa in qas:
+            qid = _question_id(qa["question"], known)
+            texts[qid][qa["question"].strip()] += 1
+            for sig in (signature, ()):
+                states[sig][path][qid] += 1
+            path = path + ((qid, answer_class(qa.get("answer"))),)
+        if followup.get("done"):
+            for sig in (signature, ()):
+                states[sig][path][None] += 1
+
+    def _choice(counter: Counter) -> Tuple[bool, Optional[str]]:
+        total = sum(counter.values())
+        if total < min_support:
+            return False, None
+        qid, count = counter.most_common(1)[0]
+        return count / total >= min_share, qid
+
+    def _tree(paths: Dict[Tuple, Counter], path: Tuple, ask: Optional[str]) -> Optional[Dict]:
+        node: Dict = {"ask": ask, "next": {}}
+        if ask is None:
+            return node
+        for cls in ("yes", "no", "*"):
+            child_path = path + ((ask, cls),)
+            if child_path not in paths:
+                continue
+            ok, qid = _choice(paths[child_path])
+            if ok:
+                child = _tree(paths, child_path, qid)
+                if child is not None:
+                    node["next"][cls] = child
+        return node
+
+    branches = []
+    for signature, paths in sorted(states.items(), key=lambda kv: -len(kv[0])):
+        if () not in paths:
+            continue
+        ok, opener = _choice(paths[()])
+        if not ok or opener is None:
+            continue
+        root = _tree(paths, (), opener)
+        if root["next"]:
+            branches.append({"when": dict(signature), "root": root, "source": "built",
+                             "support": sum(paths[()].values())})
+    branches += [b for b in previous.get("branches", []) if b.get("source") == "seed"]
+
+    questions = dict(previous.get("questions", {}))
+    for qid, variants in texts.items():
+        questions.setdefault(qid, variants.most_common(1)[0][0])
+    used = set()
+
+    def _collect(node: Dict):
+        if "$ref" in node:
+            _collect(previous["nodes"][node["$ref"]])
+            return
+        if node.get("ask"):
+            used.add(node["ask"])
+        for child in (node.get("next") or {}).values():
+            _collect(child)
+
+    for branch in branches:
+        _collect(branch["root"])
+    return {
+        "form_type": previous.get("form_type"),
+        "version": int(previous.get("version", 0)) + 1,
+        "built_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "sessions": len(sessions),
+        "fields": previous.get("fields", []),
+        "questions": {qid: text for qid, text in questions.items() if qid in used},
+        "nodes": previous.get("nodes", {}),
+        "branches": branches,
+    }
+
+
+def coverage(sessions: List[Dict]) -> Dict[str, Counter]:
+    """Replay logged follow-up turns through the loaded graphs: per form type, how
+    many turns the graph answers and how often it picks the question actually asked."""
+    out: Dict[str, Counter] = defaultdict(Counter)
+    graphs = get_graphs()
+    for doc in sessions:
+        followup = doc.get("followup") or {}
+        form_type = followup.get("form_type") or "unknown"
+        graph = graphs.get(form_type)
+        qas = doc.get("qas") or []
+        form = followup.get("form") or {}
+        for i in range(1, len(qas) + 1):
+            counts = out[form_type]
+            counts["turns"] += 1
+            if graph is None:
+                continue
+            reply = None
+            for branch in graph["branches"]:
+                if _matches(branch.get("when") or {}, form):
+                    node = _walk_tree(graph, branch["root"], qas[:i])
+                    if node is not None:
+                        reply = node
+                        break
+            if reply is None:
+                continue
+            counts["covered"] += 1
+            actual = qas[i]["question"] if i < len(qas) else None
+            predicted = graph["questions"][reply["ask"]] if reply["ask"] else None
+            if (actual is None and predicted is None) or (actual and predicted and normalize(actual) == normalize(predicted)):
+                counts["agreed"] += 1
+    return out
+
+
+async def logged_sessions(form_type: Optional[str] = None, query: Optional[Dict] = None) -> List[Dict]:
+    """Follow-up sessions recorded by /followup_answer (qas + followup), from the sessions collection."""
+    from . import db
+
+    selector = dict(query or {})
+    selector["followup.form_type"] = form_type if form_type else {"$exists": True}
+    cursor = db.get_db()["sessions"].find(selector, {"_id": 0, "qas": 1, "followup": 1})
+    return [doc async for doc in cursor]
+
+
+def _graph_path(form_type: str) -> str:
+    return os.path.join(FOLLOWUP_GRAPH_DIR, f"{form_type}.json")
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    sub = parser.add_subparsers(dest="command", required=True)
+    build_cmd = sub.add_parser("build", help="mine logged sessions into a new graph version")
+    build_cmd.add_argument("--form-type", required=True)
+    build_cmd.add_argument("--min-support", type=int, default=5, help="sessions needed in a state to keep its question")
+    build_cmd.add_argument("--min-share", type=float, default=0.5, help="share of those sessions that asked it")
+    build_cmd.add_argument("--out", help="where to write the graph (default: replace the current one)")
+    report_cmd = sub.add_parser("report", help="how many logged follow-up turns the graphs cover")
+    report_cmd.add_argument("--form-type")
+    for cmd in (build_cmd, report_cmd):
+        cmd.add_argument("--query", help="extra Mongo filter on sessions, as JSON")
+    args = parser.parse_args(argv)
+    query = json.loads(args.query) if args.query else None
+
+    sessions = asyncio.run(logged_sessions(args.form_type, query))
+    if args.command == "build":
+        path = _graph_path(args.form_type)
+        previous = {"form_type": args.form_type, "version": 0, "questions": {}, "branches": []}
+        if os.path.exists(path):
+            with open(path) as f:
+                previous = json.load(f)
+        graph = build(sessions, previous, args.min_support, args.min_share)
+        out = args.out or path
+        tmp = f"{out}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(graph, f, indent=2)
+        os.replace(tmp, out)
+        built = sum(1 for b in graph["branches"] if b.get("source") == "built")
+        print(f"{args.form_type} v{graph['version']}: {built} mined branches from {len(sessions)} sessions -> {out}")
+        return
+
+    report = coverage(sessions)
+    print(f"{'form_type':<12} {'turns':>7} {'covered':>8} {'agreed':>7} {'llm calls saved':>16}")
+    for form_type, counts in sorted(report.items()):
+        turns = counts["turns"] or 1
+        print(f"{form_type:<12} {counts['turns']:>7} {counts['covered']:>8} {counts['agreed']:>7} "
+              f"{counts['covered'] / turns:>15.1%}")
+    if not report:
+        print("no logged follow-up sessions", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import os
+import asyncio
+import hashlib
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from . import shared
+from .utils.lru import LRUCache
+
+# Duplicate-submission guard for /answer, /transcribe and friends. Each request
+# gets a key (the client's Idempotency-Key, or a hash of session/question/answer
+# content). Concurrent requests with the same key share one in-flight result, and
+# a completed result is replayed for IDEMPOTENCY_TTL seconds, so a double-click
+# costs one transcription, one qa_item and one LLM call. Failures are not cached.
+# With shared state (app/shared.py) this holds across workers: the first worker
+# takes a lock in the shared store, duplicates elsewhere wait for its result.
+IDEMPOTENCY_ENABLED = os.getenv("IDEMPOTENCY_ENABLED", "1") == "1"
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "120"))
+IDEMPOTENCY_MAX_ITEMS = int(os.getenv("IDEMPOTENCY_MAX_ITEMS", "4096"))
+# how long another worker's in-flight request holds the key before it is presumed dead
+IDEMPOTENCY_LOCK_TTL = float(os.getenv("IDEMPOTENCY_LOCK_TTL", "60"))
+_POLL_S = 0.05
+
+_results = LRUCache(max_items=IDEMPOTENCY_MAX_ITEMS, ttl=IDEMPOTENCY_TTL)
+_inflight: Dict[str, asyncio.Future] = {}
+_counters = {"requests": 0, "executed": 0, "coalesced": 0, "replayed": 0, "failed": 0, "waited_on_worker": 0}
+
+
+def content_hash(data) -> str:
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    return hashlib.sha256(data or b"").hexdigest()
+
+
+def request_key(route: str, client_key: Optional[str], *parts) -> Optional[str]:
+    """Key for a request: the client's key if given (scoped to the route), else a
+    hash of the parts (session id, question, answer/audio hash)."""
+    if not IDEMPOTENCY_ENABLED:
+        return None
+    if client_key:
+        raw = "\x00".join((route, "client", client_key))
+    else:
+        raw = "\x00".join([route, "derived"] + [str(p) for p in parts])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+async def run(key: Optional[str], fn: Callable[[], Awaitable]) -> Tuple[object, bool]:
+    """Run fn() once per key. Returns (result, replayed) where replayed is True when
+    the result came from an earlier or concurrent request with the same key."""
+    if key is None:
+        return await fn(), False
+    _counters["requests"] += 1
+    cached = _results.get(key)
+    if cached is not None:
+        _counters["replayed"] += 1
+        return cached, True
+    fut = _inflight.get(key)
+    if fut is not None:
+        _counters["coalesced"] += 1
+        # shield: one duplicate disconnecting must not cancel the shared work
+        return await asyncio.shield(fut), True
+
+    fut = asyncio.get_running_loop().create_future()
+    _inflight[key] = fut
+    try:
+        if shared.enabled():
+            result, replayed = await _run_shared(key, fn)
+        else:
+            _counters["executed"] += 1
+            result, replayed = await fn(), False
+    except asyncio.CancelledError:
+        fut.cancel()
+        raise
+    except BaseException as e:
+        _counters["failed"] += 1
+        fut.set_exception(e)
+        # mark retrieved so a future nobody joined doesn't log "exception never retrieved"
+        fut.exception()
+        raise
+    else:
+        _results.set(key, result)
+        fut.set_result(result)
+        return result, replayed
+    finally:
+        _inflight.pop(key, None)
+
+
+async def _run_shared(key: str, fn: Callable[[], Awaitable]) -> Tuple[object, bool]:
+    """Cross-worker part of run(): replay a stored result, wait for another worker's
+    in-flight run, or take the lock and run fn() here."""
+    waited = False
+    while True:
+        stored = await shared.fetch(f"idem:{key}")
+        if stored is not None:
+            _counters["replayed"] += 1
+            return stored["result"], True
+        locked = await shared.store(f"idem:{key}:lock", os.getpid(), IDEMPOTENCY_LOCK_TTL, nx=True)
+        if locked:
+            # the previous holder may have stored its result and let go since our fetch
+            stored = await shared.fetch(f"idem:{key}")
+            if stored is not None:
+                await shared.delete(f"idem:{key}:lock")
+                _counters["replayed"] += 1
+                return stored["result"], True
+            break
+        if locked is None:
+            break  # the shared store is down: run locally
+        if not waited:
+            _counters["waited_on_worker"] += 1
+            waited = True
+        await asyncio.sleep(_POLL_S)
+    try:
+        _counters["executed"] += 1
+        result = await fn()
+        if locked:
+            await shared.store(f"idem:{key}", {"result": result}, IDEMPOTENCY_TTL)
+        return result, False
+    finally:
+        if locked:
+            await shared.delete(f"idem:{key}:lock")
+
+
+def stats() -> Dict:
+    return dict(
+        _counters,
+        enabled=IDEMPOTENCY_ENABLED,
+        ttl=IDEMPOTENCY_TTL,
+        inflight=len(_inflight),
+        results=_results.stats(),
+    )
@@ -0,0 +1,152 @@
+import os
+import re
+import json
+import math
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+from . import shared
+from .utils.lru import LRUCache
+
+# Response cache for next-question / follow-up completions. The exact tier keys on
+# a normalized hash of what the model actually sees (recent Q/A text, counts,
+# form data), ignoring timestamps, case and whitespace. The optional semantic tier
+# matches near-identical answers to the same questions with a small local vector
+# index (hashed bag-of-words, cosine similarity). With shared state
+# (app/shared.py) exact entries are also stored there for the other workers; the
+# semantic index stays per process.
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "1") == "1"
+LLM_CACHE_MAX_ITEMS = int(os.getenv("LLM_CACHE_MAX_ITEMS", "2048"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))
+LLM_CACHE_SEMANTIC = os.getenv("LLM_CACHE_SEMANTIC", "0") == "1"
+LLM_CACHE_SIMILARITY = float(os.getenv("LLM_CACHE_SIMILARITY", "0.92"))
+# USD per 1K tokens, used to report the spend saved by hits (defaults: gpt-4o-mini)
+LLM_PRICE_INPUT_PER_1K = float(os.getenv("LLM_PRICE_INPUT_PER_1K", "0.00015"))
+LLM_PRICE_OUTPUT_PER_1K = float(os.getenv("LLM_PRICE_OUTPUT_PER_1K", "0.0006"))
+
+_VECTOR_DIM = 256
+_MAX_VECTORS_PER_SHAPE = 64
+_WORD = re.compile(r"[a-z0-9']+")
+
+_cache = LRUCache(max_items=LLM_CACHE_MAX_ITEMS, ttl=LLM_CACHE_TTL)
+# shape key -> [(vector, exact key)]; shape = everything except the free-text answers
+_vectors: Dict[str, List[Tuple[List[float], str]]] = {}
+_counters = {
+    "lookups": 0,
+    "exact_hits": 0,
+    "semantic_hits": 0,
+    "shared_hits": 0,
+    "bypassed": 0,
+    "stores": 0,
+    "saved_prompt_tokens": 0,
+    "saved_completion_tokens": 0,
+}
+
+
+def _normalize(text: Optional[str]) -> str:
+    return " ".join(_WORD.findall((text or "").lower()))
+
+
+def _keys(kind: str, prev_qas: List[Dict], extra: Optional[Dict]) -> Tuple[str, str, str]:
+    """Return (exact key, shape key, answer text) for a prompt context."""
+    recent = prev_qas[-4:]
+    shape = {
+        "kind": kind,
+        "n": len(prev_qas),
+        "questions": [_normalize(qa.get("question")) for qa in recent],
+        "extra": extra or {},
+    }
+    answers = [_normalize(qa.get("answer")) for qa in recent]
+    shape_raw = json.dumps(shape, sort_keys=True, ensure_ascii=False, default=str)
+    shape_key = hashlib.sha256(shape_raw.encode("utf-8")).hexdigest()
+    exact_key = hashlib.sha256((shape_raw + "\x00" + json.dumps(answers)).encode("utf-8")).hexdigest()
+    return exact_key, shape_key, " ".join(answers)
+
+
+def _embed(text: str) -> List[float]:
+    vec = [0.0] * _VECTOR_DIM
+    for word in text.split():
+        h = int.from_bytes(hashlib.blake2b(word.encode("utf-8"), digest_size=4).digest(), "little")
+        vec[h % _VECTOR_DIM] += 1.0 if h & 0x80000000 else -1.0
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+
+def _cosine(a: List[float], b: List[float]) -> float:
+    return sum(x * y for x, y in zip(a, b))
+
+
+async def lookup(kind: str, prev_qas: List[Dict], extra: Optional[Dict] = None, bypass: bool = False) -> Tuple[Optional[Dict], str]:
+    """Return (cached reply or None, cache token to pass to store())."""
+    exact_key, shape_key, answers = _keys(kind, prev_qas, extra)
+    token = "\x00".join((exact_key, shape_key, answers))
+    if not LLM_CACHE_ENABLED:
+        return None, token
+    if bypass:
+        _counters["bypassed"] += 1
+        return None, token
+    _counters["lookups"] += 1
+    entry = _cache.get(exact_key)
+    if entry is None and shared.enabled():
+        entry = await shared.fetch(f"llm:{exact_key}")
+        if entry is not None:
+            _counters["shared_hits"] += 1
+            _cache.set(exact_key, entry)
+    if entry is not None:
+        _counters["exact_hits"] += 1
+        return _hit(entry), token
+    if LLM_CACHE_SEMANTIC and answers:
+        query = _embed(answers)
+        best_key, best = None, LLM_CACHE_SIMILARITY
+        for vec, key in _vectors.get(shape_key, []):
+            score = _cosine(query, vec)
+            if score >= best:
+                best_key, best = key, score
+        if best_key is not None:
+            entry = _cache.get(best_key)
+            if entry is not None:
+                _counters["semantic_hits"] += 1
+                return _hit(entry), token
+    return None, token
+
+
+def _hit(entry: Dict) -> Dict:
+    usage = entry.get("usage") or {}
+    _counters["saved_prompt_tokens"] += usage.get("prompt_tokens", 0)
+    _counters["saved_completion_tokens"] += usage.get("completion_tokens", 0)
+    return dict(entry["reply"])
+
+
+def store(token: str, reply: Dict, usage: Optional[Dict] = None):
+    if not LLM_CACHE_ENABLED:
+        return
+    exact_key, shape_key, answers = token.split("\x00", 2)
+    entry = {"reply": dict(reply), "usage": usage or {}}
+    _cache.set(exact_key, entry)
+    if shared.enabled():
+        shared.store_later(f"llm:{exact_key}", entry, LLM_CACHE_TTL)
+    _counters["stores"] += 1
+    if LLM_CACHE_SEMANTIC and answers:
+        bucket = _vectors.setdefault(shape_key, [])
+        bucket.append((_embed(answers), exact_key))
+        if len(bucket) > _MAX_VECTORS_PER_SHAPE:
+            del bucket[0]
+        if len(_vectors) > LLM_CACHE_MAX_ITEMS:
+            # drop the oldest shape; its exact entries age out of the LRU on their own
+            _vectors.pop(next(iter(_vectors)))
+
+
+def stats() -> Dict:
+    hits = _counters["exact_hits"] + _counters["semantic_hits"]
+    saved_usd = (
+        _counters["saved_prompt_tokens"] / 1000 * LLM_PRICE_INPUT_PER_1K
+        + _counters["saved_completion_tokens"] / 1000 * LLM_PRICE_OUTPUT_PER_1K
+    )
+    return dict(
+        _counters,
+        enabled=LLM_CACHE_ENABLED,
+        semantic=LLM_CACHE_SEMANTIC,
+        hit_rate=round(hits / _counters["lookups"], 4) if _counters["lookups"] else 0.0,
+        saved_usd=round(saved_usd, 6),
+        entries=_cache.stats(),
+    )
@@ -2,9 +2,21 @@ import os
 from pathlib import Path
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 from . import db
-from .routes import router as routes
+from . import openai_client
+from .routes import router as routes, DEFAULT_QUESTIONS
+from .utils.tts_pool import shutdown_pool as shutdown_tts_pool
+from .utils.audio_upload import UploadSizeLimitMiddleware
+from . import session_store
+from . import stt
+from .session_store import RoundTripMiddleware
+from . import telemetry
+from . import warmup
+from .telemetry import TraceMiddleware, logger
+
+telemetry.configure_logging()
 
 app = FastAPI(title="Pre-screening Voice Assistant")
 
@@ -16,6 +28,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# reject oversized audio uploads before the multipart body is parsed
+app.add_middleware(UploadSizeLimitMiddleware)
+# report session DB round trips per request (X-DB-Round-Trips header, /stats)
+app.add_middleware(RoundTripMiddleware)
+# trace ids (X-Request-ID), Server-Timing and request latency histograms for /metrics
+app.add_middleware(TraceMiddleware)
+
 app.include_router(routes)
 
 # Serve static files (index.html)
@@ -25,22 +44,32 @@ if static_dir.exists():
 
 @app.on_event("startup")
 async def startup_event():
-    # ensure DB client created
-    client = db.get_client()
+    # one pooled async HTTP client for all LLM/Whisper calls
+    await openai_client.startup()
+    # start the session write-behind flusher, replaying updates a crashed process
+    # left in WRITE_BEHIND_LOG (app/write_behind.py)
+    await session_store.get_store().start()
     try:
-        # create indexes for sessions collection to speed lookups and ensure unique session_id
-        db_instance = db.get_db()
-        col = db_instance["sessions"]
-        # session_id should be unique
-        await col.create_index([("session_id", 1)], unique=True)
-        # index created_at for range queries
-        await col.create_index([("created_at", 1)])
-    except Exception:
+        # the unique session_id index is needed whatever WARMUP says
+        await session_store.get_store().ensure_indexes()
+    except Exception as e:
         # if DB isn't available at startup, we'll fallback at runtime
-        pass
+        logger.warning("creating session indexes failed: %s", e)
+    # open the DB pool, LLM connections and TTS engine before the first request
+    # needs them; /readyz reports when this is done (app/warmup.py)
+    await warmup.start(DEFAULT_QUESTIONS)
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    await warmup.stop()
+    await shutdown_tts_pool()
+    await stt.shutdown()
+    await openai_client.shutdown()
+    try:
+        # writes queued session updates before the DB client goes away
+        await session_store.get_store().close()
+    except Exception as e:
+        logger.warning("closing the session store failed: %s", e)
     client = db.get_client()
     try:
         client.close()
@@ -51,6 +80,17 @@ async def shutdown_event():
 async def root():
     return {"status": "ok", "message": "Pre-screening Voice Assistant backend. Visit /static/index.html for the web interface."}
 
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving (warm or not)."""
+    return {"status": "ok", "pid": os.getpid()}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: 200 once the warm-up has finished, 503 (with per-step status) before."""
+    status = warmup.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
 @app.get("/index.html")
 async def index_redirect():
     """Redirect to static index.html"""
@@ -1,194 +1,368 @@
 import os
+import re
 import json
-import tempfile
 import asyncio
-from typing import List, Dict
+from typing import Any, AsyncIterator, BinaryIO, List, Dict, Optional, Tuple
 from dotenv import load_dotenv
-import openai
+import httpx
+
+from . import llm_cache
+from . import telemetry
+from . import scheduler
+from . import prompts
 
 # Load environment variables from .env file
 load_dotenv()
 
+# checked when the client is built (and by the warm-up), not at import, so workers,
+# scripts and tools that never call OpenAI don't need a key
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-if OPENAI_API_KEY:
-    openai.api_key = OPENAI_API_KEY
-else:
-    raise ValueError("OPENAI_API_KEY environment variable is not set. Please set it in .env or export it.")
 
-# Simple helper wrappers. These call blocking openai functions inside to_thread so endpoints stay async.
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1")
+CHAT_MODEL = os.getenv("OPENAI_CHAT_MODEL", "gpt-4o-mini")
+TRANSCRIBE_MODEL = os.getenv("OPENAI_TRANSCRIBE_MODEL", "whisper-1")
+# Shared connection pool: sockets are kept alive and reused across requests
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "20"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+
+_http: Optional[httpx.AsyncClient] = None
+# transport used by startup() when none is passed (app.fakes points this at a local stub)
+_default_transport: Optional[httpx.AsyncBaseTransport] = None
+
+# Native async calls on one shared httpx client, so concurrency is bounded by open
+# sockets and the per-model scheduler (app/scheduler.py) rather than by the default
+# thread pool.
+
+def _new_client(transport: Optional[httpx.AsyncBaseTransport] = None) -> httpx.AsyncClient:
+    api_key = OPENAI_API_KEY or os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        telemetry.logger.warning("OPENAI_API_KEY is not set; LLM and Whisper calls will fail. Set it in .env or export it.")
+    return httpx.AsyncClient(
+        base_url=OPENAI_BASE_URL,
+        headers={"Authorization": f"Bearer {api_key}"} if api_key else {},
+        limits=httpx.Limits(max_connections=OPENAI_MAX_CONNECTIONS, max_keepalive_connections=OPENAI_MAX_KEEPALIVE),
+        timeout=httpx.Timeout(OPENAI_TIMEOUT, connect=10.0),
+        transport=transport,
+    )
+
+async def startup(transport: Optional[httpx.AsyncBaseTransport] = None):
+    """Open the shared client. transport can be swapped for a local stub."""
+    global _http
+    if _http is None:
+        _http = _new_client(transport or _default_transport)
+
+async def shutdown():
+    global _http
+    client, _http = _http, None
+    if client is not None:
+        await client.aclose()
+
+def get_http() -> httpx.AsyncClient:
+    global _http
+    if _http is None:
+        # created lazily if the app's startup hook didn't run (scripts, tests)
+        _http = _new_client()
+    return _http
+
+async def warm(connections: int = 2) -> str:
+    """Open `connections` keep-alive connections to the API (TLS handshakes included)
+    with cheap authenticated GET /models calls. Raises when the key is missing or rejected."""
+    if not (OPENAI_API_KEY or os.getenv("OPENAI_API_KEY")):
+        raise RuntimeError("OPENAI_API_KEY is not set")
+    http = get_http()
+    responses = await asyncio.gather(*(http.get("/models") for _ in range(max(1, connections))))
+    for resp in responses:
+        resp.raise_for_status()
+    return f"{len(responses)} connections to {OPENAI_BASE_URL}"
+
+def limits_stats() -> Dict:
+    return scheduler.stats()
+
+# kind ("next_question", "followup") -> token usage reported by the API
+_usage: Dict[str, Dict[str, int]] = {}
+
+def _record_usage(kind: str, usage: Dict):
+    if not usage:
+        return
+    cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+    counts = _usage.setdefault(kind, {"calls": 0, "prompt_tokens": 0, "cached_prompt_tokens": 0, "completion_tokens": 0})
+    counts["calls"] += 1
+    counts["prompt_tokens"] += usage.get("prompt_tokens", 0)
+    counts["cached_prompt_tokens"] += cached
+    counts["completion_tokens"] += usage.get("completion_tokens", 0)
+    telemetry.LLM_TOKENS.inc(kind, "prompt", amount=usage.get("prompt_tokens", 0))
+    telemetry.LLM_TOKENS.inc(kind, "cached_prompt", amount=cached)
+    telemetry.LLM_TOKENS.inc(kind, "completion", amount=usage.get("completion_tokens", 0))
+
+def usage_stats() -> Dict:
+    return {
+        kind: dict(counts, avg_prompt_tokens=round(counts["prompt_tokens"] / counts["calls"], 1))
+        for kind, counts in _usage.items()
+    }
+
+def _estimate_tokens(messages: List[Dict], max_tokens: int) -> int:
+    """Rough token cost of a chat call for the tokens-per-minute bucket (~4 chars per token)."""
+    return sum(len(m.get("content") or "") for m in messages) // 4 + max_tokens
+
+async def _chat(messages: List[Dict], temperature: float, max_tokens: int = 200, model: str = CHAT_MODEL, kind: str = "chat") -> Tuple[str, Dict]:
+    """Return (reply text, token usage)."""
+    payload = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+    }
+    http = get_http()
+    resp = await scheduler.get(model).call(
+        lambda: http.send(http.build_request("POST", "/chat/completions", json=payload), stream=True),
+        cost=_estimate_tokens(messages, max_tokens),
+    )
+    body = resp.json()
+    usage = body.get("usage") or {}
+    _record_usage(kind, usage)
+    return body["choices"][0]["message"]["content"].strip(), usage
+
+async def _chat_stream(messages: List[Dict], temperature: float, max_tokens: int = 200, model: str = CHAT_MODEL, usage: Optional[Dict] = None) -> AsyncIterator[str]:
+    """Yield content deltas from a streamed chat completion (server-sent events).
+    Token usage from the final chunk is copied into `usage` when given.
+    """
+    request = {
+        "model": model,
+        "messages": messages,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
+        "stream": True,
+        "stream_options": {"include_usage": True},
+    }
+    http = get_http()
+    # the scheduler slot is held until the stream is fully read
+    async with scheduler.get(model).stream(
+        lambda: http.send(http.build_request("POST", "/chat/completions", json=request), stream=True),
+        cost=_estimate_tokens(messages, max_tokens),
+    ) as resp:
+        async for line in resp.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            payload = line[5:].strip()
+            if payload == "[DONE]":
+                break
+            try:
+                chunk = json.loads(payload)
+            except ValueError:
+                continue
+            if chunk.get("usage") and usage is not None:
+                usage.update(chunk["usage"])
+            choices = chunk.get("choices") or []
+            delta = choices[0].get("delta", {}).get("content") if choices else None
+            if delta:
+                yield delta
+
+class _JsonStringField:
+    """Incrementally decode one string field (e.g. next_question) out of a JSON
+    object that is still arriving token by token.
+    """
+
+    _ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+    def __init__(self, field: str):
+        self._start = re.compile(r'"%s"\s*:\s*"' % re.escape(field))
+        self._buf = ""
+        self._pos = -1  # index of the next undecoded char inside the value, -1 = not found yet
+        self.closed = False
+
+    def feed(self, chunk: str) -> str:
+        self._buf += chunk
+        if self.closed:
+            return ""
+        if self._pos < 0:
+            m = self._start.search(self._buf)
+            if not m:
+                return ""
+            self._pos = m.end()
+        out = []
+        buf, i = self._buf, self._pos
+        while i < len(buf):
+            ch = buf[i]
+            if ch == '"':
+                self.closed = True
+                i += 1
+                break
+            if ch == "\\":
+                if i + 1 >= len(buf):
+                    break  # wait for the rest of the escape
+                esc = buf[i + 1]
+                if esc == "u":
+                    if i + 6 > len(buf):
+                        break
+                    try:
+                        code = int(buf[i + 2:i + 6], 16)
+                    except ValueError:
+                        i += 6
+                        continue
+                    if 0xD800 <= code < 0xDC00:
+                        # high half of a surrogate pair (emoji etc.): join it with the low half
+                        low = buf[i + 6:i + 12]
+                        if len(low) < 6 and "\\u".startswith(low[:2]):
+                            break  # wait for the second escape
+                        if low.startswith("\\u"):
+                            try:
+                                low_code = int(low[2:], 16)
+                            except ValueError:
+                                low_code = 0
+                            if 0xDC00 <= low_code < 0xE000:
+                                out.append(chr(0x10000 + ((code - 0xD800) << 10) + (low_code - 0xDC00)))
+                                i += 12
+                                continue
+                    out.append(chr(code))
+                    i += 6
+                    continue
+                out.append(self._ESCAPES.get(esc, esc))
+                i += 2
+                continue
+            out.append(ch)
+            i += 1
+        self._pos = i
+        return "".join(out)
+
+    @property
+    def text(self) -> str:
+        return self._buf
+
+async def _stream_reply(messages: List[Dict], temperature: float, cache_token: Optional[str] = None, kind: str = "chat") -> AsyncIterator[Tuple[str, Any]]:
+    field = _JsonStringField("next_question")
+    usage: Dict = {}
+    async for delta in _chat_stream(messages, temperature, usage=usage):
+        decoded = field.feed(delta)
+        if decoded:
+            yield "delta", decoded
+    _record_usage(kind, usage)
+    yield "result", _finish_reply(field.text.strip(), usage, cache_token)
+
+async def _replay(reply: Dict) -> AsyncIterator[Tuple[str, Any]]:
+    """Stream events for a reply we already have (cache hit)."""
+    if reply.get("next_question"):
+        yield "delta", reply["next_question"]
+    yield "result", reply
+
+def _finish_reply(text: str, usage: Dict, cache_token: Optional[str]) -> Dict:
+    """Parse the reply and cache it if it was valid JSON."""
+    parsed = _try_parse_json(text)
+    if parsed is None:
+        return _parse_json_reply(text)
+    if cache_token is not None:
+        llm_cache.store(cache_token, parsed, usage)
+    return parsed
+
+def _try_parse_json(text: str) -> Optional[Dict]:
+    try:
+        parsed = json.loads(text)
+        return parsed if isinstance(parsed, dict) else None
+    except Exception:
+        # As a fallback, try to extract JSON-like content
+        # naive approach: find first { and last }
+        start = text.find("{")
+        end = text.rfind("}")
+        if start != -1 and end != -1:
+            try:
+                return json.loads(text[start:end+1])
+            except Exception:
+                pass
+    return None
+
+def _parse_json_reply(text: str) -> Dict:
+    """Parse the model's JSON reply, tolerating surrounding prose."""
+    parsed = _try_parse_json(text)
+    if parsed is not None:
+        return parsed
+    # fallback default
+    return {"next_question": None, "done": True}
+
+async def transcribe_audio(file: BinaryIO, filename: str) -> str:
+    """Transcribe an in-memory/spooled audio file object using OpenAI Whisper (whisper-1).
+    filename only supplies the extension Whisper uses to detect the format.
+    """
+    http = get_http()
+
+    def _send():
+        file.seek(0)  # a retry re-reads the upload from the start
+        return http.send(http.build_request(
+            "POST",
+            "/audio/transcriptions",
+            data={"model": TRANSCRIBE_MODEL},
+            files={"file": (filename, file, "application/octet-stream")},
+        ), stream=True)
+
+    resp = await scheduler.get(TRANSCRIBE_MODEL).call(_send)
+    return resp.json().get("text", "")
 
 async def transcribe_audio_file(file_path: str) -> str:
-    """Transcribe an audio file using OpenAI Whisper (whisper-1). Returns the transcribed text."""
-    def _transcribe():
-        # Uses the OpenAI python client sync method
-        with open(file_path, "rb") as f:
-            # model name may change; use "whisper-1" or the model you have access to
-            resp = openai.Audio.transcribe("whisper-1", f)
-            return resp.get("text", "")
+    """Transcribe an audio file on disk using OpenAI Whisper (whisper-1). Returns the transcribed text."""
+    with open(file_path, "rb") as f:
+        return await transcribe_audio(f, os.path.basename(file_path))
 
-    return await asyncio.to_thread(_transcribe)
+def _next_question_messages(prev_qas: List[Dict]) -> List[Dict]:
+    messages = prompts.next_question_messages(prev_qas)
+    # sampled (LLM_PROMPT_LOG_RATE) so full prompts stay out of the hot path
+    telemetry.log_prompt("next_question", messages[0]["content"], messages[1]["content"])
+    return messages
 
-async def generate_next_question(prev_qas: List[Dict], domain_questions: List[str] | None = None) -> Dict:
+async def generate_next_question(prev_qas: List[Dict], domain_questions: List[str] | None = None, bypass_cache: bool = False) -> Dict:
     """Ask the model to return the next question in JSON: {next_question: str|null, done: bool}
 
     prev_qas: list of {question,answer,timestamp}
     domain_questions: optional list of seed questions to prefer
+    bypass_cache: skip the response cache lookup (the fresh reply is still stored)
     """
-    # Sanitize prev_qas: convert datetime objects to ISO strings for JSON serialization
-    sanitized_qas = []
-    for qa in prev_qas:
-        sanitized_qa = {
-            "question": qa.get("question", ""),
-            "answer": qa.get("answer", ""),
-        }
-        # Convert timestamp to ISO string if present
-        if "timestamp" in qa and hasattr(qa["timestamp"], "isoformat"):
-            sanitized_qa["timestamp"] = qa["timestamp"].isoformat()
-        sanitized_qas.append(sanitized_qa)
-    
-    system_prompt = (
-        "You are a medical pre-screening assistant. Your goal is to determine which medical specialty "
-        "the patient needs (dentistry or cardiac) as QUICKLY as possible.\n\n"
-        "Instructions:\n"
-        "1. Listen to the patient's answer about their symptoms.\n"
-        "2. If you can CONFIDENTLY determine the form type from their answer, END THE SESSION IMMEDIATELY.\n"
-        "3. If you are UNSURE, ask ONE follow-up question to clarify.\n"
-        "4. Dental-related symptoms (tooth pain, mouth, gums, braces, fillings, sensitivity, etc.) → form_type='dentistry'.\n"
-        "5. Cardiac-related symptoms (chest pain, heart, shortness of breath, palpitations, etc.) → form_type='cardiac'.\n"
-        "6. Be brief and friendly.\n\n"
-        "Return ONLY a JSON object with keys: \"next_question\" (string or null), \"done\" (boolean), and \"form_type\" (string or null).\n"
-        "- form_type: \"dentistry\", \"cardiac\", or null\n"
-        "- next_question: null only when done=true\n"
-        "- done: true when you have determined the form_type with confidence"
-    )
+    cached, token = await llm_cache.lookup("next", prev_qas, bypass=bypass_cache)
+    if cached is not None:
+        return cached
+    text, usage = await _chat(_next_question_messages(prev_qas), temperature=0.2, kind="next_question")
+    return _finish_reply(text, usage, token)
 
-    # Construct a short context with conversation history
-    context = {
-        "total_questions_asked": len(sanitized_qas),
-        "recent_exchanges": sanitized_qas[-4:],  # last 4 exchanges only
-    }
+async def stream_next_question(prev_qas: List[Dict], domain_questions: List[str] | None = None, bypass_cache: bool = False) -> AsyncIterator[Tuple[str, Any]]:
+    """Streaming variant of generate_next_question.
 
-    user_prompt = (
-        "Based on the patient's responses below, decide whether you can confidently determine the form type:\n\n"
-        f"Context: {json.dumps(context, ensure_ascii=False)}\n\n"
-        "DECISION RULES:\n"
-        "- If the patient's answer clearly indicates DENTAL symptoms → form_type='dentistry', done=true (END IMMEDIATELY)\n"
-        "- If the patient's answer clearly indicates CARDIAC symptoms → form_type='cardiac', done=true (END IMMEDIATELY)\n"
-        "- If you are UNSURE after any number of questions → Ask ONE clarifying follow-up question, done=false\n"
-        "- After asking at least one follow-up, if still unclear → Make your best judgment, set done=true with a form_type\n\n"
-        "Dental keywords: tooth, teeth, mouth, gums, dental work, sensitivity, bite pain, filling, crown, extraction\n"
-        "Cardiac keywords: chest, heart, breathless, palpitations, dizzy, fainting, arrhythmia\n\n"
-        "Respond with ONLY valid JSON: {\"next_question\": \"your question\" OR null, \"done\": true OR false, \"form_type\": \"dentistry\" OR \"cardiac\" OR null}"
-    )
-
-    # Log what is being sent to the LLM
-    print("[LLM INPUT] System prompt:\n", system_prompt)
-    print("[LLM INPUT] User prompt:\n", user_prompt)
-    print("[LLM INPUT] Context:", json.dumps(context, ensure_ascii=False))
-
-    def _call():
-        completion = openai.ChatCompletion.create(
-            model="gpt-4o-mini", # fallback, replace with an available model if needed
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            temperature=0.2,
-            max_tokens=200,
-        )
-        text = completion.choices[0].message.content.strip()
-        # Try to parse JSON from the response
-        try:
-            parsed = json.loads(text)
-            return parsed
-        except Exception:
-            # As a fallback, try to extract JSON-like content
-            # naive approach: find first { and last }
-            start = text.find("{")
-            end = text.rfind("}")
-            if start != -1 and end != -1:
-                try:
-                    return json.loads(text[start:end+1])
-                except Exception:
-                    pass
-        # fallback default
-        return {"next_question": None, "done": True}
+    Yields ("delta", text) as next_question characters arrive, then ("result", parsed_dict).
+    """
+    cached, token = await llm_cache.lookup("next", prev_qas, bypass=bypass_cache)
+    events = _replay(cached) if cached is not None else _stream_reply(_next_question_messages(prev_qas), 0.2, token, "next_question")
+    async for event in events:
+        yield event
 
-    return await asyncio.to_thread(_call)
+def _followup_messages(prev_qas: List[Dict], form_fields: List[Tuple[str, str]], max_questions: int = 5) -> List[Dict]:
+    messages = prompts.followup_messages(prev_qas, form_fields, max_questions)
+    telemetry.log_prompt("followup", messages[0]["content"], messages[1]["content"])
+    return messages
 
-async def generate_followup_question(prev_qas: List[Dict], form_data: Dict, max_questions: int = 5) -> Dict:
+async def generate_followup_question(prev_qas: List[Dict], form_data: Dict, max_questions: int = 5, bypass_cache: bool = False) -> Dict:
     """Ask the model to return a relevant follow-up question in JSON: {next_question: str|null, done: bool}
 
     prev_qas: list of {question,answer,timestamp} from both purpose visit and follow-up
     form_data: dict of written form answers
     max_questions: maximum number of follow-up questions to ask
     """
-    # Sanitize prev_qas: convert datetime objects to ISO strings for JSON serialization
-    sanitized_qas = []
-    for qa in prev_qas:
-        sanitized_qa = {
-            "question": qa.get("question", ""),
-            "answer": qa.get("answer", ""),
-        }
-        if "timestamp" in qa and hasattr(qa["timestamp"], "isoformat"):
-            sanitized_qa["timestamp"] = qa["timestamp"].isoformat()
-        sanitized_qas.append(sanitized_qa)
-
     # Only ask up to max_questions follow-ups
-    followup_count = len(sanitized_qas)
-    if followup_count >= max_questions:
-        return {"next_question": None, "done": True}
-
-    system_prompt = (
-        "You are a medical assistant helping a clinician gather additional relevant information from a patient. "
-        "You have access to the patient's initial visit purpose conversation and their written form responses. "
-        "Your goal is to ask up to 5 additional, highly relevant follow-up questions to clarify or expand on their situation. "
-        "Do NOT try to determine the form type or end the session early. "
-        "Do NOT ask about information already clearly answered. "
-        "Ask one clear, specific, and contextually relevant question at a time. "
-        "When you have asked 5 follow-ups, or there is nothing more useful to ask, set done=true."
-    )
-
-    context = {
-        "total_questions_asked": followup_count,
-        "recent_exchanges": sanitized_qas[-4:],
-        "form_data": form_data,
-    }
-
-    user_prompt = (
-        "Here is the patient's context for follow-up questions.\n\n"
-        f"Context: {json.dumps(context, ensure_ascii=False)}\n\n"
-        "Ask ONE additional, highly relevant follow-up question. "
-        "If there is nothing more useful to ask, set next_question to null and done to true.\n\n"
-        "Respond with ONLY valid JSON: {\"next_question\": \"your question\" OR null, \"done\": true OR false}"
-    )
-
-    print("[LLM INPUT] System prompt (followup):\n", system_prompt)
-    print("[LLM INPUT] User prompt (followup):\n", user_prompt)
-    print("[LLM INPUT] Context (followup):", json.dumps(context, ensure_ascii=False))
-
-    def _call():
-        completion = openai.ChatCompletion.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            temperature=0.3,
-            max_tokens=200,
-        )
-        text = completion.choices[0].message.content.strip()
-        try:
-            parsed = json.loads(text)
-            return parsed
-        except Exception:
-            start = text.find("{")
-            end = text.rfind("}")
-            if start != -1 and end != -1:
-                try:
-                    return json.loads(text[start:end+1])
-                except Exception:
-                    pass
+    if len(prev_qas) >= max_questions:
         return {"next_question": None, "done": True}
+    # keyed on the fields the model sees, so e.g. a new submittedAt still hits
+    form_fields = prompts.relevant_form_fields(form_data, prev_qas)
+    cached, token = await llm_cache.lookup("followup", prev_qas, {"form": form_fields, "max": max_questions}, bypass=bypass_cache)
+    if cached is not None:
+        return cached
+    text, usage = await _chat(_followup_messages(prev_qas, form_fields, max_questions), temperature=0.3, kind="followup")
+    return _finish_reply(text, usage, token)
 
-    return await asyncio.to_thread(_call)
+async def stream_followup_question(prev_qas: List[Dict], form_data: Dict, max_questions: int = 5, bypass_cache: bool = False) -> AsyncIterator[Tuple[str, Any]]:
+    """Streaming variant of generate_followup_question (same events as stream_next_question)."""
+    if len(prev_qas) >= max_questions:
+        yield "result", {"next_question": None, "done": True}
+        return
+    form_fields = prompts.relevant_form_fields(form_data, prev_qas)
+    cached, token = await llm_cache.lookup("followup", prev_qas, {"form": form_fields, "max": max_questions}, bypass=bypass_cache)
+    if cached is not None:
+        events = _replay(cached)
+    else:
+        events = _stream_reply(_followup_messages(prev_qas, form_fields, max_questions), 0.3, token, "followup")
+    async for event in events:
+        yield event
@@ -0,0 +1,170 @@
+import os
+import re
+import time
+import asyncio
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from .utils.timing import Timing
+from .telemetry import logger
+
+# Speculative next-question generation. As soon as provisional answer text is
+# known (a /transcribe result, POST /prefetch) the LLM call for the question that
+# would follow it starts in the background. When /answer then records the same
+# answer, it takes the speculation instead of starting its own call; a different
+# answer, a newer speculation or the TTL cancels it. One speculation per session.
+PREFETCH_ENABLED = os.getenv("PREFETCH_ENABLED", "1") == "1"
+PREFETCH_TTL = float(os.getenv("PREFETCH_TTL", "60"))
+PREFETCH_MAX_SESSIONS = int(os.getenv("PREFETCH_MAX_SESSIONS", "1024"))
+
+_WORD = re.compile(r"[a-z0-9']+")
+
+
+class _Speculation:
+    __slots__ = ("answer_key", "task", "started")
+
+    def __init__(self, answer_key: Tuple[str, str], task: asyncio.Task):
+        self.answer_key = answer_key
+        self.task = task
+        self.started = time.monotonic()
+
+
+_pending: "OrderedDict[str, _Speculation]" = OrderedDict()
+_counters = {
+    "started": 0,
+    "skipped": 0,  # nothing worth speculating (e.g. the local triage answers it)
+    "claims": 0,
+    "hits": 0,
+    "hits_in_flight": 0,  # hit, but the LLM call had not finished yet
+    "mismatched": 0,
+    "unused": 0,  # /answer was handled without the LLM (local triage)
+    "stale": 0,
+    "superseded": 0,
+    "expired": 0,
+    "evicted": 0,
+    "failed": 0,
+}
+_claim_wait = Timing()
+_head_start = Timing()
+
+
+def _normalize(text: Optional[str]) -> str:
+    return " ".join(_WORD.findall((text or "").lower()))
+
+
+def signature(qas: List[Dict]) -> Tuple:
+    """What the model saw: the Q/A texts, normalized (timestamps and case ignored)."""
+    return tuple((_normalize(qa.get("question")), _normalize(qa.get("answer"))) for qa in qas)
+
+
+def _cancel(spec: _Speculation, reason: str):
+    _counters[reason] += 1
+    if not spec.task.done():
+        spec.task.cancel()
+
+
+def _log_failure(task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning("speculative question failed: %s", task.exception())
+
+
+def _expire(now: float):
+    while _pending:
+        session_id, spec = next(iter(_pending.items()))
+        if now - spec.started < PREFETCH_TTL:
+            break
+        del _pending[session_id]
+        _cancel(spec, "expired")
+
+
+def start(session_id: str, question: str, answer_text: str,
+          run: Callable[[], Awaitable[Tuple[Optional[List[Dict]], Optional[Dict]]]]) -> bool:
+    """Speculate on `answer_text` being the answer to `question`.
+
+    run() builds the LLM context and generates the reply, returning (qas the model
+    saw, reply), or (None, None) when there is nothing worth generating.
+    Replaces (and cancels) the session's previous speculation unless it was for the
+    same text.
+    """
+    if not PREFETCH_ENABLED or not answer_text or not session_id:
+        return False
+    now = time.monotonic()
+    _expire(now)
+    answer_key = (_normalize(question), _normalize(answer_text))
+    previous = _pending.get(session_id)
+    if previous is not None and previous.answer_key == answer_key and not previous.task.cancelled():
+        # same text again (e.g. successive partial transcripts): keep the running call
+        return True
+    if previous is not None:
+        del _pending[session_id]
+        _cancel(previous, "superseded")
+    while len(_pending) >= PREFETCH_MAX_SESSIONS:
+        _cancel(_pending.popitem(last=False)[1], "evicted")
+    task = asyncio.create_task(run())
+    task.add_done_callback(_log_failure)
+    _pending[session_id] = _Speculation(answer_key, task)
+    _counters["started"] += 1
+    return True
+
+
+def discard(session_id: str):
+    """Drop a session's speculation (the answer was handled without the LLM)."""
+    spec = _pending.pop(session_id, None)
+    if spec is not None:
+        _cancel(spec, "unused")
+
+
+async def claim(session_id: str, prev_qas: List[Dict]) -> Optional[Dict]:
+    """The speculated reply if it was generated for exactly this context, else None.
+
+    prev_qas is the context /answer would send (including the answer just recorded).
+    A matching speculation that is still running is awaited rather than repeated.
+    """
+    spec = _pending.pop(session_id, None)
+    if spec is None:
+        return None
+    _counters["claims"] += 1
+    last = prev_qas[-1] if prev_qas else {}
+    if spec.answer_key != (_normalize(last.get("question")), _normalize(last.get("answer"))):
+        _cancel(spec, "mismatched")
+        return None
+    if time.monotonic() - spec.started >= PREFETCH_TTL:
+        _cancel(spec, "expired")
+        return None
+    in_flight = not spec.task.done()
+    t0 = time.perf_counter()
+    try:
+        # shielded: if this request goes away the reply still lands in the LLM cache
+        qas, reply = await asyncio.shield(spec.task)
+    except asyncio.CancelledError:
+        if spec.task.cancelled():
+            _counters["failed"] += 1
+            return None
+        raise
+    except Exception:
+        _counters["failed"] += 1
+        return None
+    if reply is None:
+        _counters["skipped"] += 1
+        return None
+    if qas is None or signature(qas) != signature(prev_qas):
+        # another answer landed in between; the reply was for an older context
+        _counters["stale"] += 1
+        return None
+    _claim_wait.add(time.perf_counter() - t0)
+    _head_start.add(time.monotonic() - spec.started)
+    _counters["hits"] += 1
+    if in_flight:
+        _counters["hits_in_flight"] += 1
+    return dict(reply)
+
+
+def stats() -> Dict:
+    return dict(
+        _counters,
+        enabled=PREFETCH_ENABLED,
+        pending=len(_pending),
+        hit_rate=round(_counters["hits"] / _counters["claims"], 3) if _counters["claims"] else None,
+        claim_wait=_claim_wait.stats(),
+        head_start=_head_start.stats(),
+    )
@@ -0,0 +1,127 @@
+import os
+import re
+from typing import Dict, List, Tuple
+
+# Prompt builders for the next-question and follow-up calls. Everything static
+# (role, rules, keywords, output format) lives in the system message, which is
+# byte-identical on every call so provider-side prompt caching can reuse it; the
+# per-session context goes last, in a compact line format without timestamps.
+PROMPT_MAX_EXCHANGES = int(os.getenv("PROMPT_MAX_EXCHANGES", "4"))
+PROMPT_ANSWER_MAX_CHARS = int(os.getenv("PROMPT_ANSWER_MAX_CHARS", "400"))
+# follow-ups: at most this many questionnaire fields, most relevant first
+PROMPT_FORM_MAX_FIELDS = int(os.getenv("PROMPT_FORM_MAX_FIELDS", "12"))
+PROMPT_FORM_VALUE_MAX_CHARS = int(os.getenv("PROMPT_FORM_VALUE_MAX_CHARS", "160"))
+
+NEXT_QUESTION_SYSTEM = (
+    "You are a medical pre-screening assistant. Decide which specialty the patient needs "
+    "(dentistry or cardiac) as QUICKLY as possible.\n\n"
+    "Rules:\n"
+    "- Answer clearly DENTAL (tooth, teeth, mouth, gums, dental work, sensitivity, bite pain, filling, crown, extraction) "
+    "-> form_type=\"dentistry\", done=true.\n"
+    "- Answer clearly CARDIAC (chest, heart, breathless, palpitations, dizzy, fainting, arrhythmia) "
+    "-> form_type=\"cardiac\", done=true.\n"
+    "- UNSURE -> ask ONE brief, friendly clarifying question, done=false.\n"
+    "- Still unclear after a clarifying question -> make your best judgment, done=true with a form_type.\n\n"
+    "The user message lists the questions asked so far and the patient's answers (Q:/A: lines, oldest first).\n"
+    "Respond with ONLY valid JSON: "
+    "{\"next_question\": string or null, \"done\": boolean, \"form_type\": \"dentistry\" or \"cardiac\" or null}. "
+    "next_question is null only when done=true."
+)
+
+FOLLOWUP_SYSTEM = (
+    "You are a medical assistant helping a clinician gather additional relevant information from a patient "
+    "before their visit. You see the patient's answers so far and the relevant parts of their written "
+    "questionnaire.\n\n"
+    "Rules:\n"
+    "- Ask ONE clear, specific follow-up question at a time that clarifies or expands on their situation.\n"
+    "- Do NOT ask about anything already clearly answered, in the conversation or the questionnaire.\n"
+    "- Do NOT try to determine the form type or end early.\n"
+    "- When the follow-up limit is reached, or there is nothing more useful to ask, set next_question to null and done to true.\n\n"
+    "The user message gives the number of questions asked and the limit, the questionnaire (field: value lines) and the "
+    "conversation (Q:/A: lines, oldest first).\n"
+    "Respond with ONLY valid JSON: {\"next_question\": string or null, \"done\": boolean}."
+)
+
+# questionnaire fields that say nothing about the patient's condition (routing,
+# bookkeeping, contact details); compared after lower-casing and dropping separators
+_IRRELEVANT_FIELDS = {
+    "id", "userid", "sessionid", "type", "formtype", "clinic", "appointmentdate", "appointmenttime",
+    "submittedat", "createdat", "updatedat", "timestamp", "name", "fullname", "firstname", "lastname",
+    "email", "phone", "phonenumber", "address", "dateofbirth", "dob", "password", "confirmpassword",
+}
+_NEGATIVE_VALUES = {"no", "none", "n/a", "na", "never", "false", "nil"}
+_ISO_DATETIME = re.compile(r"^\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}")
+_WORD = re.compile(r"[a-z]+")
+_CAMEL = re.compile(r"(?<=[a-z])(?=[A-Z])")
+
+
+def _clip(text, limit: int) -> str:
+    text = " ".join(str(text).split())
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def compact_exchanges(prev_qas: List[Dict]) -> str:
+    """The most recent Q/A pairs as Q:/A: lines (no timestamps or ids)."""
+    lines = []
+    for qa in prev_qas[-PROMPT_MAX_EXCHANGES:]:
+        lines.append("Q: " + _clip(qa.get("question") or "", PROMPT_ANSWER_MAX_CHARS))
+        lines.append("A: " + _clip(qa.get("answer") or "", PROMPT_ANSWER_MAX_CHARS))
+    return "\n".join(lines)
+
+
+def _form_value(value) -> str:
+    if isinstance(value, dict):
+        value = ", ".join(f"{k}={v}" for k, v in value.items() if v not in (None, "", [], {}))
+    elif isinstance(value, (list, tuple)):
+        value = ", ".join(str(v) for v in value if v not in (None, ""))
+    elif isinstance(value, bool):
+        value = "yes" if value else "no"
+    return _clip(value, PROMPT_FORM_VALUE_MAX_CHARS)
+
+
+def relevant_form_fields(form_data: Dict, prev_qas: List[Dict]) -> List[Tuple[str, str]]:
+    """(field, value) pairs worth showing the model, capped at PROMPT_FORM_MAX_FIELDS.
+
+    Empty values, timestamps and bookkeeping/contact fields are dropped. If more fields
+    remain than the cap, positive answers and fields that share words with the recent
+    conversation are kept first; the result stays in questionnaire order.
+    """
+    if not isinstance(form_data, dict):
+        return []
+    talked_about = set()
+    for qa in prev_qas[-PROMPT_MAX_EXCHANGES:]:
+        talked_about.update(_WORD.findall(f"{qa.get('question') or ''} {qa.get('answer') or ''}".lower()))
+    candidates = []
+    for position, (key, raw) in enumerate(form_data.items()):
+        if raw in (None, "", [], {}) or re.sub(r"[^a-z]", "", str(key).lower()) in _IRRELEVANT_FIELDS:
+            continue
+        value = _form_value(raw)
+        if not value or _ISO_DATETIME.match(value):
+            continue
+        words = set(_WORD.findall(_CAMEL.sub(" ", str(key)).lower())) | set(_WORD.findall(value.lower()))
+        score = (0 if value.lower() in _NEGATIVE_VALUES else 2) + len(words & talked_about)
+        candidates.append((score, position, str(key), value))
+    kept = sorted(candidates, key=lambda c: (-c[0], c[1]))[:PROMPT_FORM_MAX_FIELDS]
+    return [(key, value) for _, _, key, value in sorted(kept, key=lambda c: c[1])]
+
+
+def next_question_messages(prev_qas: List[Dict]) -> List[Dict]:
+    user_prompt = f"Questions asked: {len(prev_qas)}\n{compact_exchanges(prev_qas)}"
+    return [
+        {"role": "system", "content": NEXT_QUESTION_SYSTEM},
+        {"role": "user", "content": user_prompt},
+    ]
+
+
+def followup_messages(prev_qas: List[Dict], form_fields: List[Tuple[str, str]], max_questions: int = 5) -> List[Dict]:
+    """form_fields: output of relevant_form_fields()."""
+    form = "\n".join(f"{key}: {value}" for key, value in form_fields) or "(none)"
+    user_prompt = (
+        f"Questions asked: {len(prev_qas)} of {max_questions}\n"
+        f"Questionnaire:\n{form}\n"
+        f"Conversation:\n{compact_exchanges(prev_qas)}"
+    )
+    return [
+        {"role": "system", "content": FOLLOWUP_SYSTEM},
+        {"role": "user", "content": user_prompt},
+    ]
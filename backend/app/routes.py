@@ -1,24 +1,43 @@
 import uuid
-import os
-import tempfile
-import shutil
 import time
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, UploadFile, File, Form, Header, HTTPException, Response, WebSocket
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from typing import Optional
+from contextlib import nullcontext
 import asyncio
 import json
 
 from .schemas import StartSessionRequest, StartSessionResponse, AnswerRequest, QAItem, NextQuestionResponse
-from .openai_client import transcribe_audio_file, generate_next_question
-from .utils.tts import text_to_speech_bytes
-from . import db
+from .openai_client import (
+    generate_next_question,
+    generate_followup_question,
+    stream_next_question,
+    stream_followup_question,
+    usage_stats as llm_usage_stats,
+)
+from .utils.audio_upload import AudioUploadRoute, ingest_audio
+from .utils.tts import text_to_speech_bytes, stream_speech, cache_stats as tts_cache_stats, pool_stats as tts_pool_stats
+from .utils.tts_pool import TTSQueueFull, TTSRenderError
+from .utils.timing import Timing
+from . import session_store
+from .session_store import get_store, QAS_CONTEXT_WINDOW
+from . import triage
+from . import followup_graph
+from . import llm_cache
+from . import idempotency
+from . import transcripts
+from . import stt
+from . import scheduler
+from . import prefetch
+from . import voice_ws
+from . import shared
+from . import telemetry
+from .telemetry import logger, span
 from datetime import datetime
 
 router = APIRouter()
-
-# In-memory session store (for demo; use MongoDB for production)
-_sessions = {}
+# endpoints taking an audio upload; included into `router` at the end of this module
+audio_routes = APIRouter(route_class=AudioUploadRoute)
 
 DEFAULT_QUESTIONS = [
     "What is the main reason for your visit today?",
@@ -27,11 +46,200 @@ DEFAULT_QUESTIONS = [
     "Have you experienced anything similar before?",
 ]
 
+# streaming endpoints: time to first question token vs. full LLM round trip
+_stream_timings = {"ttft": Timing(), "total": Timing()}
+
+async def _ingest(audio: Optional[UploadFile], route: str):
+    """Ingest an uploaded clip (size/type checked, spooled in memory, hashed)."""
+    if not audio:
+        return None
+    with span("upload", route):
+        return await ingest_audio(audio)
+
+async def _transcribe_clip(clip, route: str, stt_backend: Optional[str] = None) -> str:
+    """Transcribe a clip with the selected STT backend, reusing an earlier transcription of the same audio."""
+    try:
+        backend = stt.get_backend(stt_backend)
+    except KeyError as e:
+        raise HTTPException(status_code=400, detail=str(e.args[0]))
+
+    async def _whisper():
+        with span("stt", route):
+            return await backend.transcribe(clip.file, clip.filename)
+
+    try:
+        return await transcripts.transcribe(clip.sha256, _whisper)
+    except scheduler.SchedulerQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Transcription failed: {e}")
+
+async def _prefilled_text(text: Optional[str], audio: Optional[UploadFile], transcription_id: Optional[str]) -> Optional[str]:
+    """The answer text when no audio needs transcribing: typed text, or the result of an
+    earlier /transcribe call. Returns None when an audio upload should be transcribed."""
+    if audio:
+        return None
+    if text:
+        return text
+    if transcription_id:
+        cached = await transcripts.get(transcription_id)
+        if cached is None:
+            raise HTTPException(status_code=410, detail="transcription_id expired or unknown; upload the audio again")
+        return cached
+    raise HTTPException(status_code=400, detail="Provide either 'text', an 'audio' file or a 'transcription_id'")
+
+def _answer_key(route: str, client_key: Optional[str], session_id: str, question: str, text: Optional[str], clip) -> Optional[str]:
+    """Idempotency key for an answer submission: the client's key, else derived from
+    the session, the question and a hash of the audio (or the typed text)."""
+    answer_hash = clip.sha256 if clip else idempotency.content_hash(text)
+    return idempotency.request_key(route, client_key, session_id, question, answer_hash)
+
+def _mark_replayed(response: Response, replayed: bool):
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+
+async def _receive_answer(session_id: str, question: str, text: Optional[str], clip, route: str, stt_backend: Optional[str] = None):
+    """Transcribe (if audio) and record the answer; returns (answer_text, recent QAs)."""
+    answer_text = await _transcribe_clip(clip, route, stt_backend) if clip else text
+    with span("db", route):
+        prev_qas = await _record_answer(session_id, question, answer_text)
+    return answer_text, prev_qas
+
+def _prioritize(prev_qas: list):
+    """Queue this request's remaining LLM calls behind sessions already in progress
+    if it is a patient's first answer."""
+    scheduler.set_priority(scheduler.PRIORITY_NEW_SESSION if len(prev_qas) <= 1 else scheduler.PRIORITY_IN_SESSION)
+
+def _speculate(session_id: str, question: str, answer_text: str) -> bool:
+    """Start generating the question that would follow this (provisional) answer,
+    for /answer to pick up if the same answer is submitted (see app/prefetch.py)."""
+    async def _run():
+        recent = await get_store().recent_qas(session_id)
+        if recent is None:
+            return None, None
+        qas = (recent + [{"question": question, "answer": answer_text}])[-QAS_CONTEXT_WINDOW:]
+        if triage.would_fast_path(qas):
+            return qas, None
+        _prioritize(qas)
+        return qas, await generate_next_question(qas, DEFAULT_QUESTIONS)
+
+    return prefetch.start(session_id, question, answer_text, _run)
+
+async def _record_answer(session_id: str, question: str, answer_text: str) -> list:
+    """Append the Q/A to the session and return recent QAs for LLM context."""
+    qa_item = {"question": question, "answer": answer_text, "timestamp": datetime.utcnow()}
+
+    # push, increment qa_count and read back the recent QAs in one atomic update
+    # (the history entry is inserted concurrently: two writes, one round trip of latency)
+    doc = await get_store().append_qa(session_id, qa_item)
+    if doc is None:
+        raise HTTPException(status_code=404, detail="session not found")
+    return doc.get("qas", [])
+
+def _parse_domain_questions(domain_questions: Optional[str]) -> Optional[list]:
+    """Parse the optional JSON list of seed questions."""
+    if not domain_questions:
+        return None
+    try:
+        return json.loads(domain_questions)
+    except Exception as e:
+        logger.warning("Failed to parse domain_questions: %s", e)
+        return None
+
+def _parse_form_data(form_data: Optional[str]) -> dict:
+    if not form_data:
+        return {}
+    try:
+        return json.loads(form_data)
+    except Exception as e:
+        logger.warning("Failed to parse form_data: %s", e)
+        return {}
+
+def _fallback_next(prev_qas: list, domain_qs: Optional[list]) -> dict:
+    """Next question when the LLM call fails: walk the seed questions, then finish."""
+    questions = domain_qs or DEFAULT_QUESTIONS
+    count = len(prev_qas)
+    if count >= (len(questions) or 6):
+        return {"next_question": None, "done": True}
+    telemetry.event("llm_fallback_question")
+    return {"next_question": questions[count % len(questions)], "done": False}
+
+async def _persist_outcome(session_id: str, done: bool, form_type: Optional[str]):
+    """Store done/form_type decided by the LLM. Failures are non-fatal."""
+    update_payload = {}
+    if done:
+        update_payload["done"] = True
+    # if form_type identified earlier in conversation, persist it
+    if form_type:
+        update_payload["form_type"] = form_type
+    if not update_payload:
+        return
+    try:
+        # nothing in the response depends on this write: it is queued (app/write_behind.py),
+        # where failures are retried, and readers see it before it reaches the DB
+        await get_store().set_fields(session_id, update_payload, defer=True)
+    except Exception as e:
+        logger.warning("Failed to persist outcome for %s: %s", session_id, e)
+
+async def _single_result(reply: dict):
+    yield "result", reply
+
+async def _shadow_compared(verdict, events):
+    async for kind, payload in events:
+        if kind == "result":
+            triage.compare(verdict, payload)
+        yield kind, payload
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+async def _question_events(events, route: str, answer_text: str, on_result=None, fallback=None):
+    """Relay ("delta", text) events from the LLM stream, then one ("done", final) with
+    next_question/done/form_type plus ttft_ms and total_ms. A failed LLM call falls
+    back to fallback() (or done=true).
+    """
+    t_llm = time.time()
+    ttft = None
+    result = None
+    try:
+        async for kind, payload in events:
+            if kind == "delta":
+                if ttft is None:
+                    ttft = time.time() - t_llm
+                    _stream_timings["ttft"].add(ttft)
+                    telemetry.observe("llm_ttft", ttft, route)
+                yield "delta", payload
+            else:
+                result = payload
+    except Exception as e:
+        logger.warning("%s OpenAI streaming call failed: %s", route, e)
+        telemetry.event("llm_error")
+        result = fallback() if fallback else {"next_question": None, "done": True}
+        if result.get("next_question"):
+            yield "delta", result["next_question"]
+
+    total = time.time() - t_llm
+    _stream_timings["total"].add(total)
+    telemetry.observe("llm", total, route)
+    final = {
+        "next_question": result.get("next_question"),
+        "done": bool(result.get("done", False)),
+        "form_type": result.get("form_type"),
+        "user_answer": answer_text,
+        "ttft_ms": round(ttft * 1000, 1) if ttft is not None else None,
+        "total_ms": round(total * 1000, 1),
+    }
+    yield "done", final
+    if on_result:
+        await on_result(final)
+
+async def _sse_question_stream(events, route: str, answer_text: str, on_result=None, fallback=None):
+    """_question_events as Server-Sent Events: `question` events with text deltas, then `done`."""
+    async for kind, payload in _question_events(events, route, answer_text, on_result, fallback):
+        yield _sse("question", {"delta": payload}) if kind == "delta" else _sse("done", payload)
+
 @router.post("/start_session")
 async def start_session(payload: StartSessionRequest):
-    t_start = time.time()
-    print(f"[TIMER] /start_session called")
-    
     session_id = str(uuid.uuid4())
     domain_qs = payload.domain_questions or DEFAULT_QUESTIONS
     first_question = domain_qs[0]
@@ -46,208 +254,427 @@ async def start_session(payload: StartSessionRequest):
         "done": False,
     }
 
-    # persist to MongoDB for efficiency
-    try:
-        col = db.get_db()["sessions"]
-        await col.insert_one(doc)
-        print(f"[TIMER] /start_session DB insert ({time.time() - t_start:.2f}s)")
-    except Exception as e:
-        print(f"[TIMER] /start_session DB error, falling back to in-memory ({time.time() - t_start:.2f}s): {e}")
-        # fallback to in-memory store if DB unavailable
-        _sessions[session_id] = doc
-
-    print(f"[TIMER] /start_session completed ({time.time() - t_start:.2f}s)")
+    # persist via the session store (falls back to in-memory if the DB is unavailable)
+    with span("db", "/start_session"):
+        await get_store().create(doc)
     return StartSessionResponse(session_id=session_id, first_question=first_question)
 
-@router.post("/answer")
+@audio_routes.post("/answer")
 async def answer(
     session_id: str = Form(...),
     question: str = Form(...),
     text: Optional[str] = Form(None),
     audio: Optional[UploadFile] = File(None),
     domain_questions: Optional[str] = Form(None),
+    no_cache: bool = Form(False),
+    transcription_id: Optional[str] = Form(None),
+    stt_backend: Optional[str] = Form(None),
+    idempotency_key: Optional[str] = Form(None),
+    idempotency_header: Optional[str] = Header(None, alias="Idempotency-Key"),
+    response: Response = None,
 ):
     """Accept an answer either as text or as uploaded audio file. Saves Q/A and returns next question or done=true.
 
     domain_questions: optional JSON list string of seed questions (to override defaults)
+    Duplicate submissions (same Idempotency-Key, or same session/question/answer) share one result.
     """
-    t_start = time.time()
-    print(f"[TIMER] /answer started")
-    
-    if not text and not audio:
-        raise HTTPException(status_code=400, detail="Provide either 'text' or an 'audio' file")
-
-    answer_text = text
-    temp_file_path = None
-    if audio:
-        # save to temp file
-        suffix = os.path.splitext(audio.filename)[1] or '.wav'
-        fd, temp_file_path = tempfile.mkstemp(suffix=suffix)
-        with open(fd, 'wb') as f:
-            content = await audio.read()
-            f.write(content)
-        print(f"[TIMER] /answer audio file written ({time.time() - t_start:.2f}s)")
-        
-        # transcribe
-        try:
-            t_whisper = time.time()
-            answer_text = await transcribe_audio_file(temp_file_path)
-            print(f"[TIMER] /answer Whisper API ({time.time() - t_whisper:.2f}s)")
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Transcription failed: {e}")
-        finally:
-            try:
-                os.remove(temp_file_path)
-            except Exception:
-                pass
-
-    qa_item = {"question": question, "answer": answer_text, "timestamp": datetime.utcnow()}
+    text = await _prefilled_text(text, audio, transcription_id)
 
-    # Try to push to MongoDB and increment qa_count atomically for efficiency
-    try:
-        col = db.get_db()["sessions"]
-        update_result = await col.update_one(
-            {"session_id": session_id},
-            {"$push": {"qas": qa_item}, "$inc": {"qa_count": 1}}
+    clip = await _ingest(audio, "/answer")
+    with clip or nullcontext():
+        key = _answer_key("/answer", idempotency_header or idempotency_key, session_id, question, text, clip)
+        result, replayed = await idempotency.run(
+            key, lambda: _answer(session_id, question, text, clip, domain_questions, no_cache, stt_backend)
         )
-        if update_result.matched_count == 0:
-            raise HTTPException(status_code=404, detail="session not found")
-
-        # fetch recent QAs (limit to last 10) for LLM context
-        doc = await col.find_one({"session_id": session_id}, {"qas": {"$slice": -10}})
-        prev_qas = doc.get("qas", []) if doc else []
-    except HTTPException:
-        raise
-    except Exception:
-        # fallback to in-memory store
-        if session_id not in _sessions:
-            raise HTTPException(status_code=404, detail="session not found")
-        _sessions[session_id]["qas"].append(qa_item)
-        _sessions[session_id]["qa_count"] = _sessions[session_id].get("qa_count", 0) + 1
-        prev_qas = _sessions[session_id]["qas"]
-
-    print(f"[TIMER] /answer DB write ({time.time() - t_start:.2f}s)")
-
-    # parse domain_questions if provided
-    domain_qs = None
-    if domain_questions:
-        import json
-        try:
-            domain_qs = json.loads(domain_questions)
-            print(f"[DEBUG] Domain questions received: {domain_qs}")
-        except Exception as e:
-            print(f"[DEBUG] Failed to parse domain_questions: {e}")
-            domain_qs = None
+    _mark_replayed(response, replayed)
+    return result
 
-    # ask OpenAI for next question (use recent prev_qas for context)
-    try:
-        t_llm = time.time()
-        gen = await generate_next_question(prev_qas, domain_qs or DEFAULT_QUESTIONS)
-        print(f"[DEBUG] OpenAI response: {gen}")
-        print(f"[TIMER] /answer OpenAI LLM call ({time.time() - t_llm:.2f}s)")
-    except Exception as e:
-        print(f"[DEBUG] OpenAI call failed: {e}")
-        # fallback: if qa_count exceeds domain questions, mark done
-        count = len(prev_qas)
-        if count >= (len(domain_qs or DEFAULT_QUESTIONS) or 6):
-            return NextQuestionResponse(next_question=None, done=True)
-        nq = (domain_qs or DEFAULT_QUESTIONS)[count % len(domain_qs or DEFAULT_QUESTIONS)]
-        print(f"[DEBUG] Fallback question: {nq}")
-        return NextQuestionResponse(next_question=nq, done=False)
+async def _answer(session_id, question, text, clip, domain_questions, no_cache, stt_backend) -> dict:
+    answer_text, prev_qas = await _receive_answer(session_id, question, text, clip, "/answer", stt_backend)
+    _prioritize(prev_qas)
 
-    next_q = gen.get("next_question")
-    done = bool(gen.get("done", False))
-    form_type = gen.get("form_type")
+    domain_qs = _parse_domain_questions(domain_questions)
 
-    # if done, mark in DB
-    if done:
-        try:
-            col = db.get_db()["sessions"]
-            update_payload = {"done": True}
-            if form_type:
-                update_payload["form_type"] = form_type
-            await col.update_one({"session_id": session_id}, {"$set": update_payload})
-        except Exception:
-            pass
+    # local fast path: unambiguous answers skip the LLM entirely
+    verdict = triage.classify(prev_qas)
+    gen = triage.fast_path(verdict)
+    if gen is not None:
+        logger.debug("/answer triage fast path %s (%s)", verdict.form_type, verdict.confidence)
+        prefetch.discard(session_id)
     else:
-        # if form_type identified earlier in conversation, persist it
-        if form_type:
+        gen = await prefetch.claim(session_id, prev_qas)
+        if gen is None:
+            # ask OpenAI for next question (use recent prev_qas for context)
             try:
-                col = db.get_db()["sessions"]
-                await col.update_one({"session_id": session_id}, {"$set": {"form_type": form_type}})
-            except Exception:
-                pass
+                with span("llm", "/answer"):
+                    gen = await generate_next_question(prev_qas, domain_qs or DEFAULT_QUESTIONS, bypass_cache=no_cache)
+                logger.debug("OpenAI response: %s", gen)
+            except Exception as e:
+                logger.warning("OpenAI call failed: %s", e)
+                telemetry.event("llm_error")
+                return NextQuestionResponse(**_fallback_next(prev_qas, domain_qs)).dict()
+        triage.compare(verdict, gen)
 
-    print(f"[TIMER] /answer completed ({time.time() - t_start:.2f}s)")
+    next_q = gen.get("next_question")
+    done = bool(gen.get("done", False))
+    form_type = gen.get("form_type")
+    await _persist_outcome(session_id, done, form_type)
     return {"next_question": next_q, "done": done, "user_answer": answer_text, "form_type": form_type}
 
 
-@router.post("/transcribe")
-async def transcribe_endpoint(audio: UploadFile = File(...)):
+@audio_routes.post("/answer/stream")
+async def answer_stream(
+    session_id: str = Form(...),
+    question: str = Form(...),
+    text: Optional[str] = Form(None),
+    audio: Optional[UploadFile] = File(None),
+    domain_questions: Optional[str] = Form(None),
+    no_cache: bool = Form(False),
+    transcription_id: Optional[str] = Form(None),
+    stt_backend: Optional[str] = Form(None),
+    idempotency_key: Optional[str] = Form(None),
+    idempotency_header: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
+    """Same as /answer, but streams the next question as Server-Sent Events while
+    the LLM generates it (`question` deltas, then a final `done` event).
+    A duplicate submission is not recorded twice; its question replays from the LLM cache.
+    """
+    text = await _prefilled_text(text, audio, transcription_id)
+
+    clip = await _ingest(audio, "/answer/stream")
+    with clip or nullcontext():
+        key = _answer_key("/answer/stream", idempotency_header or idempotency_key, session_id, question, text, clip)
+        (answer_text, prev_qas), _ = await idempotency.run(
+            key, lambda: _receive_answer(session_id, question, text, clip, "/answer/stream", stt_backend)
+        )
+    _prioritize(prev_qas)
+    domain_qs = _parse_domain_questions(domain_questions)
+
+    async def _persist(final):
+        await _persist_outcome(session_id, final["done"], final["form_type"])
+
+    verdict = triage.classify(prev_qas)
+    fast = triage.fast_path(verdict)
+    if fast is not None:
+        prefetch.discard(session_id)
+        events = _single_result(fast)
+    else:
+        speculated = await prefetch.claim(session_id, prev_qas)
+        if speculated is not None:
+            events = _shadow_compared(verdict, _single_result(speculated))
+        else:
+            events = _shadow_compared(verdict, stream_next_question(prev_qas, domain_qs or DEFAULT_QUESTIONS, bypass_cache=no_cache))
+    return StreamingResponse(
+        _sse_question_stream(events, "/answer/stream", answer_text, _persist, lambda: _fallback_next(prev_qas, domain_qs)),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@audio_routes.post("/transcribe")
+async def transcribe_endpoint(
+    audio: UploadFile = File(...),
+    stt_backend: Optional[str] = Form(None),
+    session_id: Optional[str] = Form(None),
+    question: Optional[str] = Form(None),
+    idempotency_key: Optional[str] = Form(None),
+    idempotency_header: Optional[str] = Header(None, alias="Idempotency-Key"),
+    response: Response = None,
+):
     """Transcribe a single uploaded audio file and return the transcription.
     This is used by the frontend to immediately show editable text after recording.
+    Re-uploads of the same clip share one transcription; pass the returned
+    transcription_id to /answer instead of uploading the audio again.
+    With session_id and question, the next question is prefetched from the transcript
+    while the patient reviews it.
     """
-    t_start = time.time()
-    print(f"[TIMER] /transcribe started")
-    
     if not audio:
         raise HTTPException(status_code=400, detail="audio file required")
-    temp_file_path = None
-    try:
-        suffix = os.path.splitext(audio.filename)[1] or '.wav'
-        fd, temp_file_path = tempfile.mkstemp(suffix=suffix)
-        with open(fd, 'wb') as f:
-            content = await audio.read()
-            f.write(content)
-        
-        print(f"[TIMER] /transcribe file written ({time.time() - t_start:.2f}s)")
-        
-        # transcribe
+    with await _ingest(audio, "/transcribe") as clip:
+        key = idempotency.request_key("/transcribe", idempotency_header or idempotency_key, clip.sha256)
+        text, replayed = await idempotency.run(key, lambda: _transcribe_clip(clip, "/transcribe", stt_backend))
+    _mark_replayed(response, replayed)
+    if session_id and question:
+        _speculate(session_id, question, text)
+    return {"transcription": text, "transcription_id": clip.sha256}
+
+@router.post("/prefetch", status_code=202)
+async def prefetch_question(
+    session_id: str = Form(...),
+    question: str = Form(...),
+    text: Optional[str] = Form(None),
+    transcription_id: Optional[str] = Form(None),
+):
+    """Start generating the next question from provisional answer text (e.g. a partial
+    transcript). An /answer with the same text returns it without waiting for the LLM;
+    a different answer or a newer /prefetch for the session cancels it.
+    """
+    text = await _prefilled_text(text, None, transcription_id)
+    return {"prefetching": _speculate(session_id, question, text)}
+
+_WS_ROUTE = "/ws/session/{session_id}"
+
+@router.websocket(_WS_ROUTE)
+async def voice_session(websocket: WebSocket, session_id: str, stt_backend: Optional[str] = None,
+                        speak: bool = True, voice_rate: int = 150):
+    """One connection per session for the whole spoken interview (protocol in app/voice_ws.py).
+
+    Send {"type": "start", "question": ..., "format": "pcm16", "sample_rate": 16000},
+    then audio frames. At end of utterance (client "end" message, or trailing silence
+    for pcm16) the answer is transcribed, recorded, and the next question streams back
+    as `question` deltas and a `done` message, followed by its TTS audio as binary
+    frames. Partial transcripts are sent while the patient speaks and feed /prefetch.
+    """
+    async with voice_ws.VoiceConnection(websocket) as conn:
+        if await get_store().get(session_id) is None:
+            await conn.send({"type": "error", "status": 404, "detail": "session not found"})
+            await conn.close(voice_ws.CLOSE_NOT_FOUND, "session not found")
+            return
+        await conn.send({"type": "ready", "session_id": session_id})
+        state = {"question": None}
+        audio_format = ("pcm16", 16000)
+        utterance: Optional[voice_ws.Utterance] = None
+        partial: Optional[asyncio.Task] = None
+        partial_seq = 0
+        last_partial = 0.0
+        # answers waiting for their turn; one worker runs them in order, so the
+        # receive loop keeps serving pings and audio while a turn is running
+        turns: asyncio.Queue = asyncio.Queue(maxsize=voice_ws.WS_TURN_QUEUE)
+        turn_worker: Optional[asyncio.Task] = None
+
+        async def _partial(clip, seq: int):
+            with clip:
+                try:
+                    text = await _transcribe_clip(clip, _WS_ROUTE, stt_backend)
+                except HTTPException:
+                    return
+            if seq != partial_seq:
+                return  # a newer partial (more audio) was started meanwhile
+            voice_ws.count("partials")
+            await conn.send({"type": "partial", "text": text})
+            if state["question"]:
+                _speculate(session_id, state["question"], text)
+
+        async def _run_turns():
+            while True:
+                clip, text = await turns.get()
+                # one turn at a time; the next answer waits for the previous question
+                try:
+                    await _voice_turn(conn, session_id, state, clip, text, stt_backend, speak, voice_rate)
+                except Exception as e:
+                    logger.warning("voice turn failed for session %s: %r", session_id, e)
+                    await conn.send({"type": "error", "status": 500, "detail": "turn failed"})
+
+        async def _start_turn(clip=None, text=None):
+            nonlocal turn_worker, utterance
+            utterance = None
+            if not state["question"]:
+                await conn.send({"type": "error", "status": 400, "detail": "send a start message with the question first"})
+                return
+            try:
+                turns.put_nowait((clip, text))
+            except asyncio.QueueFull:
+                if clip is not None:
+                    clip.close()
+                await conn.send({"type": "error", "status": 429, "detail": "previous answers are still being processed"})
+                return
+            if turn_worker is None:
+                turn_worker = asyncio.create_task(_run_turns())
+
         try:
-            t_whisper = time.time()
-            text = await transcribe_audio_file(temp_file_path)
-            print(f"[TIMER] /transcribe Whisper API ({time.time() - t_whisper:.2f}s)")
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Transcription failed: {e}")
-        
-        print(f"[TIMER] /transcribe completed ({time.time() - t_start:.2f}s)")
-        return {"transcription": text}
-    finally:
+            while True:
+                try:
+                    message = await conn.receive()
+                except asyncio.TimeoutError:
+                    voice_ws.count("idle_timeouts")
+                    await conn.close(voice_ws.CLOSE_IDLE, "idle timeout")
+                    return
+                if message["type"] == "websocket.disconnect":
+                    return
+                if message.get("bytes") is not None:
+                    if utterance is None:
+                        utterance = voice_ws.Utterance(*audio_format)
+                    try:
+                        event = utterance.append(message["bytes"])
+                    except OverflowError as e:
+                        voice_ws.count("oversized")
+                        utterance = None
+                        await conn.send({"type": "error", "status": 413, "detail": str(e)})
+                        continue
+                    if event == "end":
+                        voice_ws.count("eou_silence")
+                        await _start_turn(clip=utterance.clip())
+                        continue
+                    now = time.monotonic()
+                    due = voice_ws.WS_PARTIAL_INTERVAL_MS and now - last_partial >= voice_ws.WS_PARTIAL_INTERVAL_MS / 1000
+                    idle = partial is None or partial.done()
+                    if not utterance.empty and (event == "pause" or (due and idle)):
+                        # transcribe what we have. After a pause the final clip hashes the same, so
+                        # it is a transcript cache hit (or joins this call while it is in flight)
+                        last_partial = now
+                        partial_seq += 1
+                        partial = asyncio.create_task(_partial(utterance.clip(), partial_seq))
+                    continue
+                try:
+                    data = json.loads(message.get("text") or "")
+                    kind = data.get("type")
+                except (ValueError, AttributeError):
+                    await conn.send({"type": "error", "status": 400, "detail": "expected a JSON object"})
+                    continue
+                if kind == "ping":
+                    await conn.send({"type": "pong"})
+                elif kind == "pong":
+                    pass
+                elif kind == "start":
+                    state["question"] = data.get("question") or state["question"]
+                    audio_format = (str(data.get("format") or "pcm16"), int(data.get("sample_rate") or 16000))
+                    utterance = voice_ws.Utterance(*audio_format)
+                    last_partial = time.monotonic()
+                elif kind == "end":
+                    if utterance is None or utterance.empty:
+                        await conn.send({"type": "error", "status": 400, "detail": "no audio received"})
+                        continue
+                    voice_ws.count("eou_client")
+                    await _start_turn(clip=utterance.clip())
+                elif kind == "text" and data.get("text"):
+                    await _start_turn(text=str(data["text"]))
+                else:
+                    await conn.send({"type": "error", "status": 400, "detail": f"unknown message type {kind!r}"})
+        finally:
+            for task in (partial, turn_worker):
+                if task is not None and not task.done():
+                    task.cancel()
+            while not turns.empty():
+                clip, _ = turns.get_nowait()
+                if clip is not None:
+                    clip.close()
+
+async def _voice_turn(conn, session_id: str, state: dict, clip, text: Optional[str], stt_backend: Optional[str],
+                      speak: bool, voice_rate: int):
+    """Transcribe, record, stream the next question and speak it, over the WebSocket."""
+    voice_ws.count("turns")
+    question = state["question"]
+    try:
+        if clip is not None:
+            with clip:
+                text = await _transcribe_clip(clip, _WS_ROUTE, stt_backend)
+            await conn.send({"type": "transcript", "text": text})
+        with span("db", _WS_ROUTE):
+            prev_qas = await _record_answer(session_id, question, text)
+    except HTTPException as e:
+        await conn.send({"type": "error", "status": e.status_code, "detail": e.detail})
+        return
+    _prioritize(prev_qas)
+
+    async def _persist(final):
+        await _persist_outcome(session_id, final["done"], final["form_type"])
+
+    verdict = triage.classify(prev_qas)
+    fast = triage.fast_path(verdict)
+    if fast is not None:
+        prefetch.discard(session_id)
+        events = _single_result(fast)
+    else:
+        speculated = await prefetch.claim(session_id, prev_qas)
+        events = _shadow_compared(
+            verdict, _single_result(speculated) if speculated is not None else stream_next_question(prev_qas, DEFAULT_QUESTIONS)
+        )
+    final = None
+    async for kind, payload in _question_events(events, _WS_ROUTE, text, _persist, lambda: _fallback_next(prev_qas, None)):
+        if kind == "delta":
+            await conn.send({"type": "question", "delta": payload})
+        else:
+            final = payload
+            await conn.send(dict(payload, type="done"))
+    if final["next_question"]:
+        state["question"] = final["next_question"]
+    if speak and final["next_question"]:
+        await conn.send({"type": "audio_start", "format": "wav"})
         try:
-            if temp_file_path and os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
-        except Exception:
-            pass
+            with span("tts", _WS_ROUTE):
+                async for chunk in stream_speech(final["next_question"], voice_rate):
+                    await conn.send(chunk)
+        except TTSQueueFull as e:
+            await conn.send({"type": "error", "status": 503, "detail": str(e)})
+        except TTSRenderError as e:
+            await conn.send({"type": "error", "status": 500, "detail": f"TTS failed: {e}"})
+        await conn.send({"type": "audio_end"})
 
 @router.get("/sessions/{session_id}")
 async def get_session(session_id: str):
-    # try DB first
-    try:
-        col = db.get_db()["sessions"]
-        doc = await col.find_one({"session_id": session_id})
-        if not doc:
-            raise HTTPException(status_code=404, detail="session not found")
-        # convert _id to string
-        if "_id" in doc:
-            doc["id"] = str(doc["_id"])
-            del doc["_id"]
-        return doc
-    except HTTPException:
-        raise
-    except Exception:
-        # fallback to in-memory
-        if session_id not in _sessions:
-            raise HTTPException(status_code=404, detail="session not found")
-        return _sessions[session_id]
+    doc = await get_store().get(session_id)
+    if not doc:
+        raise HTTPException(status_code=404, detail="session not found")
+    return doc
+
+@router.get("/sessions/{session_id}/history")
+async def get_session_history(session_id: str, offset: int = 0, limit: int = 50):
+    """Full Q/A history of a session (the session document only keeps a recent window)."""
+    if offset < 0 or not 1 <= limit <= 200:
+        raise HTTPException(status_code=400, detail="offset must be >= 0 and limit between 1 and 200")
+    items = await get_store().history(session_id, offset, limit)
+    if items is None:
+        raise HTTPException(status_code=404, detail="session not found")
+    return {
+        "session_id": session_id,
+        "items": items,
+        "offset": offset,
+        "limit": limit,
+        "next_offset": offset + len(items) if len(items) == limit else None,
+    }
 
 @router.get("/tts")
-async def tts(text: str):
+async def tts(text: str, voice_rate: int = 150, voice: Optional[str] = None, stream: bool = False):
+    """Return TTS audio. With stream=true the WAV is sent sentence by sentence as it renders."""
     if not text:
         raise HTTPException(status_code=400, detail="text query param required")
-    data = await text_to_speech_bytes(text)
+    try:
+        if stream:
+            chunks = stream_speech(text, voice_rate, voice)
+            # render the first segment before responding so errors still map to a status code
+            with span("tts_first_segment", "/tts"):
+                first = await chunks.__anext__()
+
+            async def _body():
+                yield first
+                async for chunk in chunks:
+                    yield chunk
+
+            return StreamingResponse(_body(), media_type="audio/wav")
+        with span("tts", "/tts"):
+            data = await text_to_speech_bytes(text, voice_rate, voice)
+    except TTSQueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+    except TTSRenderError as e:
+        raise HTTPException(status_code=500, detail=f"TTS failed: {e}")
     return StreamingResponse(iter([data]), media_type="audio/wav")
 
-@router.post("/followup_answer")
+@router.get("/stats")
+async def stats():
+    """Cache and worker counters for quick inspection."""
+    return {
+        "tts_cache": tts_cache_stats(),
+        "tts_pool": tts_pool_stats(),
+        "upstream": scheduler.stats(),
+        "prefetch": prefetch.stats(),
+        "ws": voice_ws.stats(),
+        "llm_tokens": llm_usage_stats(),
+        "session_db": session_store.stats(),
+        "triage": triage.stats(),
+        "followup_graph": followup_graph.stats(),
+        "llm_cache": llm_cache.stats(),
+        "idempotency": idempotency.stats(),
+        "transcripts": transcripts.stats(),
+        "stt": stt.stats(),
+        "shared": shared.stats(),
+        "answer_stream": {name: t.stats() for name, t in _stream_timings.items()},
+    }
+
+@router.get("/metrics")
+async def metrics():
+    """Per-stage latency histograms and counters in Prometheus text format."""
+    return PlainTextResponse(telemetry.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@audio_routes.post("/followup_answer")
 async def followup_answer(
     session_id: str = Form(...),
     question: str = Form(...),
@@ -255,82 +682,110 @@ async def followup_answer(
     audio: Optional[UploadFile] = File(None),
     form_data: Optional[str] = Form(None),
     max_questions: int = 5,
+    no_cache: bool = Form(False),
+    transcription_id: Optional[str] = Form(None),
+    stt_backend: Optional[str] = Form(None),
+    form_type: Optional[str] = Form(None),
+    idempotency_key: Optional[str] = Form(None),
+    idempotency_header: Optional[str] = Header(None, alias="Idempotency-Key"),
+    response: Response = None,
 ):
-    """Accept an answer for the Additional Details section, using both prior Q/A and form data."""
-    t_start = time.time()
-    print(f"[TIMER] /followup_answer started")
+    """Accept an answer for the Additional Details section, using both prior Q/A and form data.
+    form_type (dentistry / cardiac) is inferred from the form's fields when not given."""
+    text = await _prefilled_text(text, audio, transcription_id)
+    scheduler.set_priority(scheduler.PRIORITY_FOLLOWUP)
+
+    clip = await _ingest(audio, "/followup_answer")
+    with clip or nullcontext():
+        key = _answer_key("/followup_answer", idempotency_header or idempotency_key, session_id, question, text, clip)
+        result, replayed = await idempotency.run(
+            key, lambda: _followup_answer(session_id, question, text, clip, form_data, max_questions, no_cache,
+                                          stt_backend, form_type)
+        )
+    _mark_replayed(response, replayed)
+    return result
+
+async def _record_followup(session_id: str, prev_qas: list, form_type: Optional[str], form_data: dict, done: bool):
+    """Note the form type and form choices on a follow-up session, and when it ended:
+    what `python -m app.followup_graph build` learns from. Failures are non-fatal."""
+    fields = {}
+    if len(prev_qas) == 1:
+        fields["followup"] = {"form_type": form_type, "form": followup_graph.form_signature(form_type, form_data),
+                              "done": done}
+    elif done:
+        fields["followup.done"] = True
+    if not fields:
+        return
+    try:
+        # queued like the /answer outcome (see _persist_outcome)
+        await get_store().set_fields(session_id, fields, defer=True)
+    except Exception as e:
+        logger.warning("Failed to record follow-up outcome: %s", e)
 
-    if not text and not audio:
-        raise HTTPException(status_code=400, detail="Provide either 'text' or an 'audio' file")
+async def _followup_answer(session_id, question, text, clip, form_data, max_questions, no_cache, stt_backend,
+                           form_type=None) -> dict:
+    answer_text, prev_qas = await _receive_answer(session_id, question, text, clip, "/followup_answer", stt_backend)
 
-    answer_text = text
-    temp_file_path = None
-    if audio:
-        suffix = os.path.splitext(audio.filename)[1] or '.wav'
-        fd, temp_file_path = tempfile.mkstemp(suffix=suffix)
-        with open(fd, 'wb') as f:
-            content = await audio.read()
-            f.write(content)
-        print(f"[TIMER] /followup_answer audio file written ({time.time() - t_start:.2f}s)")
-        try:
-            t_whisper = time.time()
-            answer_text = await transcribe_audio_file(temp_file_path)
-            print(f"[TIMER] /followup_answer Whisper API ({time.time() - t_whisper:.2f}s)")
-        except Exception as e:
-            raise HTTPException(status_code=500, detail=f"Transcription failed: {e}")
-        finally:
-            try:
-                os.remove(temp_file_path)
-            except Exception:
-                pass
-
-    qa_item = {"question": question, "answer": answer_text, "timestamp": datetime.utcnow()}
+    form_data_dict = _parse_form_data(form_data)
+    form_type = form_type or followup_graph.infer_form_type(form_data_dict)
 
-    # Try to push to MongoDB and increment qa_count atomically for efficiency
-    try:
-        col = db.get_db()["sessions"]
-        update_result = await col.update_one(
-            {"session_id": session_id},
-            {"$push": {"qas": qa_item}, "$inc": {"qa_count": 1}}
-        )
-        if update_result.matched_count == 0:
-            raise HTTPException(status_code=404, detail="session not found")
-        doc = await col.find_one({"session_id": session_id}, {"qas": {"$slice": -10}})
-        prev_qas = doc.get("qas", []) if doc else []
-    except HTTPException:
-        raise
-    except Exception:
-        if session_id not in _sessions:
-            raise HTTPException(status_code=404, detail="session not found")
-        _sessions[session_id]["qas"].append(qa_item)
-        _sessions[session_id]["qa_count"] = _sessions[session_id].get("qa_count", 0) + 1
-        prev_qas = _sessions[session_id]["qas"]
-
-    print(f"[TIMER] /followup_answer DB write ({time.time() - t_start:.2f}s)")
-
-    # Parse form_data
-    form_data_dict = {}
-    if form_data:
+    # precomputed question graph first; the LLM only for conversations it doesn't cover
+    gen = followup_graph.walk(form_type, prev_qas, form_data_dict, max_questions)
+    if gen is None:
         try:
-            form_data_dict = json.loads(form_data)
-            print(f"[DEBUG] form_data received: {form_data_dict}")
+            with span("llm", "/followup_answer"):
+                gen = await generate_followup_question(prev_qas, form_data_dict, max_questions, bypass_cache=no_cache)
+            logger.debug("OpenAI followup response: %s", gen)
         except Exception as e:
-            print(f"[DEBUG] Failed to parse form_data: {e}")
-            form_data_dict = {}
-
-    # Call the followup LLM
-    try:
-        t_llm = time.time()
-        from .openai_client import generate_followup_question
-        gen = await generate_followup_question(prev_qas, form_data_dict, max_questions)
-        print(f"[DEBUG] OpenAI followup response: {gen}")
-        print(f"[TIMER] /followup_answer OpenAI LLM call ({time.time() - t_llm:.2f}s)")
-    except Exception as e:
-        print(f"[DEBUG] OpenAI followup call failed: {e}")
-        return {"next_question": None, "done": True}
+            logger.warning("OpenAI followup call failed: %s", e)
+            telemetry.event("llm_error")
+            return {"next_question": None, "done": True}
 
     next_q = gen.get("next_question")
     done = bool(gen.get("done", False))
-
-    print(f"[TIMER] /followup_answer completed ({time.time() - t_start:.2f}s)")
+    await _record_followup(session_id, prev_qas, form_type, form_data_dict, done)
     return {"next_question": next_q, "done": done, "user_answer": answer_text}
+
+@audio_routes.post("/followup_answer/stream")
+async def followup_answer_stream(
+    session_id: str = Form(...),
+    question: str = Form(...),
+    text: Optional[str] = Form(None),
+    audio: Optional[UploadFile] = File(None),
+    form_data: Optional[str] = Form(None),
+    max_questions: int = 5,
+    no_cache: bool = Form(False),
+    transcription_id: Optional[str] = Form(None),
+    stt_backend: Optional[str] = Form(None),
+    form_type: Optional[str] = Form(None),
+    idempotency_key: Optional[str] = Form(None),
+    idempotency_header: Optional[str] = Header(None, alias="Idempotency-Key"),
+):
+    """Streaming (SSE) variant of /followup_answer."""
+    text = await _prefilled_text(text, audio, transcription_id)
+    scheduler.set_priority(scheduler.PRIORITY_FOLLOWUP)
+
+    clip = await _ingest(audio, "/followup_answer/stream")
+    with clip or nullcontext():
+        key = _answer_key("/followup_answer/stream", idempotency_header or idempotency_key, session_id, question, text, clip)
+        (answer_text, prev_qas), _ = await idempotency.run(
+            key, lambda: _receive_answer(session_id, question, text, clip, "/followup_answer/stream", stt_backend)
+        )
+    form_data_dict = _parse_form_data(form_data)
+    form_type = form_type or followup_graph.infer_form_type(form_data_dict)
+
+    async def _record(final):
+        await _record_followup(session_id, prev_qas, form_type, form_data_dict, final["done"])
+
+    graph_reply = followup_graph.walk(form_type, prev_qas, form_data_dict, max_questions)
+    if graph_reply is not None:
+        events = _single_result(graph_reply)
+    else:
+        events = stream_followup_question(prev_qas, form_data_dict, max_questions, bypass_cache=no_cache)
+    return StreamingResponse(
+        _sse_question_stream(events, "/followup_answer/stream", answer_text, _record),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+router.include_router(audio_routes)
@@ -0,0 +1,351 @@
+import os
+import time
+import heapq
+import random
+import asyncio
+import itertools
+import contextvars
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, Optional
+
+import httpx
+
+from .utils.timing import Timing
+from . import shared
+from . import telemetry
+
+# Outbound scheduler for OpenAI calls. Each model gets a concurrency limit, optional
+# requests-per-minute and tokens-per-minute token buckets, and a bounded wait queue
+# ordered by priority: follow-ups first, then sessions already in progress, then
+# new sessions, then offline batch jobs (app/batch.py). 429/5xx responses and connection errors are retried with jittered
+# exponential backoff (a 429 also pauses the model for its Retry-After). Priority
+# travels with the request in a contextvar, so call sites don't pass it around.
+# With shared state (app/shared.py) the RPM/TPM buckets are kept in the shared
+# store, so the limits hold for all workers together; concurrency limits and
+# 429 pauses stay per worker.
+PRIORITY_FOLLOWUP = 0
+PRIORITY_IN_SESSION = 1
+PRIORITY_NEW_SESSION = 2
+PRIORITY_BATCH = 3
+_PRIORITY_NAMES = {PRIORITY_FOLLOWUP: "followup", PRIORITY_IN_SESSION: "in_session", PRIORITY_NEW_SESSION: "new_session",
+                   PRIORITY_BATCH: "batch"}
+
+
+def _per_model(name: str) -> Dict[str, int]:
+    """Parse "model=N,model2=M" from the environment."""
+    return {
+        model.strip(): int(limit)
+        for model, _, limit in (item.partition("=") for item in os.getenv(name, "").split(",") if "=" in item)
+    }
+
+
+# Concurrent in-flight requests per model, e.g. "gpt-4o-mini=32,whisper-1=8"
+OPENAI_DEFAULT_CONCURRENCY = int(os.getenv("OPENAI_DEFAULT_CONCURRENCY", "16"))
+OPENAI_MODEL_CONCURRENCY = _per_model("OPENAI_MODEL_CONCURRENCY")
+# Rate limits per model (0 = unlimited), e.g. OPENAI_MODEL_RPM="gpt-4o-mini=500,whisper-1=50"
+OPENAI_DEFAULT_RPM = int(os.getenv("OPENAI_DEFAULT_RPM", "0"))
+OPENAI_MODEL_RPM = _per_model("OPENAI_MODEL_RPM")
+OPENAI_DEFAULT_TPM = int(os.getenv("OPENAI_DEFAULT_TPM", "0"))
+OPENAI_MODEL_TPM = _per_model("OPENAI_MODEL_TPM")
+OPENAI_QUEUE_DEPTH = int(os.getenv("OPENAI_QUEUE_DEPTH", "256"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+OPENAI_BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", "0.5"))
+OPENAI_BACKOFF_MAX = float(os.getenv("OPENAI_BACKOFF_MAX", "8"))
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+# buckets hold this many seconds' worth of tokens, so short bursts go straight through
+_BURST_SECONDS = 10.0
+
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar("llm_priority", default=PRIORITY_IN_SESSION)
+
+
+class SchedulerQueueFull(Exception):
+    """Too many calls already waiting for this model (callers should shed load)."""
+
+
+def set_priority(priority: int):
+    """Set the priority of upstream calls made by the current request."""
+    _priority.set(priority)
+
+
+def current_priority() -> int:
+    return _priority.get()
+
+
+class TokenBucket:
+    def __init__(self, per_minute: int):
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * _BURST_SECONDS)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, cost: float, now: float) -> float:
+        """Seconds until `cost` tokens are available (0 if they are now)."""
+        self._refill(now)
+        cost = min(cost, self.capacity)
+        return 0.0 if self.tokens >= cost else (cost - self.tokens) / self.rate
+
+    def take(self, cost: float):
+        self.tokens -= min(cost, self.capacity)
+
+
+_SHARED_BUCKET = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local rate, capacity, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= cost then tokens = tokens - cost else wait = (cost - tokens) / rate end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+return tostring(wait)
+"""
+
+
+class SharedTokenBucket:
+    """TokenBucket whose budget lives in the shared store, drawn on by every worker.
+
+    Keeps the synchronous delay()/take() interface the dispatcher uses: when the
+    tokens for the next call haven't been granted yet, delay() starts an async
+    draw from the store and reports a short wait; `notify` re-runs the dispatcher
+    once the grant arrives. If the store is unreachable the bucket fails open.
+    """
+
+    def __init__(self, name: str, per_minute: int, notify: Callable[[], None]):
+        self.key = shared.key("bucket", name)
+        self.rate = per_minute / 60.0
+        self.capacity = max(1.0, self.rate * _BURST_SECONDS)
+        self.notify = notify
+        self.granted = 0.0
+        self._retry_at = 0.0
+        self._drawing: Optional[asyncio.Task] = None
+
+    def delay(self, cost: float, now: float) -> float:
+        cost = min(cost, self.capacity)
+        if self.granted >= cost:
+            return 0.0
+        if now < self._retry_at:
+            return self._retry_at - now
+        if self._drawing is None or self._drawing.done():
+            self._drawing = asyncio.get_running_loop().create_task(self._draw(cost - self.granted))
+        return 0.05  # re-checked sooner via notify() when the draw completes
+
+    async def _draw(self, cost: float):
+        try:
+            wait = float(await shared.get_redis().eval(_SHARED_BUCKET, 1, self.key, self.rate, self.capacity, cost))
+        except Exception as e:
+            shared.error("rate bucket", e)
+            wait = 0.0
+        if wait > 0:
+            self._retry_at = time.monotonic() + wait
+        else:
+            self.granted += cost
+        self.notify()
+
+    def take(self, cost: float):
+        self.granted -= min(cost, self.capacity)
+
+
+class ModelScheduler:
+    """Concurrency slots, rate buckets and a priority wait queue for one model."""
+
+    def __init__(self, model: str, concurrency: int, rpm: int = 0, tpm: int = 0, queue_depth: int = OPENAI_QUEUE_DEPTH):
+        self.model = model
+        self.concurrency = max(1, concurrency)
+        self.limits = {"rpm": rpm or None, "tpm": tpm or None}
+        self.rpm = self._bucket("rpm", rpm)
+        self.tpm = self._bucket("tpm", tpm)
+        self.queue_depth = queue_depth
+        self.in_flight = 0
+        self._waiters: list = []  # heap of (priority, seq, future, cost)
+        self._queued = 0
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._loop = None
+        self.waits = {name: Timing() for name in _PRIORITY_NAMES.values()}
+        self._counters = {"calls": 0, "retries": 0, "throttled": 0, "rejected": 0, "failed": 0, "max_queued": 0}
+
+    def _bucket(self, kind: str, per_minute: int):
+        if per_minute <= 0:
+            return None
+        if shared.enabled():
+            return SharedTokenBucket(f"{self.model}:{kind}", per_minute, lambda: self._dispatch())
+        return TokenBucket(per_minute)
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # state from another event loop (tests, restarts) can't be resumed
+            self._loop = loop
+            self._waiters = []
+            self._queued = 0
+            self.in_flight = 0
+            self._timer = None
+
+    async def acquire(self, priority: int, cost: float = 1):
+        self._bind_loop()
+        if self._queued >= self.queue_depth:
+            self._counters["rejected"] += 1
+            raise SchedulerQueueFull(f"{self.model}: {self._queued} calls already waiting")
+        t0 = time.perf_counter()
+        fut = self._loop.create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), fut, cost))
+        self._queued += 1
+        self._counters["max_queued"] = max(self._counters["max_queued"], self._queued)
+        self._dispatch()
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # granted just as the caller gave up: hand the slot on
+                self.release()
+            else:
+                self._queued -= 1
+            raise
+        waited = time.perf_counter() - t0
+        name = _PRIORITY_NAMES.get(priority, "in_session")
+        self.waits[name].add(waited)
+        telemetry.UPSTREAM_WAIT.observe(waited, self.model, name)
+
+    def release(self):
+        self.in_flight -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        while self._waiters and self.in_flight < self.concurrency:
+            priority, _, fut, cost = self._waiters[0]
+            if fut.done():
+                heapq.heappop(self._waiters)
+                continue
+            now = time.monotonic()
+            delay = max(
+                self._paused_until - now,
+                self.rpm.delay(1, now) if self.rpm else 0.0,
+                self.tpm.delay(cost, now) if self.tpm else 0.0,
+            )
+            if delay > 0:
+                self._arm(delay)
+                return
+            heapq.heappop(self._waiters)
+            self._queued -= 1
+            if self.rpm:
+                self.rpm.take(1)
+            if self.tpm:
+                self.tpm.take(cost)
+            self.in_flight += 1
+            fut.set_result(None)
+
+    def _arm(self, delay: float):
+        if self._timer is not None:
+            return
+        def _fire():
+            self._timer = None
+            self._dispatch()
+        self._timer = self._loop.call_later(delay, _fire)
+
+    def _backoff(self, attempt: int, resp: Optional[httpx.Response] = None) -> float:
+        delay = random.uniform(0, min(OPENAI_BACKOFF_MAX, OPENAI_BACKOFF_BASE * 2 ** attempt))
+        retry_after = resp.headers.get("retry-after") if resp is not None else None
+        if retry_after:
+            try:
+                delay = max(delay, float(retry_after) + random.uniform(0, OPENAI_BACKOFF_BASE))
+            except ValueError:
+                pass
+        return delay
+
+    @asynccontextmanager
+    async def stream(self, send: Callable[[], Awaitable[httpx.Response]], cost: float = 1, priority: Optional[int] = None):
+        """Run send() (which must return an unread, streamed response) in a slot and
+        yield the response; the slot is held until the body has been consumed.
+        Retryable failures are retried before anything is yielded."""
+        priority = current_priority() if priority is None else priority
+        for attempt in range(OPENAI_MAX_RETRIES + 1):
+            last = attempt == OPENAI_MAX_RETRIES
+            await self.acquire(priority, cost)
+            self._counters["calls"] += 1
+            retry_in = None
+            try:
+                try:
+                    resp = await send()
+                except httpx.TransportError:
+                    if last:
+                        self._counters["failed"] += 1
+                        raise
+                    retry_in = self._backoff(attempt)
+                else:
+                    if resp.status_code in RETRYABLE_STATUS and not last:
+                        retry_in = self._backoff(attempt, resp)
+                        telemetry.event(f"upstream_retry_{resp.status_code}")
+                        if resp.status_code == 429:
+                            # everyone waiting on this model backs off, not just this call
+                            self._counters["throttled"] += 1
+                            self._paused_until = max(self._paused_until, time.monotonic() + retry_in)
+                        await resp.aclose()
+                    elif resp.is_error:
+                        self._counters["failed"] += 1
+                        await resp.aread()
+                        await resp.aclose()
+                        resp.raise_for_status()
+                    else:
+                        try:
+                            yield resp
+                        finally:
+                            await resp.aclose()
+                        return
+            finally:
+                self.release()
+            self._counters["retries"] += 1
+            await asyncio.sleep(retry_in)
+
+    async def call(self, send: Callable[[], Awaitable[httpx.Response]], cost: float = 1, priority: Optional[int] = None) -> httpx.Response:
+        """Like stream(), but returns the fully read response."""
+        async with self.stream(send, cost, priority) as resp:
+            await resp.aread()
+            return resp
+
+    def stats(self) -> Dict:
+        return dict(
+            self._counters,
+            limit=self.concurrency,
+            in_flight=self.in_flight,
+            queued=self._queued,
+            **self.limits,
+            wait={name: t.stats() for name, t in self.waits.items()},
+        )
+
+
+_schedulers: Dict[str, ModelScheduler] = {}
+
+
+def get(model: str) -> ModelScheduler:
+    sched = _schedulers.get(model)
+    if sched is None:
+        sched = _schedulers[model] = ModelScheduler(
+            model,
+            OPENAI_MODEL_CONCURRENCY.get(model, OPENAI_DEFAULT_CONCURRENCY),
+            OPENAI_MODEL_RPM.get(model, OPENAI_DEFAULT_RPM),
+            OPENAI_MODEL_TPM.get(model, OPENAI_DEFAULT_TPM),
+        )
+    return sched
+
+
+def stats() -> Dict:
+    return {model: sched.stats() for model, sched in _schedulers.items()}
+
+
+telemetry.register_gauge(
+    "prescreener_upstream_queued", "Calls waiting for an upstream slot", ("model",),
+    lambda: {(model,): sched._queued for model, sched in _schedulers.items()},
+)
+telemetry.register_gauge(
+    "prescreener_upstream_in_flight", "Upstream calls in progress", ("model",),
+    lambda: {(model,): sched.in_flight for model, sched in _schedulers.items()},
+)
@@ -0,0 +1,639 @@
+import os
+import json
+import copy
+import asyncio
+import contextvars
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+
+from . import db
+from . import shared
+from . import write_behind
+from .utils.lru import LRUCache
+from .telemetry import logger
+
+# Session persistence behind one SessionStore interface:
+#
+#   MongoSessionStore   - production backend (sessions + session_events collections)
+#   MemorySessionStore  - in-process dicts with TTL expiry (demo / DB-down fallback)
+#   RedisSessionStore   - any Redis-compatible server, shared between workers
+#
+# get_store() wraps the configured backend in a read-through / write-through
+# CachedSessionStore, and the Mongo backend falls back to memory when the DB is
+# unreachable (the previous per-endpoint `except` behaviour).
+#
+# With several workers sharing sessions (shared.enabled()) anything one worker
+# keeps to itself would go stale on the others: the cache layer is turned off and
+# the fallback is the shared Redis store rather than process memory. The Mongo
+# backend's write-behind queue (app/write_behind.py) is per process too, so
+# set_fields(defer=True) writes synchronously there.
+#
+# The live session only keeps the last QAS_LIVE_WINDOW qas plus a small running
+# summary; every Q/A is also appended to a per-session history.
+QAS_CONTEXT_WINDOW = 10
+QAS_LIVE_WINDOW = max(QAS_CONTEXT_WINDOW, int(os.getenv("QAS_LIVE_WINDOW", "20")))
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "mongo").lower()  # mongo | memory | redis
+SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL", "redis://localhost:6379/0")
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(24 * 3600)))  # memory/redis expiry
+SESSION_MEMORY_MAX = int(os.getenv("SESSION_MEMORY_MAX", "10000"))
+SESSION_CACHE_ENABLED = os.getenv("SESSION_CACHE_ENABLED", "1") == "1"
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", "30"))
+SESSION_CACHE_MAX = int(os.getenv("SESSION_CACHE_MAX", "1024"))
+
+_round_trips: contextvars.ContextVar = contextvars.ContextVar("session_round_trips", default=None)
+_totals = {"requests": 0, "round_trips": 0}
+
+
+def _count_round_trip():
+    counter = _round_trips.get()
+    if counter is not None:
+        counter[0] += 1
+    _totals["round_trips"] += 1
+
+
+def _apply_fields(doc: Dict, fields: Dict):
+    """Apply a $set-style dict (dotted paths allowed) to a plain document."""
+    for path, value in fields.items():
+        target = doc
+        *parents, leaf = path.split(".")
+        for key in parents:
+            target = target.setdefault(key, {})
+        target[leaf] = value
+
+
+def _opening_summary(qa_item: Dict) -> Dict:
+    # the opening answer (reason for visit) goes into the running summary so it
+    # survives once it scrolls out of the capped window
+    return {"summary.opening": {"question": qa_item.get("question"), "answer": qa_item.get("answer")}}
+
+
+class SessionStore:
+    """Interface shared by all session backends."""
+
+    name = "base"
+
+    async def ensure_indexes(self):
+        pass
+
+    async def create(self, doc: Dict):
+        raise NotImplementedError
+
+    async def append_qa(self, session_id: str, qa_item: Dict, set_fields: Optional[Dict] = None) -> Optional[Dict]:
+        """Push a Q/A, bump qa_count and apply set_fields atomically.
+
+        Returns the session projected to the last QAS_CONTEXT_WINDOW qas (plus
+        qa_count/done/form_type), or None if the session doesn't exist.
+        """
+        raise NotImplementedError
+
+    async def set_fields(self, session_id: str, fields: Dict, defer: bool = False):
+        """$set fields on a session. defer=True allows the backend to write them
+        later (batched, or folded into the session's next append_qa) instead of
+        making the caller wait for a round trip.
+        """
+        raise NotImplementedError
+
+    async def get(self, session_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    async def history(self, session_id: str, offset: int = 0, limit: int = 50) -> Optional[List[Dict]]:
+        """One page of a session's full Q/A history, oldest first (None if unknown)."""
+        raise NotImplementedError
+
+    async def recent_qas(self, session_id: str) -> Optional[List[Dict]]:
+        """The LLM context window for a session, without writing anything."""
+        doc = await self.get(session_id)
+        return None if doc is None else doc.get("qas", [])[-QAS_CONTEXT_WINDOW:]
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def stats(self) -> Dict:
+        return {"backend": self.name}
+
+
+class MongoSessionStore(SessionStore):
+    """Appending a Q/A and reading back the recent tail is one atomic
+    find_one_and_update; deferred set_fields go through a write-behind queue,
+    batched into bulk_writes or folded into the session's next append (synchronous
+    when queue_writes=False, the default when workers share sessions).
+    """
+
+    name = "mongo"
+
+    def __init__(self, queue_writes: Optional[bool] = None):
+        if queue_writes is None:
+            queue_writes = write_behind.WRITE_BEHIND_ENABLED and not shared.enabled()
+        self._queue = write_behind.WriteBehindQueue(self._bulk_set) if queue_writes else None
+        self._totals = {"deferred_sets": 0, "folded_sets": 0, "event_errors": 0}
+
+    def _collection(self):
+        return db.get_db()["sessions"]
+
+    def _events(self):
+        return db.get_db()["session_events"]
+
+    async def ensure_indexes(self):
+        sessions = self._collection()
+        # session_id should be unique
+        await sessions.create_index([("session_id", 1)], unique=True)
+        # index created_at for range queries
+        await sessions.create_index([("created_at", 1)])
+        # history pages are read per session in answer order
+        await self._events().create_index([("session_id", 1), ("timestamp", 1), ("_id", 1)])
+
+    async def create(self, doc: Dict):
+        _count_round_trip()
+        # insert a copy: the driver adds _id to the dict it is given
+        await self._collection().insert_one(dict(doc))
+
+    async def _append_event(self, event: Dict):
+        # history is secondary to the live document; a failed append must not fail the answer
+        try:
+            _count_round_trip()
+            await self._events().insert_one(event)
+        except Exception as e:
+            self._totals["event_errors"] += 1
+            logger.warning("session_events append failed: %s", e)
+
+    async def _bulk_set(self, batch):
+        _count_round_trip()
+        ops = [UpdateOne({"session_id": session_id}, {"$set": fields}) for session_id, fields in batch]
+        # $set is idempotent: after a partial failure the whole batch is simply retried
+        await self._collection().bulk_write(ops, ordered=False)
+
+    async def append_qa(self, session_id: str, qa_item: Dict, set_fields: Optional[Dict] = None) -> Optional[Dict]:
+        pending = self._queue.pop(session_id) if self._queue is not None else None
+        update = {
+            "$push": {"qas": {"$each": [qa_item], "$slice": -QAS_LIVE_WINDOW}},
+            "$inc": {"qa_count": 1},
+        }
+        fields = write_behind.merge(dict(pending or {}), set_fields or {})
+        if fields:
+            update["$set"] = fields
+        event = dict(qa_item, session_id=session_id, _id=ObjectId())
+        try:
+            # the history append is a second write, sent concurrently with the live
+            # update: two round trips counted, one round trip of latency
+            _count_round_trip()
+            doc, _ = await asyncio.gather(
+                self._collection().find_one_and_update(
+                    {"session_id": session_id},
+                    update,
+                    projection={"_id": 0, "qas": {"$slice": -QAS_CONTEXT_WINDOW}, "qa_count": 1, "done": 1, "form_type": 1},
+                    return_document=ReturnDocument.AFTER,
+                ),
+                self._append_event(event),
+            )
+        except Exception:
+            if pending:
+                # keep the deferred fields for the next attempt
+                self._queue.restore(session_id, pending)
+            raise
+        if doc is None:
+            # unknown session: don't leave an orphaned history entry behind
+            _count_round_trip()
+            await self._events().delete_one({"_id": event["_id"]})
+            return None
+        if pending:
+            self._totals["folded_sets"] += 1
+        if doc.get("qa_count") == 1:
+            await self.set_fields(session_id, _opening_summary(qa_item), defer=True)
+        return doc
+
+    async def set_fields(self, session_id: str, fields: Dict, defer: bool = False):
+        if not fields:
+            return
+        if defer and self._queue is not None and await self._queue.put(session_id, fields):
+            self._totals["deferred_sets"] += 1
+            return
+        pending = self._queue.pop(session_id) if self._queue is not None else None
+        fields = write_behind.merge(dict(pending or {}), fields)
+        _count_round_trip()
+        try:
+            await self._collection().update_one({"session_id": session_id}, {"$set": fields})
+        except Exception:
+            if pending:
+                self._queue.restore(session_id, pending)
+            raise
+
+    async def get(self, session_id: str) -> Optional[Dict]:
+        _count_round_trip()
+        doc = await self._collection().find_one({"session_id": session_id})
+        if doc is None:
+            return None
+        # convert _id to string
+        if "_id" in doc:
+            doc["id"] = str(doc.pop("_id"))
+        pending = self._queue.peek(session_id) if self._queue is not None else None
+        if pending:
+            # reflect deferred fields so readers see the latest state
+            _apply_fields(doc, pending)
+        return doc
+
+    async def history(self, session_id: str, offset: int = 0, limit: int = 50) -> Optional[List[Dict]]:
+        _count_round_trip()
+        cursor = self._events().find({"session_id": session_id}, {"_id": 0, "session_id": 0})
+        cursor = cursor.sort([("timestamp", 1), ("_id", 1)]).skip(offset).limit(limit)
+        items = await cursor.to_list(length=limit)
+        if not items and offset == 0:
+            # an empty first page: tell a session without answers from an unknown one
+            _count_round_trip()
+            if await self._collection().count_documents({"session_id": session_id}, limit=1) == 0:
+                return None
+        return items
+
+    async def start(self):
+        if self._queue is not None:
+            await self._queue.start()
+
+    async def close(self):
+        if self._queue is not None:
+            await self._queue.close()
+
+    def stats(self) -> Dict:
+        return dict(self._totals, backend=self.name,
+                    write_behind=self._queue.stats() if self._queue is not None else None)
+
+
+class MemorySessionStore(SessionStore):
+    """Process-local sessions with TTL expiry and an entry cap."""
+
+    name = "memory"
+
+    def __init__(self, ttl: float = SESSION_TTL, max_items: int = SESSION_MEMORY_MAX):
+        self._docs = LRUCache(max_items=max_items, ttl=ttl)
+        self._history = LRUCache(max_items=max_items, ttl=ttl)
+
+    async def create(self, doc: Dict):
+        self._docs.set(doc["session_id"], copy.deepcopy(doc))
+        self._history.set(doc["session_id"], [])
+
+    async def append_qa(self, session_id: str, qa_item: Dict, set_fields: Optional[Dict] = None) -> Optional[Dict]:
+        doc = self._docs.get(session_id)
+        if doc is None:
+            return None
+        doc["qas"] = (doc.get("qas", []) + [qa_item])[-QAS_LIVE_WINDOW:]
+        doc["qa_count"] = doc.get("qa_count", 0) + 1
+        if doc["qa_count"] == 1:
+            _apply_fields(doc, _opening_summary(qa_item))
+        _apply_fields(doc, set_fields or {})
+        history = self._history.get(session_id)
+        if history is None:
+            history = []
+            self._history.set(session_id, history)
+        history.append(qa_item)
+        return {
+            "qas": copy.deepcopy(doc["qas"][-QAS_CONTEXT_WINDOW:]),
+            "qa_count": doc["qa_count"],
+            "done": doc.get("done"),
+            "form_type": doc.get("form_type"),
+        }
+
+    async def set_fields(self, session_id: str, fields: Dict, defer: bool = False):
+        doc = self._docs.get(session_id)
+        if doc is not None:
+            _apply_fields(doc, fields)
+
+    async def get(self, session_id: str) -> Optional[Dict]:
+        doc = self._docs.get(session_id)
+        return copy.deepcopy(doc) if doc is not None else None
+
+    async def history(self, session_id: str, offset: int = 0, limit: int = 50) -> Optional[List[Dict]]:
+        history = self._history.get(session_id)
+        if history is None:
+            return None
+        return copy.deepcopy(history[offset:offset + limit])
+
+    def stats(self) -> Dict:
+        return {"backend": self.name, "sessions": self._docs.stats()}
+
+
+# Atomic append for Redis: KEYS = doc hash, live qas list, history list.
+# ARGV = qa json, live window, context window, ttl, then field/value pairs to HSET.
+_REDIS_APPEND = """
+if redis.call('EXISTS', KEYS[1]) == 0 then return false end
+local count = redis.call('HINCRBY', KEYS[1], 'qa_count', 1)
+for i = 5, #ARGV, 2 do redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1]) end
+redis.call('RPUSH', KEYS[2], ARGV[1])
+redis.call('LTRIM', KEYS[2], -tonumber(ARGV[2]), -1)
+redis.call('RPUSH', KEYS[3], ARGV[1])
+for i = 1, 3 do redis.call('EXPIRE', KEYS[i], tonumber(ARGV[4])) end
+return {count, redis.call('HGET', KEYS[1], 'done') or '', redis.call('HGET', KEYS[1], 'form_type') or '',
+        redis.call('LRANGE', KEYS[2], -tonumber(ARGV[3]), -1)}
+"""
+
+
+def _dumps(value) -> str:
+    return json.dumps(value, default=lambda v: v.isoformat() if isinstance(v, datetime) else str(v))
+
+
+class RedisSessionStore(SessionStore):
+    """Sessions in any Redis-compatible server: a hash of JSON-encoded top-level
+    fields plus a capped live qas list and an uncapped history list.
+    Requires the optional `redis` package.
+    """
+
+    name = "redis"
+
+    def __init__(self, url: str = SESSION_REDIS_URL, ttl: int = SESSION_TTL, client=None):
+        if client is None:
+            import redis.asyncio as aioredis
+
+            client = aioredis.from_url(url)
+        self._redis = client
+        self._ttl = ttl
+        self._append = self._redis.register_script(_REDIS_APPEND)
+
+    @staticmethod
+    def _keys(session_id: str):
+        return f"session:{session_id}", f"session:{session_id}:qas", f"session:{session_id}:history"
+
+    async def create(self, doc: Dict):
+        key, qas_key, history_key = self._keys(doc["session_id"])
+        fields = {k: _dumps(v) for k, v in doc.items() if k not in ("qas", "_id")}
+        _count_round_trip()
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping=fields)
+            pipe.delete(qas_key, history_key)
+            pipe.expire(key, self._ttl)
+            await pipe.execute()
+
+    async def append_qa(self, session_id: str, qa_item: Dict, set_fields: Optional[Dict] = None) -> Optional[Dict]:
+        fields = dict(set_fields or {})
+        args = [_dumps(qa_item), QAS_LIVE_WINDOW, QAS_CONTEXT_WINDOW, self._ttl]
+        for name, value in fields.items():
+            if "." not in name:
+                args += [name, _dumps(value)]
+        _count_round_trip()
+        result = await self._append(keys=list(self._keys(session_id)), args=args)
+        if not result:
+            return None
+        count, done, form_type, qas = result
+        if int(count) == 1 or any("." in name for name in fields):
+            # nested fields need a read-modify-write of their top-level key
+            nested = dict(_opening_summary(qa_item)) if int(count) == 1 else {}
+            nested.update({k: v for k, v in fields.items() if "." in k})
+            await self._set_nested(session_id, nested)
+        return {
+            "qas": [json.loads(q) for q in qas],
+            "qa_count": int(count),
+            "done": json.loads(done) if done else None,
+            "form_type": json.loads(form_type) if form_type else None,
+        }
+
+    async def _set_nested(self, session_id: str, fields: Dict):
+        key = self._keys(session_id)[0]
+        tops = sorted({path.split(".")[0] for path in fields})
+        current = await self._redis.hmget(key, tops)
+        doc = {top: json.loads(raw) if raw else {} for top, raw in zip(tops, current)}
+        _apply_fields(doc, fields)
+        await self._redis.hset(key, mapping={top: _dumps(doc[top]) for top in tops})
+
+    async def set_fields(self, session_id: str, fields: Dict, defer: bool = False):
+        flat = {k: _dumps(v) for k, v in fields.items() if "." not in k}
+        nested = {k: v for k, v in fields.items() if "." in k}
+        _count_round_trip()
+        if flat:
+            await self._redis.hset(self._keys(session_id)[0], mapping=flat)
+        if nested:
+            await self._set_nested(session_id, nested)
+
+    async def get(self, session_id: str) -> Optional[Dict]:
+        key, qas_key, _ = self._keys(session_id)
+        _count_round_trip()
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.hgetall(key)
+            pipe.lrange(qas_key, 0, -1)
+            raw, qas = await pipe.execute()
+        if not raw:
+            return None
+        doc = {(k.decode() if isinstance(k, bytes) else k): json.loads(v) for k, v in raw.items()}
+        doc["qas"] = [json.loads(q) for q in qas]
+        return doc
+
+    async def history(self, session_id: str, offset: int = 0, limit: int = 50) -> Optional[List[Dict]]:
+        key, _, history_key = self._keys(session_id)
+        _count_round_trip()
+        async with self._redis.pipeline(transaction=False) as pipe:
+            pipe.exists(key)
+            pipe.lrange(history_key, offset, offset + limit - 1)
+            exists, items = await pipe.execute()
+        if not exists:
+            return None
+        return [json.loads(item) for item in items]
+
+    async def close(self):
+        await self._redis.aclose()
+
+
+class FallbackSessionStore(SessionStore):
+    """Use the primary backend, falling back to a secondary one when it errors
+    (e.g. Mongo unreachable -> in-memory sessions)."""
+
+    def __init__(self, primary: SessionStore, secondary: SessionStore):
+        self.primary = primary
+        self.secondary = secondary
+        self.name = f"{primary.name}+{secondary.name}"
+        self.fallbacks = 0
+        self._failing = False
+
+    async def _call(self, method: str, *args, **kwargs):
+        try:
+            result = await getattr(self.primary, method)(*args, **kwargs)
+        except Exception as e:
+            self.fallbacks += 1
+            # warn once per outage; every call fails over while the DB is down
+            log = logger.debug if self._failing else logger.warning
+            log("%s %s failed, using %s: %s", self.primary.name, method, self.secondary.name, e)
+            self._failing = True
+            return await getattr(self.secondary, method)(*args, **kwargs)
+        if self._failing:
+            self._failing = False
+            logger.info("%s is back after %d fallbacks", self.primary.name, self.fallbacks)
+        return result
+
+    async def ensure_indexes(self):
+        await self.primary.ensure_indexes()
+
+    async def create(self, doc):
+        return await self._call("create", doc)
+
+    async def append_qa(self, session_id, qa_item, set_fields=None):
+        return await self._call("append_qa", session_id, qa_item, set_fields)
+
+    async def set_fields(self, session_id, fields, defer=False):
+        # a deferred write "succeeds" into the primary's queue even while the primary
+        # is down, and would never reach the secondary serving the session meanwhile
+        return await self._call("set_fields", session_id, fields, defer and not self._failing)
+
+    async def get(self, session_id):
+        return await self._call("get", session_id)
+
+    async def history(self, session_id, offset=0, limit=50):
+        return await self._call("history", session_id, offset, limit)
+
+    async def start(self):
+        await self.primary.start()
+        await self.secondary.start()
+
+    async def close(self):
+        await self.primary.close()
+        await self.secondary.close()
+
+    def stats(self):
+        return {
+            "backend": self.name,
+            "fallbacks": self.fallbacks,
+            "primary": self.primary.stats(),
+            "secondary": self.secondary.stats(),
+        }
+
+
+class CachedSessionStore(SessionStore):
+    """Read-through LRU/TTL cache in front of a backend. Writes go to the backend
+    first and are then applied to the cached copy (write-through), so repeat
+    get/recent_qas calls in the same process skip the database.
+    """
+
+    def __init__(self, backend: SessionStore, ttl: float = SESSION_CACHE_TTL, max_items: int = SESSION_CACHE_MAX):
+        self.backend = backend
+        self.name = f"cached({backend.name})"
+        self._cache = LRUCache(max_items=max_items, ttl=ttl)
+
+    async def ensure_indexes(self):
+        await self.backend.ensure_indexes()
+
+    async def create(self, doc):
+        await self.backend.create(doc)
+        self._cache.set(doc["session_id"], copy.deepcopy(doc))
+
+    async def append_qa(self, session_id, qa_item, set_fields=None):
+        result = await self.backend.append_qa(session_id, qa_item, set_fields)
+        if result is None:
+            self._cache.pop(session_id)
+            return None
+        cached = self._cache.get(session_id)
+        if cached is not None:
+            cached["qas"] = (cached.get("qas", []) + [copy.deepcopy(qa_item)])[-QAS_LIVE_WINDOW:]
+            cached["qa_count"] = result.get("qa_count", cached.get("qa_count", 0) + 1)
+            if cached["qa_count"] == 1:
+                _apply_fields(cached, _opening_summary(qa_item))
+            _apply_fields(cached, set_fields or {})
+        return result
+
+    async def set_fields(self, session_id, fields, defer=False):
+        await self.backend.set_fields(session_id, fields, defer)
+        cached = self._cache.get(session_id)
+        if cached is not None:
+            _apply_fields(cached, fields)
+
+    async def get(self, session_id):
+        cached = self._cache.get(session_id)
+        if cached is not None:
+            return copy.deepcopy(cached)
+        doc = await self.backend.get(session_id)
+        if doc is not None:
+            self._cache.set(session_id, copy.deepcopy(doc))
+        return doc
+
+    async def recent_qas(self, session_id):
+        cached = self._cache.get(session_id)
+        if cached is not None:
+            return copy.deepcopy(cached.get("qas", [])[-QAS_CONTEXT_WINDOW:])
+        return await super().recent_qas(session_id)
+
+    async def history(self, session_id, offset=0, limit=50):
+        return await self.backend.history(session_id, offset, limit)
+
+    async def start(self):
+        await self.backend.start()
+
+    async def close(self):
+        await self.backend.close()
+
+    def stats(self):
+        return {"backend": self.name, "cache": self._cache.stats(), "inner": self.backend.stats()}
+
+
+def build_store(backend: str = SESSION_BACKEND, cache: bool = SESSION_CACHE_ENABLED) -> SessionStore:
+    if backend == "memory":
+        store: SessionStore = MemorySessionStore()
+    elif backend == "redis":
+        store = RedisSessionStore()
+    elif backend == "mongo" and shared.enabled():
+        store = FallbackSessionStore(MongoSessionStore(), RedisSessionStore(client=shared.get_redis()))
+    elif backend == "mongo":
+        # if the DB is unavailable, sessions fall back to process memory
+        store = FallbackSessionStore(MongoSessionStore(), MemorySessionStore())
+    else:
+        raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
+    if shared.enabled():
+        # other workers write the same sessions; a local cache would serve stale reads
+        cache = False
+    return CachedSessionStore(store) if cache else store
+
+
+_store: Optional[SessionStore] = None
+
+
+def get_store() -> SessionStore:
+    global _store
+    if _store is None:
+        _store = build_store()
+    return _store
+
+
+def set_store(store: Optional[SessionStore]):
+    """Swap the active store (e.g. for local stand-ins); None rebuilds from config."""
+    global _store
+    _store = store
+
+
+def round_trips() -> int:
+    """Session store round trips made so far by the current request."""
+    counter = _round_trips.get()
+    return counter[0] if counter is not None else 0
+
+
+def stats() -> Dict:
+    requests = _totals["requests"]
+    return dict(
+        _totals,
+        avg_round_trips=round(_totals["round_trips"] / requests, 3) if requests else 0.0,
+        store=get_store().stats(),
+    )
+
+
+class RoundTripMiddleware:
+    """Count session store round trips per request and report them in X-DB-Round-Trips."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        counter = [0]
+        token = _round_trips.set(counter)
+
+        async def _send(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-round-trips", str(counter[0]).encode()))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            _round_trips.reset(token)
+            if counter[0]:
+                _totals["requests"] += 1
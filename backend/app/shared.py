@@ -0,0 +1,122 @@
+import os
+import json
+import base64
+import asyncio
+from datetime import datetime
+from typing import Any, Dict, Optional, Set
+
+from .telemetry import logger
+
+# State shared between workers. With SHARED_STATE_URL (any Redis-compatible server)
+# set, transcription ids, idempotency records, the LLM response cache and the
+# OpenAI rate-limit buckets live there, so N uvicorn workers or N containers can
+# serve any request of any session (no sticky sessions). Unset, all of that stays
+# in process memory, which is only correct for a single worker.
+#
+# Values are JSON with datetimes and bytes tagged, never pickle. A Redis error is
+# logged and counted and the caller falls back to its local behaviour (a miss).
+SHARED_STATE_URL = os.getenv("SHARED_STATE_URL", "")
+SHARED_STATE_PREFIX = os.getenv("SHARED_STATE_PREFIX", "prescreen:")
+
+_client = None
+_client_pid: Optional[int] = None
+_background: Set[asyncio.Task] = set()
+_counters = {"gets": 0, "hits": 0, "sets": 0, "errors": 0}
+
+
+def enabled() -> bool:
+    return bool(SHARED_STATE_URL) or _client is not None
+
+
+def get_redis():
+    """The redis.asyncio client for this process (recreated after a fork)."""
+    global _client, _client_pid
+    if _client is None or (_client_pid is not None and _client_pid != os.getpid()):
+        import redis.asyncio as aioredis
+
+        _client = aioredis.from_url(SHARED_STATE_URL)
+        _client_pid = os.getpid()
+    return _client
+
+
+def set_redis(client):
+    """Use an existing client (e.g. fakeredis); None goes back to SHARED_STATE_URL."""
+    global _client, _client_pid
+    _client, _client_pid = client, None
+
+
+def key(*parts: str) -> str:
+    return SHARED_STATE_PREFIX + ":".join(parts)
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return {"$date": value.isoformat()}
+    if isinstance(value, (bytes, bytearray)):
+        return {"$bytes": base64.b64encode(bytes(value)).decode("ascii")}
+    return str(value)
+
+
+def _hook(obj: Dict):
+    if len(obj) == 1:
+        if "$date" in obj:
+            return datetime.fromisoformat(obj["$date"])
+        if "$bytes" in obj:
+            return base64.b64decode(obj["$bytes"])
+    return obj
+
+
+def dumps(value: Any) -> str:
+    return json.dumps(value, default=_default, ensure_ascii=False)
+
+
+def loads(raw) -> Any:
+    return json.loads(raw, object_hook=_hook)
+
+
+def error(what: str, e: Exception):
+    _counters["errors"] += 1
+    logger.warning("shared state %s failed: %r", what, e)
+
+
+async def fetch(name: str) -> Any:
+    """The value stored under `name`, or None (also on errors)."""
+    _counters["gets"] += 1
+    try:
+        raw = await get_redis().get(key(name))
+    except Exception as e:
+        error("fetch", e)
+        return None
+    if raw is None:
+        return None
+    _counters["hits"] += 1
+    return loads(raw)
+
+
+async def store(name: str, value: Any, ttl: Optional[float] = None, nx: bool = False) -> Optional[bool]:
+    """Store a value (ttl in seconds). With nx=True only if absent. Returns whether it
+    was set, or None when the store is unreachable."""
+    _counters["sets"] += 1
+    try:
+        return bool(await get_redis().set(key(name), dumps(value), px=int(ttl * 1000) if ttl else None, nx=nx))
+    except Exception as e:
+        error("store", e)
+        return None
+
+
+async def delete(name: str):
+    try:
+        await get_redis().delete(key(name))
+    except Exception as e:
+        error("delete", e)
+
+
+def store_later(name: str, value: Any, ttl: Optional[float] = None):
+    """Fire-and-forget set, for writes the caller shouldn't wait on (cache fills)."""
+    task = asyncio.get_running_loop().create_task(store(name, value, ttl))
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+def stats() -> Dict:
+    return dict(_counters, enabled=enabled(), pid=os.getpid())
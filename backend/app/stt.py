@@ -0,0 +1,350 @@
+import os
+import io
+import time
+import wave
+import asyncio
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import BinaryIO, Callable, Dict, List, NamedTuple, Optional, Set
+
+from .utils.timing import Timing
+from .telemetry import logger
+
+# Speech-to-text backends. "remote" is the OpenAI transcription API; "local" runs a
+# quantized Whisper model (faster-whisper / CTranslate2, int8 on CPU) in a process
+# pool, batching clips that queue up while the workers are busy. A comma-separated
+# chain such as "local,remote" tries each backend in order. STT_BACKEND picks the
+# deployment default; requests can override it with the `stt_backend` form field.
+STT_BACKEND = os.getenv("STT_BACKEND", "remote")
+STT_LOCAL_MODEL = os.getenv("STT_LOCAL_MODEL", "base.en")
+STT_LOCAL_COMPUTE_TYPE = os.getenv("STT_LOCAL_COMPUTE_TYPE", "int8")
+STT_LOCAL_WORKERS = int(os.getenv("STT_LOCAL_WORKERS", "1"))
+STT_LOCAL_THREADS = int(os.getenv("STT_LOCAL_THREADS", "4"))
+STT_BATCH_SIZE = int(os.getenv("STT_BATCH_SIZE", "4"))
+STT_BATCH_WINDOW_MS = float(os.getenv("STT_BATCH_WINDOW_MS", "20"))
+STT_QUEUE_DEPTH = int(os.getenv("STT_QUEUE_DEPTH", "32"))
+
+
+class STTUnavailable(Exception):
+    """The backend can't take this clip (not installed, queue full); try the next one."""
+
+
+class Transcription(NamedTuple):
+    text: str
+    audio_seconds: Optional[float]
+    elapsed: float
+
+
+def _wav_seconds(file: BinaryIO) -> Optional[float]:
+    """Clip duration when it is a plain WAV (other containers need a decoder)."""
+    try:
+        file.seek(0)
+        with wave.open(file) as w:
+            return w.getnframes() / float(w.getframerate())
+    except Exception:
+        return None
+
+
+class STTBackend:
+    """Base class: subclasses implement _transcribe(file, filename) -> Transcription.
+    The file is the (possibly disk-spooled) upload, rewound to the start."""
+
+    name = "base"
+
+    def __init__(self):
+        self.timing = Timing()
+        self._counters = {"requests": 0, "errors": 0, "audio_seconds": 0.0, "processing_seconds": 0.0}
+
+    async def transcribe(self, file: BinaryIO, filename: str) -> str:
+        file.seek(0)
+        self._counters["requests"] += 1
+        t0 = time.perf_counter()
+        try:
+            result = await self._transcribe(file, filename)
+        except Exception:
+            self._counters["errors"] += 1
+            raise
+        # end-to-end latency includes queueing; rtf below uses model time only
+        self.timing.add(time.perf_counter() - t0)
+        if result.audio_seconds:
+            self._counters["audio_seconds"] += result.audio_seconds
+            self._counters["processing_seconds"] += result.elapsed
+        return result.text
+
+    async def _transcribe(self, file: BinaryIO, filename: str) -> Transcription:
+        raise NotImplementedError
+
+    async def warm(self):
+        """Load whatever the first request would otherwise wait for (warm-up phase)."""
+
+    async def close(self):
+        pass
+
+    def stats(self) -> Dict:
+        audio = self._counters["audio_seconds"]
+        return dict(
+            self._counters,
+            # real-time factor: processing time per second of audio (< 1 is faster than real time)
+            rtf=round(self._counters["processing_seconds"] / audio, 4) if audio else None,
+            latency=self.timing.stats(),
+        )
+
+
+class RemoteBackend(STTBackend):
+    """OpenAI transcription API (network round trip, billed per minute)."""
+
+    name = "remote"
+
+    async def _transcribe(self, file: BinaryIO, filename: str) -> Transcription:
+        from .openai_client import transcribe_audio
+
+        t0 = time.perf_counter()
+        # the upload is streamed from its spooled file, never copied into memory here
+        text = await transcribe_audio(file, filename)
+        elapsed = time.perf_counter() - t0
+        return Transcription(text, await asyncio.to_thread(_wav_seconds, file), elapsed)
+
+
+# --- local worker process ---------------------------------------------------------
+
+_worker_model = None
+
+
+def _init_worker(model_name: str, compute_type: str, cpu_threads: int):
+    """Load the model once per worker process."""
+    global _worker_model
+    from faster_whisper import WhisperModel
+
+    _worker_model = WhisperModel(model_name, device="cpu", compute_type=compute_type, cpu_threads=cpu_threads)
+
+
+def _noop():
+    return None
+
+
+def _transcribe_batch(clips: List[bytes]) -> List[tuple]:
+    """Transcribe a batch in one job; per-clip failures are returned, not raised."""
+    out = []
+    for data in clips:
+        t0 = time.perf_counter()
+        try:
+            segments, info = _worker_model.transcribe(io.BytesIO(data), beam_size=1, vad_filter=True)
+            text = " ".join(seg.text.strip() for seg in segments).strip()
+            out.append(("ok", text, info.duration, time.perf_counter() - t0))
+        except Exception as e:
+            out.append(("error", repr(e), None, time.perf_counter() - t0))
+    return out
+
+
+class LocalWhisperBackend(STTBackend):
+    """Quantized Whisper on CPU in a process pool. Clips that arrive while every
+    worker is busy are collected (up to STT_BATCH_SIZE) and sent as one job."""
+
+    name = "local"
+
+    def __init__(self, model_name: str = STT_LOCAL_MODEL, workers: int = STT_LOCAL_WORKERS):
+        super().__init__()
+        self.model_name = model_name
+        self.workers = max(1, workers)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._loop = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._collector: Optional[asyncio.Task] = None
+        # running batches; the loop only keeps weak references to tasks
+        self._batches: Set[asyncio.Task] = set()
+        self._counters.update(batches=0, batched_clips=0, queue_full=0, pool_restarts=0)
+
+    @staticmethod
+    def available() -> bool:
+        import importlib.util
+
+        return importlib.util.find_spec("faster_whisper") is not None
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=mp.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.model_name, STT_LOCAL_COMPUTE_TYPE, STT_LOCAL_THREADS),
+            )
+        return self._pool
+
+    def _ensure_collector(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._collector is None or self._collector.done():
+            self._loop = loop
+            self._queue = asyncio.Queue(maxsize=STT_QUEUE_DEPTH)
+            self._slots = asyncio.Semaphore(self.workers)
+            self._collector = loop.create_task(self._collect())
+
+    async def _transcribe(self, file: BinaryIO, filename: str) -> Transcription:
+        if not self.available():
+            raise STTUnavailable("faster-whisper is not installed")
+        # the worker processes need the clip itself: read it only on this path
+        data = await asyncio.to_thread(file.read)
+        self._ensure_collector()
+        fut = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((data, fut))
+        except asyncio.QueueFull:
+            self._counters["queue_full"] += 1
+            raise STTUnavailable("local transcription queue is full")
+        return await fut
+
+    async def _collect(self):
+        window = STT_BATCH_WINDOW_MS / 1000.0
+        while True:
+            # wait for a free worker first, so clips pile up into larger batches while all are busy
+            await self._slots.acquire()
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + window
+            while len(batch) < STT_BATCH_SIZE:
+                if not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            task = asyncio.create_task(self._run_batch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batch_done)
+
+    def _batch_done(self, task: asyncio.Task):
+        self._batches.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.warning("local transcription batch failed: %r", task.exception())
+
+    async def _run_batch(self, batch: list):
+        self._counters["batches"] += 1
+        self._counters["batched_clips"] += len(batch)
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self._get_pool(), _transcribe_batch, [data for data, _ in batch]
+            )
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                # a worker died (OOM, bad model file): start a fresh pool for the next batch
+                self._counters["pool_restarts"] += 1
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(STTUnavailable(f"local transcription failed: {e!r}"))
+            return
+        finally:
+            self._slots.release()
+        for (data, fut), (status, text, duration, elapsed) in zip(batch, results):
+            if fut.done():
+                continue
+            if status == "ok":
+                fut.set_result(Transcription(text, duration, elapsed))
+            else:
+                fut.set_exception(STTUnavailable(f"local transcription failed: {text}"))
+
+    async def warm(self):
+        if not self.available():
+            raise STTUnavailable("faster-whisper is not installed")
+        # every worker runs the initializer (loads the model) on its first task
+        loop = asyncio.get_running_loop()
+        pool = self._get_pool()
+        await asyncio.gather(*(loop.run_in_executor(pool, _noop) for _ in range(self.workers)))
+
+    async def close(self):
+        if self._collector is not None:
+            self._collector.cancel()
+            self._collector = None
+        for task in list(self._batches):
+            task.cancel()
+        if self._pool is not None:
+            pool, self._pool = self._pool, None
+            await asyncio.to_thread(pool.shutdown, True, cancel_futures=True)
+
+    def stats(self) -> Dict:
+        return dict(
+            super().stats(),
+            model=self.model_name,
+            workers=self.workers,
+            installed=self.available(),
+            queued=self._queue.qsize() if self._queue is not None else 0,
+            avg_batch=round(self._counters["batched_clips"] / self._counters["batches"], 2) if self._counters["batches"] else 0.0,
+        )
+
+
+class FallbackBackend(STTBackend):
+    """Try each backend in order; any failure moves on to the next one."""
+
+    def __init__(self, backends: List[STTBackend]):
+        super().__init__()
+        self.backends = backends
+        self.name = ",".join(b.name for b in backends)
+        self._counters.update(fallbacks=0)
+
+    async def transcribe(self, file: BinaryIO, filename: str) -> str:
+        self._counters["requests"] += 1
+        for i, backend in enumerate(self.backends):
+            try:
+                return await backend.transcribe(file, filename)
+            except Exception as e:
+                if i == len(self.backends) - 1:
+                    self._counters["errors"] += 1
+                    raise
+                self._counters["fallbacks"] += 1
+                logger.warning("STT %s failed (%r), falling back to %s", backend.name, e, self.backends[i + 1].name)
+
+    async def warm(self):
+        # warm every backend in the chain; the chain works as long as one of them does
+        results = await asyncio.gather(*(b.warm() for b in self.backends), return_exceptions=True)
+        if all(isinstance(r, Exception) for r in results):
+            raise results[0]
+
+    def stats(self) -> Dict:
+        return {"requests": self._counters["requests"], "errors": self._counters["errors"], "fallbacks": self._counters["fallbacks"]}
+
+
+_BACKENDS: Dict[str, Callable[[], STTBackend]] = {"remote": RemoteBackend, "local": LocalWhisperBackend}
+_instances: Dict[str, STTBackend] = {}
+
+
+def register_backend(name: str, factory: Callable[[], STTBackend]):
+    """Register another backend (anything implementing STTBackend)."""
+    _BACKENDS[name] = factory
+
+
+def _instance(name: str) -> STTBackend:
+    if name not in _instances:
+        _instances[name] = _BACKENDS[name]()
+    return _instances[name]
+
+
+def get_backend(spec: Optional[str] = None) -> STTBackend:
+    """Backend for a name or comma-separated fallback chain (default STT_BACKEND).
+    Raises KeyError for unknown names."""
+    spec = ",".join(part.strip() for part in (spec or STT_BACKEND).split(",") if part.strip())
+    if spec not in _instances:
+        names = spec.split(",")
+        unknown = [n for n in names if n not in _BACKENDS]
+        if unknown:
+            raise KeyError(f"unknown STT backend: {', '.join(unknown)}")
+        if len(names) > 1:
+            _instances[spec] = FallbackBackend([_instance(n) for n in names])
+    return _instance(spec) if spec in _BACKENDS else _instances[spec]
+
+
+async def shutdown():
+    for backend in list(_instances.values()):
+        try:
+            await backend.close()
+        except Exception:
+            pass
+    _instances.clear()
+
+
+def stats() -> Dict:
+    return dict(default=STT_BACKEND, backends={name: b.stats() for name, b in _instances.items()})
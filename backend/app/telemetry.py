@@ -0,0 +1,233 @@
+import os
+import re
+import time
+import uuid
+import random
+import bisect
+import logging
+import contextvars
+from typing import Dict, List, Optional, Tuple
+
+# Request tracing and per-stage metrics. Stages (upload, stt, db, llm, tts, ...) are
+# timed with `with span("llm"):`, which feeds a Prometheus-style histogram, adds an
+# entry to the response's Server-Timing header and logs at DEBUG with the request's
+# trace id. Everything is in-process and allocation-light; /metrics renders it.
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LLM_PROMPT_LOG_RATE = float(os.getenv("LLM_PROMPT_LOG_RATE", "0"))
+TELEMETRY_SERVER_TIMING = os.getenv("TELEMETRY_SERVER_TIMING", "1") == "1"
+
+# seconds; covers a cache hit up to a slow Whisper call
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+logger = logging.getLogger("app")
+
+_TRACE_ID_CHARS = re.compile(r"[^A-Za-z0-9._:-]")
+
+_trace_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("trace_id", default=None)
+_spans: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("spans", default=None)
+
+
+class _TraceFilter(logging.Filter):
+    def filter(self, record):
+        record.trace_id = _trace_id.get() or "-"
+        return True
+
+
+def configure_logging():
+    """Attach a stderr handler to the app logger that includes the trace id."""
+    if logger.handlers:
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s [%(trace_id)s] %(name)s: %(message)s"))
+    handler.addFilter(_TraceFilter())
+    logger.addHandler(handler)
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values."""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...], buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self._series: Dict[tuple, list] = {}  # labels -> [bucket counts..., sum, count]
+
+    def observe(self, value: float, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [0] * (len(self.buckets) + 2)
+        i = bisect.bisect_left(self.buckets, value)
+        if i < len(self.buckets):
+            series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, series in sorted(self._series.items()):
+            base = _labels(self.labels, label_values)
+            running = 0
+            for bound, n in zip(self.buckets, series):
+                running += n
+                lines.append(f'{self.name}_bucket{{{base}{"," if base else ""}le="{bound}"}} {running}')
+            lines.append(f'{self.name}_bucket{{{base}{"," if base else ""}le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{base}}} {series[-2]:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {series[-1]}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...]):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._series: Dict[tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        self._series[label_values] = self._series.get(label_values, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self._series.items()):
+            lines.append(f"{self.name}_total{{{_labels(self.labels, label_values)}}} {value}")
+        return lines
+
+
+class Gauge:
+    """Current values read from a callback at scrape time: collect() -> {label values: value}."""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...], collect):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        for label_values, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}{{{_labels(self.labels, label_values)}}} {value}")
+        return lines
+
+
+def _labels(names: Tuple[str, ...], values: tuple) -> str:
+    return ",".join(f'{n}="{str(v).replace(chr(34), "")}"' for n, v in zip(names, values))
+
+
+STAGE_SECONDS = Histogram("prescreener_stage_seconds", "Time spent per request stage", ("stage", "route"))
+STAGE_ERRORS = Counter("prescreener_stage_errors", "Stages that raised", ("stage", "route"))
+HTTP_SECONDS = Histogram("prescreener_http_request_seconds", "HTTP request latency", ("method", "route", "status"))
+EVENTS = Counter("prescreener_events", "Named events (cache hits, fallbacks, ...)", ("event",))
+UPSTREAM_WAIT = Histogram("prescreener_upstream_wait_seconds", "Time queued for an upstream (OpenAI) slot", ("model", "priority"))
+LLM_TOKENS = Counter("prescreener_llm_tokens", "LLM tokens by call kind (prompt, cached_prompt, completion)", ("kind", "type"))
+_METRICS = [HTTP_SECONDS, STAGE_SECONDS, STAGE_ERRORS, EVENTS, UPSTREAM_WAIT, LLM_TOKENS]
+
+
+def register_gauge(name: str, help: str, labels: Tuple[str, ...], collect) -> Gauge:
+    gauge = Gauge(name, help, labels, collect)
+    _METRICS.append(gauge)
+    return gauge
+
+
+def trace_id() -> Optional[str]:
+    return _trace_id.get()
+
+
+class span:
+    """Time a stage of the current request: `with span("llm", "/answer"): ...`.
+    A plain class rather than @contextmanager, which costs a generator per use."""
+
+    __slots__ = ("stage", "route", "t0")
+
+    def __init__(self, stage: str, route: str = ""):
+        self.stage = stage
+        self.route = route
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.t0
+        STAGE_SECONDS.observe(elapsed, self.stage, self.route)
+        if exc_type is not None:
+            STAGE_ERRORS.inc(self.stage, self.route)
+        spans = _spans.get()
+        if spans is not None:
+            spans.append((self.stage, elapsed))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("%s %s %.1fms", self.route, self.stage, elapsed * 1000)
+        return False
+
+
+def observe(stage: str, seconds: float, route: str = ""):
+    """Record a stage duration measured elsewhere (e.g. time to first token)."""
+    STAGE_SECONDS.observe(seconds, stage, route)
+
+
+def event(name: str, amount: float = 1):
+    EVENTS.inc(name, amount=amount)
+
+
+def log_prompt(kind: str, system_prompt: str, user_prompt: str):
+    """Log a sampled fraction (LLM_PROMPT_LOG_RATE) of the prompts sent to the LLM."""
+    if LLM_PROMPT_LOG_RATE > 0 and random.random() < LLM_PROMPT_LOG_RATE:
+        logger.info("LLM prompt (%s)\n[system]\n%s\n[user]\n%s", kind, system_prompt, user_prompt)
+
+
+def render_prometheus() -> str:
+    lines: List[str] = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def _route_template(scope) -> str:
+    """Path with path params put back as {name}, so ids don't explode label cardinality."""
+    if "endpoint" not in scope:
+        return "unmatched"
+    path = scope.get("path", "")
+    for name, value in (scope.get("path_params") or {}).items():
+        path = path.replace(str(value), "{" + name + "}")
+    return path
+
+
+class TraceMiddleware:
+    """Pure ASGI middleware: assigns a trace id (X-Request-ID in/out), collects the
+    request's spans into a Server-Timing header and records request latency."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        incoming = dict(scope.get("headers") or []).get(b"x-request-id")
+        tid = _TRACE_ID_CHARS.sub("", incoming.decode("latin-1"))[:64] if incoming else ""
+        tid = tid or uuid.uuid4().hex[:16]
+        trace_token = _trace_id.set(tid)
+        spans: list = []
+        spans_token = _spans.set(spans)
+        t0 = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-request-id", tid.encode("latin-1")))
+                if TELEMETRY_SERVER_TIMING and spans:
+                    timing = ", ".join(f"{stage};dur={elapsed * 1000:.1f}" for stage, elapsed in spans)
+                    headers.append((b"server-timing", timing.encode("latin-1")))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_SECONDS.observe(time.perf_counter() - t0, scope.get("method", ""), _route_template(scope), status)
+            _spans.reset(spans_token)
+            _trace_id.reset(trace_token)
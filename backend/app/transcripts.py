@@ -0,0 +1,78 @@
+import os
+import asyncio
+from typing import Awaitable, Callable, Dict, Optional
+
+from . import shared
+from .utils.lru import LRUCache
+
+# Transcription cache keyed by the sha256 of the uploaded audio (computed while the
+# upload streams in). The frontend sends the same recording to /transcribe and then
+# to /answer; the second upload is a cache hit, and /answer can skip the upload
+# entirely by passing back the transcription_id returned by /transcribe.
+# With shared state (app/shared.py) the texts are also kept there, so the /answer
+# can land on a different worker than the /transcribe.
+TRANSCRIPT_CACHE_MAX_ITEMS = int(os.getenv("TRANSCRIPT_CACHE_MAX_ITEMS", "1024"))
+TRANSCRIPT_CACHE_TTL = float(os.getenv("TRANSCRIPT_CACHE_TTL", "1800"))
+
+_cache = LRUCache(
+    max_items=TRANSCRIPT_CACHE_MAX_ITEMS,
+    ttl=TRANSCRIPT_CACHE_TTL,
+    sizeof=lambda text: len(text.encode("utf-8")),
+)
+_inflight: Dict[str, asyncio.Future] = {}
+_counters = {"id_lookups": 0, "id_hits": 0, "coalesced": 0, "transcribed": 0, "shared_hits": 0}
+
+
+async def _lookup(content_hash: str) -> Optional[str]:
+    text = _cache.get(content_hash)
+    if text is None and shared.enabled():
+        text = await shared.fetch(f"transcript:{content_hash}")
+        if text is not None:
+            _counters["shared_hits"] += 1
+            _cache.set(content_hash, text)
+    return text
+
+
+async def get(transcription_id: str) -> Optional[str]:
+    """Look up an earlier transcription by the id /transcribe returned."""
+    _counters["id_lookups"] += 1
+    text = await _lookup(transcription_id)
+    if text is not None:
+        _counters["id_hits"] += 1
+    return text
+
+
+async def transcribe(content_hash: str, fn: Callable[[], Awaitable[str]]) -> str:
+    """Return the cached transcription for this audio, or run fn() once for it."""
+    text = await _lookup(content_hash)
+    if text is not None:
+        return text
+    pending = _inflight.get(content_hash)
+    if pending is not None:
+        _counters["coalesced"] += 1
+        return await asyncio.shield(pending)
+
+    fut = asyncio.get_running_loop().create_future()
+    _inflight[content_hash] = fut
+    try:
+        text = await fn()
+        _counters["transcribed"] += 1
+        _cache.set(content_hash, text)
+        if shared.enabled():
+            # awaited: the client may send the transcription_id to another worker next
+            await shared.store(f"transcript:{content_hash}", text, TRANSCRIPT_CACHE_TTL)
+        fut.set_result(text)
+        return text
+    except asyncio.CancelledError:
+        fut.cancel()
+        raise
+    except BaseException as e:
+        fut.set_exception(e)
+        fut.exception()
+        raise
+    finally:
+        _inflight.pop(content_hash, None)
+
+
+def stats() -> Dict:
+    return dict(_counters, ttl=TRANSCRIPT_CACHE_TTL, cache=_cache.stats())
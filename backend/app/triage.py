@@ -0,0 +1,134 @@
+import os
+import re
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from .telemetry import logger
+
+# Local fast path for the purpose-of-visit step. A cheap classifier scores the
+# patient's answers; when it is confident enough, /answer returns done/form_type
+# without calling the LLM. In shadow mode the LLM is always called and the two
+# verdicts are compared, so the threshold can be tuned before switching it on.
+TRIAGE_MODE = os.getenv("TRIAGE_MODE", "on").lower()  # off | shadow | on
+TRIAGE_THRESHOLD = float(os.getenv("TRIAGE_THRESHOLD", "0.75"))
+TRIAGE_CLASSIFIER = os.getenv("TRIAGE_CLASSIFIER", "keyword")
+
+
+class TriageResult(NamedTuple):
+    form_type: Optional[str]
+    confidence: float
+    scores: Dict[str, float]
+
+    def as_reply(self) -> Dict:
+        return {"next_question": None, "done": True, "form_type": self.form_type}
+
+
+# (pattern, weight). Strong terms alone are enough to decide; weak ones only add up.
+_KEYWORDS = {
+    "dentistry": [
+        (r"tooth\w*|teeth|toothache|molars?|wisdom teeth", 3.0),
+        (r"gums?|dental|dentist|cavit(?:y|ies)|fillings?|crowns?|braces|root canal|extraction|jaw", 3.0),
+        (r"mouth|bite|biting|chewing|sensitiv\w*|bleeding gums|abscess", 1.0),
+    ],
+    "cardiac": [
+        (r"chest|heart\w*|palpitations?|arrhythmia|angina|cardiac", 3.0),
+        (r"breathless\w*|short(?:ness)? of breath|faint\w*|racing pulse|irregular (?:heartbeat|pulse)", 3.0),
+        (r"dizz\w*|blood pressure|swollen ankles|tightness|pressure", 1.0),
+    ],
+}
+_NEGATION = re.compile(r"\b(?:no|not|never|without|don't|dont|doesn't|isn't|haven't|denies)\b(?:\W+\w+){0,2}\W*$")
+
+
+class KeywordClassifier:
+    """Weighted keyword/regex scorer over the patient's answers (negations skipped)."""
+
+    name = "keyword"
+
+    def __init__(self, keywords: Dict[str, list] = _KEYWORDS):
+        self._patterns = {
+            form_type: [(re.compile(rf"\b(?:{pattern})\b", re.IGNORECASE), weight) for pattern, weight in items]
+            for form_type, items in keywords.items()
+        }
+
+    def classify(self, prev_qas: List[Dict]) -> TriageResult:
+        scores = {form_type: 0.0 for form_type in self._patterns}
+        for qa in prev_qas[-4:]:
+            answer = qa.get("answer") or ""
+            for form_type, patterns in self._patterns.items():
+                for regex, weight in patterns:
+                    for m in regex.finditer(answer):
+                        if not _NEGATION.search(answer[max(0, m.start() - 30):m.start()]):
+                            scores[form_type] += weight
+        ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+        (best, best_score), (_, runner_up) = ranked[0], ranked[1]
+        margin = best_score - runner_up
+        if margin <= 0:
+            return TriageResult(None, 0.0, scores)
+        return TriageResult(best, round(margin / (margin + 1.0), 4), scores)
+
+
+_CLASSIFIERS: Dict[str, Callable[[], object]] = {"keyword": KeywordClassifier}
+_classifier = None
+
+_counters = {
+    "evaluated": 0,
+    "fast_path": 0,
+    "below_threshold": 0,
+    "shadow_compared": 0,
+    "shadow_agreed": 0,
+    "shadow_disagreed": 0,
+}
+
+
+def register_classifier(name: str, factory: Callable[[], object]):
+    """Register another classifier (anything with classify(prev_qas) -> TriageResult)."""
+    _CLASSIFIERS[name] = factory
+
+
+def get_classifier():
+    global _classifier
+    if _classifier is None:
+        _classifier = _CLASSIFIERS[TRIAGE_CLASSIFIER]()
+    return _classifier
+
+
+def classify(prev_qas: List[Dict]) -> Optional[TriageResult]:
+    """Score the answers, or None when triage is off."""
+    if TRIAGE_MODE not in ("on", "shadow"):
+        return None
+    _counters["evaluated"] += 1
+    return get_classifier().classify(prev_qas)
+
+
+def fast_path(result: Optional[TriageResult]) -> Optional[Dict]:
+    """The reply to return without calling the LLM, if the fast path fires."""
+    if result is None or result.form_type is None or result.confidence < TRIAGE_THRESHOLD:
+        if result is not None:
+            _counters["below_threshold"] += 1
+        return None
+    if TRIAGE_MODE != "on":
+        return None
+    _counters["fast_path"] += 1
+    return result.as_reply()
+
+
+def would_fast_path(prev_qas: List[Dict]) -> bool:
+    """Whether fast_path() would answer this context; doesn't touch the counters."""
+    if TRIAGE_MODE != "on":
+        return False
+    result = get_classifier().classify(prev_qas)
+    return result.form_type is not None and result.confidence >= TRIAGE_THRESHOLD
+
+
+def compare(result: Optional[TriageResult], llm_reply: Dict):
+    """Shadow mode: record whether a confident local verdict matches the LLM."""
+    if TRIAGE_MODE != "shadow" or result is None or result.form_type is None or result.confidence < TRIAGE_THRESHOLD:
+        return
+    _counters["shadow_compared"] += 1
+    agrees = bool(llm_reply.get("done")) and llm_reply.get("form_type") == result.form_type
+    _counters["shadow_agreed" if agrees else "shadow_disagreed"] += 1
+    if not agrees:
+        logger.debug("triage shadow disagreement: local=%s (%s) llm=%s", result.form_type, result.confidence, llm_reply)
+
+
+def stats() -> Dict:
+    return dict(_counters, mode=TRIAGE_MODE, threshold=TRIAGE_THRESHOLD, classifier=TRIAGE_CLASSIFIER)
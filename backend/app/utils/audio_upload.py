@@ -0,0 +1,161 @@
+import os
+import hashlib
+import asyncio
+from typing import Optional
+
+from fastapi import HTTPException, Request, UploadFile
+from fastapi.routing import APIRoute
+from starlette.formparsers import MultiPartException, MultiPartParser
+
+# Shared ingestion for uploaded answer audio. The multipart parser of the audio
+# routes (AudioUploadRoute) has already spooled the upload (in memory below
+# AUDIO_SPOOL_THRESHOLD, on disk above it);
+# ingest_audio checks and hashes that file in place instead of copying it, and
+# UploadSizeLimitMiddleware bounds what the parser is allowed to spool.
+AUDIO_MAX_UPLOAD_BYTES = int(os.getenv("AUDIO_MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))  # Whisper's own limit
+AUDIO_SPOOL_THRESHOLD = int(os.getenv("AUDIO_SPOOL_THRESHOLD", str(1024 * 1024)))
+AUDIO_CHUNK_SIZE = 64 * 1024
+AUDIO_ALLOWED_TYPES = tuple(
+    t.strip() for t in os.getenv(
+        "AUDIO_ALLOWED_TYPES", "audio/,video/webm,video/ogg,video/mp4,application/octet-stream"
+    ).split(",") if t.strip()
+)
+# multipart framing and the other form fields on top of the audio itself
+_MULTIPART_OVERHEAD = 64 * 1024
+
+
+class _AudioMultiPartParser(MultiPartParser):
+    # Starlette's spool size is a class attribute (1 MB); set it for these routes only
+    max_file_size = AUDIO_SPOOL_THRESHOLD
+
+
+class _AudioRequest(Request):
+    async def _get_form(self, *, max_files=1000, max_fields=1000):
+        if self._form is None and self.headers.get("content-type", "").lower().startswith("multipart/form-data"):
+            parser = _AudioMultiPartParser(self.headers, self.stream(), max_files=max_files, max_fields=max_fields)
+            try:
+                self._form = await parser.parse()
+            except MultiPartException as exc:
+                raise HTTPException(status_code=400, detail=exc.message)
+        return await super()._get_form(max_files=max_files, max_fields=max_fields)
+
+
+class AudioUploadRoute(APIRoute):
+    """Route class for endpoints taking an audio upload: their multipart form is
+    parsed with the AUDIO_SPOOL_THRESHOLD spool size (other routes keep Starlette's)."""
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def audio_handler(request: Request):
+            return await handler(_AudioRequest(request.scope, request.receive))
+
+        return audio_handler
+
+
+class AudioUpload:
+    """An ingested audio clip: a rewound file object plus its size and content hash."""
+
+    def __init__(self, file, filename: str, content_type: str, size: int, sha256: str):
+        self.file = file
+        self.filename = filename
+        self.content_type = content_type
+        self.size = size
+        self.sha256 = sha256
+
+    def close(self):
+        try:
+            self.file.close()
+        except Exception:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def check_content_type(content_type: Optional[str]):
+    ctype = (content_type or "application/octet-stream").split(";")[0].strip().lower()
+    if not any(ctype.startswith(allowed) for allowed in AUDIO_ALLOWED_TYPES):
+        raise HTTPException(status_code=415, detail=f"Unsupported audio content type: {ctype}")
+
+
+async def ingest_audio(upload: UploadFile, max_bytes: int = AUDIO_MAX_UPLOAD_BYTES) -> AudioUpload:
+    """Hash and size-check the upload's own spooled file in chunks and hand it on
+    rewound. Raises 415 for non-audio content types and 413 past max_bytes.
+    """
+    check_content_type(upload.content_type)
+    file = upload.file
+    # a spooled file has a name (its fd) only once it has rolled over to disk;
+    # then keep the reads off the event loop
+    on_disk = getattr(file, "name", None) is not None
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        file.seek(0)
+        while True:
+            chunk = await asyncio.to_thread(file.read, AUDIO_CHUNK_SIZE) if on_disk else file.read(AUDIO_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(status_code=413, detail=f"Audio upload exceeds {max_bytes} bytes")
+            digest.update(chunk)
+        file.seek(0)
+        if size == 0:
+            raise HTTPException(status_code=400, detail="Empty audio upload")
+    except BaseException:
+        file.close()
+        raise
+    filename = upload.filename or "audio.wav"
+    if not os.path.splitext(filename)[1]:
+        filename += ".wav"
+    return AudioUpload(file, filename, upload.content_type or "application/octet-stream", size, digest.hexdigest())
+
+
+class UploadSizeLimitMiddleware:
+    """Bound multipart (upload) request bodies on every route before the multipart
+    parser spools them: from the Content-Length header when there is one, and by
+    counting the streamed body otherwise (ingest_audio still checks the audio part).
+    """
+
+    def __init__(self, app, max_bytes: int = AUDIO_MAX_UPLOAD_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes + _MULTIPART_OVERHEAD
+
+    async def _reject(self, send):
+        await send({
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [(b"content-type", b"application/json")],
+        })
+        await send({"type": "http.response.body", "body": b'{"detail":"Request body too large"}'})
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("method") != "POST":
+            return await self.app(scope, receive, send)
+        headers = dict(scope.get("headers", []))
+        if not headers.get(b"content-type", b"").lower().startswith(b"multipart/form-data"):
+            return await self.app(scope, receive, send)
+        try:
+            too_big = int(headers.get(b"content-length", b"0")) > self.max_bytes
+        except ValueError:
+            too_big = False
+        if too_big:
+            return await self._reject(send)
+
+        received = 0
+
+        async def _receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # raised inside the form parsing, which lets HTTPException through
+                    raise HTTPException(status_code=413, detail="Request body too large")
+            return message
+
+        await self.app(scope, _receive, send)
@@ -0,0 +1,115 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+
+class LRUCache:
+    """Small thread-safe LRU with optional TTL and hit/miss/eviction counters.
+
+    max_items: entry limit (0 disables the limit)
+    max_bytes: total size limit using `sizeof` (0 disables the limit)
+    ttl: seconds an entry stays valid (None = forever)
+    on_evict: optional callback(key, value) when an entry is dropped for space
+    """
+
+    def __init__(
+        self,
+        max_items: int = 256,
+        max_bytes: int = 0,
+        ttl: Optional[float] = None,
+        sizeof: Callable[[Any], int] = lambda v: 1,
+        on_evict: Optional[Callable[[Hashable, Any], None]] = None,
+    ):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._sizeof = sizeof
+        self._on_evict = on_evict
+        self._data: "OrderedDict[Hashable, tuple[Any, float, int]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._data.get(key)
+            return entry is not None and not self._expired(entry)
+
+    def _expired(self, entry) -> bool:
+        return entry[1] is not None and entry[1] < time.monotonic()
+
+    def _drop(self, key: Hashable):
+        _, _, size = self._data.pop(key)
+        self._bytes -= size
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            if self._expired(entry):
+                self._drop(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = time.monotonic() + ttl if ttl is not None else None
+        size = self._sizeof(value)
+        evicted = []
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            self._data[key] = (value, expires, size)
+            self._bytes += size
+            while self._data and (
+                (self.max_items and len(self._data) > self.max_items)
+                or (self.max_bytes and self._bytes > self.max_bytes)
+            ):
+                old_key, (old_value, _, old_size) = self._data.popitem(last=False)
+                self._bytes -= old_size
+                self.evictions += 1
+                evicted.append((old_key, old_value))
+        if self._on_evict:
+            for k, v in evicted:
+                try:
+                    self._on_evict(k, v)
+                except Exception:
+                    pass
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            self._drop(key)
+            return entry[0]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "items": len(self._data),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
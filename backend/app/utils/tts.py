@@ -1,29 +1,259 @@
+import os
+import re
+import io
+import wave
+import struct
+import hashlib
 import tempfile
 import asyncio
+from array import array
 from pathlib import Path
-import pyttsx3
+from typing import AsyncIterator, Iterable, List, Optional
 
-async def text_to_speech_bytes(text: str, voice_rate: int = 150) -> bytes:
-    """Render text to WAV bytes using pyttsx3 in a thread to avoid blocking.
-    Returns bytes of a WAV file.
+from .lru import LRUCache
+from .tts_pool import TTS_POOL_SIZE, get_pool
+from ..telemetry import logger
+
+# Rendered audio cache. Keyed on (text, voice_rate, voice) so identical prompts
+# (DEFAULT_QUESTIONS, repeated follow-ups) never hit pyttsx3 twice.
+TTS_CACHE_MAX_ITEMS = int(os.getenv("TTS_CACHE_MAX_ITEMS", "256"))
+TTS_CACHE_MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# Optional on-disk tier that survives restarts (empty = disabled)
+TTS_CACHE_DIR = os.getenv("TTS_CACHE_DIR", "")
+# Streaming mode: how many segments may render ahead of the one being sent
+TTS_STREAM_LOOKAHEAD = int(os.getenv("TTS_STREAM_LOOKAHEAD", "2"))
+TTS_SEGMENT_MAX_CHARS = int(os.getenv("TTS_SEGMENT_MAX_CHARS", "220"))
+
+_SENTENCE_END = re.compile(r"(?<=[.!?;:])\s+")
+
+_memory_cache = LRUCache(max_items=TTS_CACHE_MAX_ITEMS, max_bytes=TTS_CACHE_MAX_BYTES, sizeof=len)
+_disk_stats = {"hits": 0, "misses": 0, "writes": 0, "errors": 0}
+_inflight: dict[str, asyncio.Task] = {}
+
+
+def cache_key(text: str, voice_rate: int = 150, voice: Optional[str] = None) -> str:
+    raw = f"{voice_rate}\x00{voice or ''}\x00{text}".encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+def _disk_path(key: str) -> Optional[Path]:
+    if not TTS_CACHE_DIR:
+        return None
+    return Path(TTS_CACHE_DIR) / key[:2] / f"{key}.wav"
+
+
+def _disk_read(key: str) -> Optional[bytes]:
+    path = _disk_path(key)
+    if path is None:
+        return None
+    try:
+        data = path.read_bytes()
+        _disk_stats["hits"] += 1
+        return data
+    except FileNotFoundError:
+        _disk_stats["misses"] += 1
+    except Exception:
+        _disk_stats["errors"] += 1
+    return None
+
+
+def _disk_write(key: str, data: bytes):
+    path = _disk_path(key)
+    if path is None:
+        return
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # write to a temp file then rename so readers never see a partial wav
+        fd, tmp = tempfile.mkstemp(dir=str(path.parent), suffix=".part")
+        with open(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        _disk_stats["writes"] += 1
+    except Exception:
+        _disk_stats["errors"] += 1
+
+
+def _render_uncached(text: str, voice_rate: int, voice: Optional[str]) -> bytes:
+    """Render text with a fresh pyttsx3 engine. Blocking; call from a thread.
+    Only used when the worker pool is disabled (TTS_POOL_SIZE=0).
     """
-    def _render(temp_path: str):
+    import pyttsx3
+
+    fd = tempfile.NamedTemporaryFile(suffix='.wav', delete=False)
+    temp_path = fd.name
+    fd.close()
+    try:
         engine = pyttsx3.init()
         engine.setProperty('rate', voice_rate)
-        # Save to file
+        if voice:
+            engine.setProperty('voice', voice)
         engine.save_to_file(text, temp_path)
         engine.runAndWait()
         with open(temp_path, 'rb') as f:
-            data = f.read()
+            return f.read()
+    finally:
+        try:
+            Path(temp_path).unlink()
+        except Exception:
+            pass
+
+
+async def _render(text: str, voice_rate: int, voice: Optional[str]) -> bytes:
+    if TTS_POOL_SIZE > 0:
+        return await get_pool().render(text, voice_rate, voice)
+    return await asyncio.to_thread(_render_uncached, text, voice_rate, voice)
+
+
+async def text_to_speech_bytes(text: str, voice_rate: int = 150, voice: Optional[str] = None) -> bytes:
+    """Render text to WAV bytes, serving from the memory/disk cache when possible.
+    Returns bytes of a WAV file.
+    """
+    key = cache_key(text, voice_rate, voice)
+    data = _memory_cache.get(key)
+    if data is not None:
         return data
 
-    fd = tempfile.NamedTemporaryFile(suffix='.wav', delete=False)
-    temp_path = fd.name
-    fd.close()
-    data = await asyncio.to_thread(_render, temp_path)
-    # remove file
-    try:
-        Path(temp_path).unlink()
-    except Exception:
-        pass
+    # coalesce concurrent misses for the same prompt onto one render
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.get_running_loop().create_task(_render_and_cache(key, text, voice_rate, voice))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    # the render belongs to no caller: one that goes away (client disconnect, a
+    # cancelled stream lookahead) leaves it running for the others and the cache
+    return await asyncio.shield(task)
+
+
+async def _render_and_cache(key: str, text: str, voice_rate: int, voice: Optional[str]) -> bytes:
+    data = await asyncio.to_thread(_disk_read, key)
+    if data is None:
+        data = await _render(text, voice_rate, voice)
+        await asyncio.to_thread(_disk_write, key, data)
+    _memory_cache.set(key, data)
     return data
+
+
+async def prerender(texts: Iterable[str], voice_rate: int = 150, voice: Optional[str] = None):
+    """Warm the cache for a set of known prompts. Failures are ignored."""
+    for text in texts:
+        try:
+            await text_to_speech_bytes(text, voice_rate, voice)
+        except Exception as e:
+            logger.warning("TTS prerender failed for %r: %s", text, e)
+
+
+def split_segments(text: str, max_chars: int = TTS_SEGMENT_MAX_CHARS) -> List[str]:
+    """Split text at sentence boundaries; overly long sentences are split at commas/spaces."""
+    segments = []
+    for sentence in _SENTENCE_END.split(text.strip()):
+        sentence = sentence.strip()
+        while len(sentence) > max_chars:
+            cut = sentence.rfind(",", 0, max_chars)
+            if cut <= 0:
+                cut = sentence.rfind(" ", 0, max_chars)
+            if cut <= 0:
+                cut = max_chars
+            segments.append(sentence[:cut + 1].strip())
+            sentence = sentence[cut + 1:].strip()
+        if sentence:
+            segments.append(sentence)
+    return segments
+
+
+def _read_wav(data: bytes):
+    with wave.open(io.BytesIO(data), "rb") as w:
+        return (w.getnchannels(), w.getsampwidth(), w.getframerate()), w.readframes(w.getnframes())
+
+
+def _decode_pcm(frames: bytes, sampwidth: int) -> List[int]:
+    """PCM samples scaled to signed 32-bit (8-bit WAV is unsigned)."""
+    if sampwidth == 1:
+        return [(s - 128) << 24 for s in frames]
+    if sampwidth == 3:
+        return [int.from_bytes(frames[i:i + 3], "little", signed=True) << 8 for i in range(0, len(frames) - 2, 3)]
+    samples = array("h" if sampwidth == 2 else "i", frames[:len(frames) - len(frames) % sampwidth])
+    return [s << (32 - 8 * sampwidth) for s in samples]
+
+
+def _encode_pcm(samples: List[int], sampwidth: int) -> bytes:
+    shift = 32 - 8 * sampwidth
+    if sampwidth == 1:
+        return bytes((s >> 24) + 128 for s in samples)
+    if sampwidth == 3:
+        return b"".join((s >> 8).to_bytes(3, "little", signed=True) for s in samples)
+    return array("h" if sampwidth == 2 else "i", [s >> shift for s in samples]).tobytes()
+
+
+def _convert_frames(frames: bytes, src: tuple, dst: tuple) -> bytes:
+    """Convert PCM frames between (nchannels, sampwidth, framerate) formats: channels
+    are averaged (or duplicated), the rate is changed by picking the nearest frame."""
+    (src_channels, src_width, src_rate), (dst_channels, dst_width, dst_rate) = src, dst
+    samples = _decode_pcm(frames, src_width)
+    count = len(samples) // src_channels
+    out: List[int] = []
+    for j in range(count * dst_rate // src_rate):
+        i = j * src_rate // dst_rate
+        frame = samples[i * src_channels:(i + 1) * src_channels]
+        if src_channels != dst_channels:
+            frame = [sum(frame) // src_channels] * dst_channels
+        out.extend(frame)
+    return _encode_pcm(out, dst_width)
+
+
+def _streaming_wav_header(nchannels: int, sampwidth: int, framerate: int) -> bytes:
+    """WAV header with unknown (max) sizes, which players accept for streamed PCM."""
+    unknown = 0xFFFFFFFF
+    block_align = nchannels * sampwidth
+    return (
+        b"RIFF" + struct.pack("<I", unknown) + b"WAVE"
+        + b"fmt " + struct.pack("<IHHIIHH", 16, 1, nchannels, framerate, framerate * block_align, block_align, sampwidth * 8)
+        + b"data" + struct.pack("<I", unknown)
+    )
+
+
+async def stream_speech(text: str, voice_rate: int = 150, voice: Optional[str] = None) -> AsyncIterator[bytes]:
+    """Yield a single WAV stream, sending each sentence's PCM as soon as it is rendered.
+
+    Segments render ahead of playback (up to TTS_STREAM_LOOKAHEAD), so time to
+    first byte is the render time of the first sentence only.
+    """
+    segments = split_segments(text)
+    tasks: List[asyncio.Task] = []
+    next_index = 0
+
+    def _schedule():
+        nonlocal next_index
+        while next_index < len(segments) and len(tasks) - sent <= TTS_STREAM_LOOKAHEAD:
+            tasks.append(asyncio.create_task(text_to_speech_bytes(segments[next_index], voice_rate, voice)))
+            next_index += 1
+
+    sent = 0
+    params = None
+    try:
+        while sent < len(segments):
+            _schedule()
+            seg_params, frames = _read_wav(await tasks[sent])
+            sent += 1
+            if params is None:
+                params = seg_params
+                yield _streaming_wav_header(*params)
+            elif seg_params != params:
+                # a segment cached with other engine settings: convert it to the
+                # stream's format rather than dropping part of the sentence
+                logger.warning("TTS segment %d/%d is %s, converting to the stream's %s",
+                               sent, len(segments), seg_params, params)
+                frames = await asyncio.to_thread(_convert_frames, frames, seg_params, params)
+            yield frames
+    finally:
+        for task in tasks[sent:]:
+            task.cancel()
+
+
+def pool_stats() -> dict:
+    return get_pool().stats() if TTS_POOL_SIZE > 0 else {"size": 0}
+
+
+def cache_stats() -> dict:
+    stats = _memory_cache.stats()
+    stats["disk"] = dict(_disk_stats, enabled=bool(TTS_CACHE_DIR))
+    return stats
@@ -0,0 +1,239 @@
+import os
+import time
+import asyncio
+import tempfile
+import multiprocessing as mp
+from pathlib import Path
+from typing import Optional, Set
+
+from .timing import Timing
+from ..telemetry import logger
+
+# Long-lived pyttsx3 workers. Each process initializes its engine once and then
+# renders jobs sent over a pipe, so requests no longer pay for engine startup
+# and never share a (non-thread-safe) driver.
+TTS_POOL_SIZE = int(os.getenv("TTS_POOL_SIZE", "2"))
+TTS_QUEUE_DEPTH = int(os.getenv("TTS_QUEUE_DEPTH", "32"))
+TTS_JOB_TIMEOUT = float(os.getenv("TTS_JOB_TIMEOUT", "20"))
+
+
+class TTSQueueFull(Exception):
+    """Raised when the render queue is at capacity (callers should shed load)."""
+
+
+class TTSRenderError(Exception):
+    pass
+
+
+def _worker_main(conn):
+    """Worker process loop: one engine, many jobs. A None job means exit."""
+    import pyttsx3
+
+    engine = pyttsx3.init()
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        if job is None:
+            break
+        text, voice_rate, voice = job
+        fd = tempfile.NamedTemporaryFile(suffix='.wav', delete=False)
+        temp_path = fd.name
+        fd.close()
+        try:
+            engine.setProperty('rate', voice_rate)
+            if voice:
+                engine.setProperty('voice', voice)
+            engine.save_to_file(text, temp_path)
+            engine.runAndWait()
+            with open(temp_path, 'rb') as f:
+                conn.send(("ok", f.read()))
+        except Exception as e:
+            conn.send(("error", repr(e)))
+        finally:
+            try:
+                Path(temp_path).unlink()
+            except Exception:
+                pass
+
+
+class _Worker:
+    def __init__(self, ctx):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.jobs = 0
+
+    def kill(self):
+        try:
+            self.process.kill()
+            self.process.join(timeout=1)
+        except Exception:
+            pass
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+
+
+class TTSWorkerPool:
+    def __init__(self, size: int = TTS_POOL_SIZE, queue_depth: int = TTS_QUEUE_DEPTH, job_timeout: float = TTS_JOB_TIMEOUT):
+        self.size = max(1, size)
+        self.queue_depth = queue_depth
+        self.job_timeout = job_timeout
+        self._ctx = mp.get_context("spawn")
+        self._idle: Optional[asyncio.Queue] = None
+        self._workers: list[_Worker] = []
+        self._waiting = 0
+        self._respawning: Set[asyncio.Task] = set()
+        self._start_lock = asyncio.Lock()
+        self.queue_wait = Timing()
+        self.render_time = Timing()
+        self.rejected = 0
+        self.timeouts = 0
+        self.recycled = 0
+        self.errors = 0
+
+    @property
+    def started(self) -> bool:
+        return self._idle is not None
+
+    async def start(self):
+        async with self._start_lock:
+            if self._idle is not None:
+                return
+            idle: asyncio.Queue = asyncio.Queue()
+            for _ in range(self.size):
+                worker = await asyncio.to_thread(_Worker, self._ctx)
+                self._workers.append(worker)
+                idle.put_nowait(worker)
+            self._idle = idle
+
+    async def stop(self):
+        workers, self._workers = self._workers, []
+        self._idle = None
+        for worker in workers:
+            try:
+                worker.conn.send(None)
+            except Exception:
+                pass
+            await asyncio.to_thread(worker.process.join, 1)
+            worker.kill()
+
+    def _recycle(self, worker: _Worker):
+        """Drop a worker that can't be trusted any more (timed out, died, cancelled
+        mid-job) and start a replacement in the background."""
+        self.recycled += 1
+        self._workers = [w for w in self._workers if w is not worker]
+        task = asyncio.get_running_loop().create_task(self._respawn(worker))
+        self._respawning.add(task)
+        task.add_done_callback(self._respawning.discard)
+
+    async def _respawn(self, worker: _Worker):
+        await asyncio.to_thread(worker.kill)
+        idle = self._idle
+        if idle is None:
+            return
+        try:
+            replacement = await asyncio.to_thread(_Worker, self._ctx)
+        except Exception as e:
+            self.errors += 1
+            logger.warning("TTS worker could not be restarted, %d left: %r", len(self._workers), e)
+            return
+        if self._idle is not idle:
+            # the pool was stopped meanwhile
+            await asyncio.to_thread(replacement.kill)
+            return
+        self._workers.append(replacement)
+        idle.put_nowait(replacement)
+
+    async def _recv(self, worker: _Worker):
+        """Wait for the worker's reply without tying up a thread, then read the WAV
+        (often hundreds of KB) off the pipe in one."""
+        loop = asyncio.get_running_loop()
+        ready = loop.create_future()
+        fileno = worker.conn.fileno()
+        loop.add_reader(fileno, lambda: ready.done() or ready.set_result(None))
+        try:
+            await asyncio.wait_for(ready, self.job_timeout)
+        finally:
+            loop.remove_reader(fileno)
+        return await asyncio.to_thread(worker.conn.recv)
+
+    async def render(self, text: str, voice_rate: int = 150, voice: Optional[str] = None) -> bytes:
+        if not self.started:
+            await self.start()
+        if self._waiting >= self.queue_depth:
+            self.rejected += 1
+            raise TTSQueueFull(f"TTS queue full ({self.queue_depth} waiting)")
+
+        t_wait = time.monotonic()
+        self._waiting += 1
+        try:
+            worker = await self._idle.get()
+        finally:
+            self._waiting -= 1
+        self.queue_wait.add(time.monotonic() - t_wait)
+
+        t_render = time.monotonic()
+        healthy = False
+        try:
+            worker.conn.send((text, voice_rate, voice))
+            status, payload = await self._recv(worker)
+            healthy = True
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise TTSRenderError(f"TTS render timed out after {self.job_timeout}s")
+        except (EOFError, OSError) as e:
+            self.errors += 1
+            raise TTSRenderError(f"TTS worker died: {e}")
+        finally:
+            # only a worker that answered goes back to idle; one that timed out, died or
+            # was cancelled mid-render (a dirty pipe) is replaced
+            if not healthy:
+                self._recycle(worker)
+            elif self._idle is not None:
+                self._idle.put_nowait(worker)
+            else:
+                await asyncio.to_thread(worker.kill)
+        self.render_time.add(time.monotonic() - t_render)
+        worker.jobs += 1
+
+        if status != "ok":
+            self.errors += 1
+            raise TTSRenderError(payload)
+        return payload
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "started": self.started,
+            "queue_depth": self.queue_depth,
+            "waiting": self._waiting,
+            "idle": self._idle.qsize() if self._idle is not None else 0,
+            "queue_wait": self.queue_wait.stats(),
+            "render": self.render_time.stats(),
+            "rejected": self.rejected,
+            "timeouts": self.timeouts,
+            "recycled": self.recycled,
+            "errors": self.errors,
+        }
+
+
+_pool: Optional[TTSWorkerPool] = None
+
+
+def get_pool() -> TTSWorkerPool:
+    global _pool
+    if _pool is None:
+        _pool = TTSWorkerPool()
+    return _pool
+
+
+async def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        await _pool.stop()
+        _pool = None
@@ -0,0 +1,207 @@
+import io
+import os
+import sys
+import json
+import math
+import wave
+import array
+import hashlib
+import asyncio
+from typing import Dict, Optional, Union
+
+from fastapi import WebSocket
+
+from .utils.audio_upload import AudioUpload, AUDIO_MAX_UPLOAD_BYTES
+
+# Connection plumbing for the voice WebSocket (/ws/session/{session_id}); the turn
+# logic itself lives in routes.py next to the HTTP endpoints it shares helpers with.
+#
+# Client -> server: binary audio frames; JSON {"type": "start", "question", "format",
+# "sample_rate"}, {"type": "end"}, {"type": "text", "text"}, {"type": "ping"|"pong"}.
+# Server -> client: JSON {"type": "ready"|"partial"|"transcript"|"question"|"done"|
+# "audio_start"|"audio_end"|"error"|"ping"|"pong", ...} and binary TTS audio (one WAV
+# stream per question, split across frames between audio_start and audio_end).
+#
+# End of utterance is the client's "end" message or, for raw PCM ("pcm16"),
+# WS_SILENCE_MS of trailing silence after speech. Outgoing messages go through a
+# bounded queue, so a slow client pauses the TTS stream instead of growing memory.
+WS_SEND_QUEUE = int(os.getenv("WS_SEND_QUEUE", "64"))
+WS_HEARTBEAT_S = float(os.getenv("WS_HEARTBEAT_S", "20"))
+WS_IDLE_TIMEOUT_S = float(os.getenv("WS_IDLE_TIMEOUT_S", "60"))
+WS_SILENCE_MS = int(os.getenv("WS_SILENCE_MS", "700"))
+WS_SILENCE_RMS = int(os.getenv("WS_SILENCE_RMS", "500"))
+# transcribe the audio so far this often while the patient speaks (0 = only at the end)
+WS_PARTIAL_INTERVAL_MS = int(os.getenv("WS_PARTIAL_INTERVAL_MS", "1500"))
+# answers that may wait while a turn is running; past that the client gets a 429 error
+WS_TURN_QUEUE = int(os.getenv("WS_TURN_QUEUE", "2"))
+
+CLOSE_IDLE = 4408
+CLOSE_NOT_FOUND = 4404
+
+_counters = {
+    "connections": 0,
+    "open": 0,
+    "turns": 0,
+    "eou_client": 0,
+    "eou_silence": 0,
+    "partials": 0,
+    "idle_timeouts": 0,
+    "oversized": 0,
+    "send_waits": 0,  # outgoing queue was full (client reading slower than we send)
+}
+
+
+def count(name: str, amount: int = 1):
+    _counters[name] += amount
+
+
+def pcm16_to_wav(pcm: bytes, sample_rate: int, channels: int = 1) -> bytes:
+    out = io.BytesIO()
+    with wave.open(out, "wb") as w:
+        w.setnchannels(channels)
+        w.setsampwidth(2)
+        w.setframerate(sample_rate)
+        w.writeframes(pcm)
+    return out.getvalue()
+
+
+def _rms(pcm: bytes) -> float:
+    samples = array.array("h", pcm[:len(pcm) - len(pcm) % 2])
+    if sys.byteorder != "little":
+        samples.byteswap()
+    if not samples:
+        return 0.0
+    return math.sqrt(sum(s * s for s in samples) / len(samples))
+
+
+class Utterance:
+    """Audio of one answer as it streams in, with silence-based end-of-utterance
+    detection for raw PCM."""
+
+    def __init__(self, fmt: str = "pcm16", sample_rate: int = 16000, max_bytes: int = AUDIO_MAX_UPLOAD_BYTES):
+        self.format = fmt
+        self.sample_rate = sample_rate
+        self.max_bytes = max_bytes
+        self.buf = bytearray()
+        self.speech_end = 0  # bytes up to the end of the last voiced frame
+        self.heard_speech = False
+
+    @property
+    def is_pcm(self) -> bool:
+        return self.format == "pcm16"
+
+    def _ms(self, nbytes: int) -> float:
+        return nbytes / (2 * self.sample_rate) * 1000
+
+    def append(self, frame: bytes) -> Optional[str]:
+        """Add a frame. Returns "pause" when the patient has just stopped speaking,
+        "end" once the pause is long enough to end the utterance, else None.
+        Raises OverflowError past max_bytes."""
+        if len(self.buf) + len(frame) > self.max_bytes:
+            raise OverflowError(f"utterance longer than {self.max_bytes} bytes")
+        was_speaking = self.heard_speech and self.speech_end == len(self.buf)
+        self.buf += frame
+        if not self.is_pcm:
+            return None
+        if _rms(frame) >= WS_SILENCE_RMS:
+            self.heard_speech = True
+            self.speech_end = len(self.buf)
+            return None
+        if not self.heard_speech:
+            return None
+        if self._ms(len(self.buf) - self.speech_end) >= WS_SILENCE_MS:
+            return "end"
+        return "pause" if was_speaking else None
+
+    @property
+    def empty(self) -> bool:
+        return not self.buf or (self.is_pcm and not self.heard_speech)
+
+    def clip(self, trimmed: bool = True) -> AudioUpload:
+        """The audio as an uploaded-clip object (PCM is wrapped in a WAV header, with
+        trailing silence trimmed so the final clip hashes the same as the one taken
+        when the pause started)."""
+        if self.is_pcm:
+            pcm = bytes(self.buf[:self.speech_end] if trimmed and self.heard_speech else self.buf)
+            data, filename, ctype = pcm16_to_wav(pcm, self.sample_rate), "answer.wav", "audio/wav"
+        else:
+            data, filename, ctype = bytes(self.buf), f"answer.{self.format}", f"audio/{self.format}"
+        return AudioUpload(io.BytesIO(data), filename, ctype, len(data), hashlib.sha256(data).hexdigest())
+
+
+class VoiceConnection:
+    """A WebSocket with a bounded outgoing queue drained by one sender task, a
+    heartbeat, and an idle timeout on receive."""
+
+    def __init__(self, websocket: WebSocket):
+        self.ws = websocket
+        self._out: asyncio.Queue = asyncio.Queue(maxsize=WS_SEND_QUEUE)
+        self._sender: Optional[asyncio.Task] = None
+        self.closed = False
+
+    async def __aenter__(self):
+        await self.ws.accept()
+        count("connections")
+        count("open")
+        self._sender = asyncio.create_task(self._send_loop())
+        return self
+
+    async def __aexit__(self, *exc):
+        count("open", -1)
+        self.closed = True
+        if self._sender is not None:
+            self._sender.cancel()
+        return False
+
+    async def _send_loop(self):
+        try:
+            while True:
+                try:
+                    message = await asyncio.wait_for(self._out.get(), WS_HEARTBEAT_S)
+                except asyncio.TimeoutError:
+                    message = {"type": "ping"}
+                if isinstance(message, (bytes, bytearray)):
+                    await self.ws.send_bytes(bytes(message))
+                else:
+                    await self.ws.send_text(json.dumps(message, ensure_ascii=False))
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # the client went away; the receive side notices and ends the session.
+            # Keep draining so producers blocked on a full queue don't hang.
+            self.closed = True
+            while True:
+                await self._out.get()
+
+    async def send(self, message: Union[Dict, bytes]):
+        """Queue a JSON message or a binary frame; waits while the queue is full."""
+        if self.closed:
+            return
+        if self._out.full():
+            count("send_waits")
+        await self._out.put(message)
+
+    async def flush(self):
+        while not self._out.empty() and not self.closed:
+            await asyncio.sleep(0.01)
+
+    async def receive(self) -> Dict:
+        """The next ASGI websocket message; raises asyncio.TimeoutError when the client
+        has been silent (no audio, no pong) for WS_IDLE_TIMEOUT_S."""
+        return await asyncio.wait_for(self.ws.receive(), WS_IDLE_TIMEOUT_S)
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        await self.flush()
+        self.closed = True
+        try:
+            await self.ws.close(code=code, reason=reason)
+        except Exception:
+            pass
+
+
+def stats() -> Dict:
+    return dict(
+        _counters,
+        silence_ms=WS_SILENCE_MS,
+        partial_interval_ms=WS_PARTIAL_INTERVAL_MS,
+    )
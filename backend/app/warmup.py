@@ -0,0 +1,141 @@
+import os
+import time
+import asyncio
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+
+from .telemetry import logger
+
+# Startup warm-up. Each step opens something the first request would otherwise pay
+# for: the Mongo pool, keep-alive connections to the OpenAI API,
+# the TTS worker processes (and the first prompt's audio), the local STT model.
+# Steps run concurrently in the background after startup unless WARMUP_BLOCKING=1;
+# /readyz answers 503 until they have finished (and WARMUP_REQUIRED steps succeeded),
+# while /healthz only says the process is alive.
+WARMUP = os.getenv("WARMUP", "db,llm,tts")  # comma-separated steps, "all" or "none"
+WARMUP_BLOCKING = os.getenv("WARMUP_BLOCKING", "0") == "1"
+WARMUP_TIMEOUT_S = float(os.getenv("WARMUP_TIMEOUT_S", "15"))
+WARMUP_REQUIRED = os.getenv("WARMUP_REQUIRED", "")
+WARMUP_LLM_CONNECTIONS = int(os.getenv("WARMUP_LLM_CONNECTIONS", "2"))
+
+_started_at = time.monotonic()
+_state: Dict = {"started": None, "finished": None, "steps": {}}
+_task: Optional[asyncio.Task] = None
+_background: Set[asyncio.Task] = set()  # the loop only keeps weak references to tasks
+
+
+async def _db(prompts: List[str]) -> str:
+    from . import db
+    from .session_store import SESSION_BACKEND
+
+    if SESSION_BACKEND != "mongo":
+        return f"{SESSION_BACKEND} store, nothing to open"
+    await db.ping()
+    return "mongo pool open"
+
+
+async def _llm(prompts: List[str]) -> str:
+    from . import openai_client
+
+    return await openai_client.warm(WARMUP_LLM_CONNECTIONS)
+
+
+async def _tts(prompts: List[str]) -> str:
+    from .utils import tts
+    from .utils.tts_pool import get_pool
+
+    if tts.TTS_POOL_SIZE > 0:
+        await get_pool().start()
+    if not prompts or os.getenv("TTS_PRERENDER", "1") != "1":
+        return "engine started"
+    # the opening question is heard by every session; render it now, the rest in the background
+    await tts.text_to_speech_bytes(prompts[0])
+    if len(prompts) > 1:
+        task = asyncio.create_task(tts.prerender(prompts[1:]))
+        _background.add(task)
+        task.add_done_callback(_background.discard)  # prerender() logs its own failures
+    return "first prompt rendered"
+
+
+async def _stt(prompts: List[str]) -> str:
+    from . import stt
+
+    backend = stt.get_backend()
+    await backend.warm()
+    return f"{backend.name} ready"
+
+
+_STEPS: Dict[str, Callable[[List[str]], Awaitable[str]]] = {"db": _db, "llm": _llm, "tts": _tts, "stt": _stt}
+
+
+def register_step(name: str, step: Callable[[List[str]], Awaitable[str]]):
+    """Add a warm-up step (an async callable taking the prompts to pre-render)."""
+    _STEPS[name] = step
+
+
+def _names(spec: str) -> List[str]:
+    spec = spec.strip().lower()
+    if spec == "all":
+        return list(_STEPS)
+    if spec in ("", "none", "0", "off"):
+        return []
+    return [name.strip() for name in spec.split(",") if name.strip()]
+
+
+async def _run_step(name: str, prompts: List[str]):
+    t0 = time.perf_counter()
+    result: Dict = {"ok": False}
+    try:
+        step = _STEPS[name]
+        result["detail"] = await asyncio.wait_for(step(prompts), WARMUP_TIMEOUT_S)
+        result["ok"] = True
+    except KeyError:
+        result["error"] = "unknown warm-up step"
+    except asyncio.TimeoutError:
+        result["error"] = f"timed out after {WARMUP_TIMEOUT_S}s"
+    except Exception as e:
+        result["error"] = repr(e)
+    result["ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    _state["steps"][name] = result
+    if not result["ok"]:
+        logger.warning("warm-up step %s failed: %s", name, result["error"])
+
+
+async def run(prompts: Optional[List[str]] = None, spec: str = WARMUP):
+    """Run the configured steps concurrently; failures are recorded, not raised."""
+    _state.update(started=time.monotonic(), finished=None, steps={})
+    await asyncio.gather(*(_run_step(name, list(prompts or [])) for name in _names(spec)))
+    _state["finished"] = time.monotonic()
+    logger.info("warm-up finished in %.0fms: %s", (_state["finished"] - _state["started"]) * 1000,
+                {name: "ok" if s["ok"] else s["error"] for name, s in _state["steps"].items()})
+
+
+async def start(prompts: Optional[List[str]] = None):
+    """Called from the app's startup event."""
+    global _task
+    if WARMUP_BLOCKING:
+        await run(prompts)
+    else:
+        _task = asyncio.create_task(run(prompts))
+
+
+async def stop():
+    if _task is not None and not _task.done():
+        _task.cancel()
+    for task in list(_background):
+        task.cancel()
+
+
+def ready() -> bool:
+    if _state["finished"] is None:
+        return False
+    return all(_state["steps"].get(name, {}).get("ok") for name in _names(WARMUP_REQUIRED))
+
+
+def status() -> Dict:
+    started, finished = _state["started"], _state["finished"]
+    return {
+        "ready": ready(),
+        "uptime_s": round(time.monotonic() - _started_at, 3),
+        "warmup_ms": round((finished - started) * 1000, 1) if started is not None and finished is not None else None,
+        "steps": _state["steps"],
+    }
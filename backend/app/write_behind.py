@@ -0,0 +1,319 @@
+import os
+import copy
+import glob
+import time
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from . import shared
+from .utils.timing import Timing
+from .telemetry import logger
+
+# Write-behind queue for session updates no response waits on: done/form_type
+# outcomes, the running summary, follow-up bookkeeping. set_fields(defer=True) on
+# the Mongo store lands here and returns at once. Updates to the same session are
+# merged, then written every WRITE_BEHIND_INTERVAL_MS as unordered bulk_writes of
+# up to WRITE_BEHIND_BATCH sessions, or folded into the session's next append;
+# close() (app shutdown) writes whatever is left. A failed write stays queued and
+# is retried on the next tick.
+#
+# At most WRITE_BEHIND_MAX_PENDING sessions wait at once. Past that,
+# WRITE_BEHIND_FULL_POLICY decides: "sync" hands the update back to the caller
+# to write inline (nothing lost, that request pays the round trip), "drop"
+# discards it (counted and logged).
+#
+# With WRITE_BEHIND_LOG set, every queued update is first appended to a local
+# log (<path>.<pid>, fsynced with WRITE_BEHIND_FSYNC=1) that is compacted after
+# each flush. Logs left behind by a process that died before flushing are
+# replayed when the next one starts. Log file I/O runs on one dedicated thread,
+# off the event loop and in the order it was issued.
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "1") == "1"
+WRITE_BEHIND_INTERVAL_MS = float(os.getenv("WRITE_BEHIND_INTERVAL_MS", "200"))
+WRITE_BEHIND_BATCH = int(os.getenv("WRITE_BEHIND_BATCH", "500"))
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "10000"))
+WRITE_BEHIND_FULL_POLICY = os.getenv("WRITE_BEHIND_FULL_POLICY", "sync").lower()  # sync | drop
+WRITE_BEHIND_LOG = os.getenv("WRITE_BEHIND_LOG", "")
+WRITE_BEHIND_FSYNC = os.getenv("WRITE_BEHIND_FSYNC", "0") == "1"
+
+# writes [(key, $set fields), ...]; raises if the batch wasn't applied
+BulkWrite = Callable[[List[Tuple[str, Dict]]], Awaitable[None]]
+
+
+def merge(into: Dict, fields: Dict) -> Dict:
+    """$set-merge fields into pending ones, newest wins, without leaving a path
+    and one of its sub-paths ("followup" and "followup.done") in the same $set."""
+    for path, value in fields.items():
+        for nested in [p for p in into if p.startswith(path + ".")]:
+            # the whole value replaces earlier updates inside it
+            del into[nested]
+        parent = next((p for p in into if path.startswith(p + ".")), None)
+        if parent is None:
+            into[path] = value
+        elif isinstance(into[parent], dict):
+            target = into[parent]
+            *keys, leaf = path[len(parent) + 1:].split(".")
+            for key in keys:
+                if not isinstance(target.get(key), dict):
+                    target[key] = {}
+                target = target[key]
+            target[leaf] = value
+        else:
+            # the parent was set to a scalar; the sub-path write turns it back into an object
+            del into[parent]
+            into[path] = value
+    return into
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class WriteBehindQueue:
+    """Pending $set updates per key, flushed in the background by `write`."""
+
+    def __init__(self, write: BulkWrite, interval_ms: float = WRITE_BEHIND_INTERVAL_MS,
+                 batch: int = WRITE_BEHIND_BATCH, max_pending: int = WRITE_BEHIND_MAX_PENDING,
+                 full_policy: str = WRITE_BEHIND_FULL_POLICY, log_path: str = WRITE_BEHIND_LOG,
+                 fsync: bool = WRITE_BEHIND_FSYNC):
+        if full_policy not in ("sync", "drop"):
+            raise ValueError(f"Unknown WRITE_BEHIND_FULL_POLICY: {full_policy}")
+        self._write = write
+        self.interval = interval_ms / 1000
+        self.batch = max(1, batch)
+        self.max_pending = max_pending
+        self.full_policy = full_policy
+        self.log_path = log_path
+        self.fsync = fsync
+        self._pending: Dict[str, Dict] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._loop = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._log = None
+        self._log_opened = False
+        self._log_dirty = False
+        # one thread: appends and compactions reach the file in submission order
+        self._log_io = ThreadPoolExecutor(1, thread_name_prefix="write-behind-log") if log_path else None
+        self._flush_timing = Timing()
+        self._totals = {
+            "queued": 0,
+            "merged": 0,  # queued onto a session that already had pending fields
+            "folded": 0,  # taken by the session's next append instead of flushed
+            "written": 0,
+            "flushes": 0,
+            "write_errors": 0,
+            "requeued": 0,
+            "full_sync": 0,  # queue full, handed back to be written inline
+            "dropped": 0,  # queue full, discarded
+            "replayed": 0,
+        }
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    async def put(self, key: str, fields: Dict) -> bool:
+        """Queue fields for key (logged first, with WRITE_BEHIND_LOG). False when
+        the queue is full and the caller has to write them itself (full_policy "sync")."""
+        await self._ensure_running()
+        if key not in self._pending and len(self._pending) >= self.max_pending:
+            if self.full_policy == "sync":
+                self._totals["full_sync"] += 1
+                return False
+            self._totals["dropped"] += 1
+            logger.warning("write-behind queue full (%d sessions), dropped update for %s: %s",
+                           len(self._pending), key, sorted(fields))
+            return True
+        if key in self._pending:
+            self._totals["merged"] += 1
+        line = shared.dumps([key, fields]) + "\n" if self.log_path else None
+        merge(self._pending.setdefault(key, {}), copy.deepcopy(fields))
+        self._totals["queued"] += 1
+        if line is not None:
+            await self._in_log_thread(self._log_append, line)
+        return True
+
+    def peek(self, key: str) -> Optional[Dict]:
+        return self._pending.get(key)
+
+    def pop(self, key: str) -> Optional[Dict]:
+        """Take key's pending fields to write them along with another update."""
+        fields = self._pending.pop(key, None)
+        if fields:
+            self._totals["folded"] += 1
+            self._log_dirty = True
+        return fields
+
+    def restore(self, key: str, fields: Dict):
+        """Put back fields whose write failed, under anything queued since."""
+        self._pending[key] = merge(fields, self._pending.get(key) or {})
+        self._log_dirty = True
+
+    async def _ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._task is not None and self._loop is loop and not self._task.done():
+            return
+        self._loop = loop
+        self._lock = asyncio.Lock()
+        # a fresh context: flushes belong to no request (trace id, round-trip counter)
+        self._task = loop.create_task(self._run(), context=contextvars.Context())
+        if self.log_path and not self._log_opened:
+            self._log_opened = True
+            await self._replay_logs()
+
+    async def start(self):
+        """Replay logs left by dead processes and start the flusher."""
+        await self._ensure_running()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning("write-behind flush failed: %r", e)
+
+    async def flush(self) -> bool:
+        """Write everything pending; False if a batch failed (it stays queued)."""
+        async with self._lock:
+            while self._pending:
+                keys = list(self._pending)[:self.batch]
+                batch = [(key, self._pending.pop(key)) for key in keys]
+                t0 = time.perf_counter()
+                try:
+                    await self._write(batch)
+                except asyncio.CancelledError:
+                    # shutdown while writing: close() writes the batch again
+                    for key, fields in batch:
+                        self.restore(key, fields)
+                    raise
+                except Exception as e:
+                    self._totals["write_errors"] += 1
+                    self._totals["requeued"] += len(batch)
+                    logger.warning("write-behind: writing %d sessions failed, retrying in %.0f ms: %r",
+                                   len(batch), self.interval * 1000, e)
+                    for key, fields in batch:
+                        self.restore(key, fields)
+                    return False
+                self._flush_timing.add(time.perf_counter() - t0)
+                self._totals["flushes"] += 1
+                self._totals["written"] += len(batch)
+                self._log_dirty = True
+            if self._log_dirty:
+                await self._compact()
+            return True
+
+    async def close(self):
+        """Stop the flusher and write what is left (app shutdown)."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._task = None
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        if not await self.flush():
+            logger.warning("write-behind: %d sessions not written at shutdown%s", len(self._pending),
+                           " (kept in the log)" if self._log_opened else "")
+        if self._log_opened:
+            self._log_opened = False
+            await self._in_log_thread(self._close_log, not self._pending)
+
+    # --- durability log -------------------------------------------------------
+
+    def _own_log(self) -> str:
+        return f"{self.log_path}.{os.getpid()}"
+
+    async def _in_log_thread(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._log_io, fn, *args)
+
+    async def _replay_logs(self):
+        records, claimed = await self._in_log_thread(self._claim_logs)
+        for key, fields in records:
+            merge(self._pending.setdefault(key, {}), fields)
+            self._totals["replayed"] += 1
+        if claimed:
+            logger.info("write-behind: replaying %d updates for %d sessions from %d logs",
+                        self._totals["replayed"], len(self._pending), len(claimed))
+        await self._compact()
+        for path in claimed:
+            await self._in_log_thread(os.remove, path)
+
+    def _claim_logs(self) -> Tuple[List[Tuple[str, Dict]], List[str]]:
+        """Take over the logs of dead processes: (their records, the renamed files)."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.log_path)), exist_ok=True)
+        claimed = []
+        for path in glob.glob(glob.escape(self.log_path) + ".*"):
+            suffix = path[len(self.log_path) + 1:]
+            if not suffix.isdigit():
+                continue
+            pid = int(suffix)
+            # a restarted container can reuse the dead process's pid: our own name is ours to replay
+            if pid != os.getpid() and _pid_alive(pid):
+                continue
+            mine = f"{path}.replay{os.getpid()}"
+            try:
+                os.rename(path, mine)  # another starting worker may claim it first
+            except OSError:
+                continue
+            claimed.append(mine)
+        records = []
+        for path in claimed:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        records.append(tuple(shared.loads(line)))
+                    except ValueError:
+                        continue  # torn last line
+        return records, claimed
+
+    async def _compact(self):
+        """Rewrite the log to hold just what is still pending."""
+        self._log_dirty = False
+        if not self.log_path:
+            return
+        # serialized here: the log thread must not read _pending while the loop changes it
+        lines = [shared.dumps([key, fields]) + "\n" for key, fields in self._pending.items()]
+        await self._in_log_thread(self._rewrite_log, lines)
+
+    # the methods below run on the log thread
+
+    def _log_append(self, line: str):
+        if self._log is None:
+            return
+        self._log.write(line)
+        self._log.flush()
+        if self.fsync:
+            os.fsync(self._log.fileno())
+
+    def _rewrite_log(self, lines: List[str]):
+        path = self._own_log()
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.writelines(lines)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+        if self._log is not None:
+            self._log.close()
+        self._log = open(path, "a", encoding="utf-8")
+
+    def _close_log(self, remove: bool):
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+        if remove:
+            os.remove(self._own_log())
+
+    def stats(self) -> Dict:
+        return dict(self._totals, pending=len(self._pending), interval_ms=self.interval * 1000,
+                    full_policy=self.full_policy, log=bool(self.log_path), flush=self._flush_timing.stats())
@@ -0,0 +1,130 @@
+"""Measure worker cold start with and without the startup warm-up.
+
+    cd backend && python -m bench.coldstart [--runs 3 --modes none db,llm,tts]
+
+Each run starts a fresh uvicorn worker (against app/fakes.py, so no OpenAI, MongoDB
+or TTS engine is needed) and records, from process spawn:
+  live   - /healthz answers (imports and startup done, accepting connections)
+  ready  - /readyz answers 200 (warm-up finished)
+  first  - the first interview turn succeeded: /start_session, /answer (text), /tts
+           of the opening question, each timed on its own
+and then the same turn once more, warm, for comparison. Connection setup to the
+fake OpenAI API costs --connect-ms per new connection, as TLS would.
+"""
+import os
+import sys
+import time
+import socket
+import argparse
+import subprocess
+import statistics
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+TURN = ("/start_session", "/answer", "/tts")
+
+
+def serve(args):
+    """Child process: a single uvicorn worker over the fakes."""
+    os.environ.setdefault("OPENAI_API_KEY", "bench")
+    from app import fakes
+
+    fakes.install(
+        openai=fakes.FakeOpenAI(latency=args.llm_latency_ms / 1000, jitter=0, done_rate=0.0,
+                                connect_latency=args.connect_ms / 1000),
+        mongo=fakes.FakeMongoClient(latency=args.db_latency_ms / 1000),
+        tts_engine=fakes.FakeTTS(seconds_per_char=args.tts_ms_per_char / 1000),
+    )
+    import uvicorn
+
+    uvicorn.run("app.main:app", host="127.0.0.1", port=args.port, log_level="warning")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait(client, path: str, t0: float, timeout: float = 60) -> float:
+    import httpx
+
+    while time.perf_counter() - t0 < timeout:
+        try:
+            if client.get(path).status_code == 200:
+                return (time.perf_counter() - t0) * 1000
+        except httpx.TransportError:
+            pass
+        time.sleep(0.005)
+    raise TimeoutError(f"{path} not OK after {timeout}s")
+
+
+def _turn(client) -> Dict[str, float]:
+    out = {}
+    t = time.perf_counter()
+    start = client.post("/start_session", json={"patient_name": "cold"})
+    start.raise_for_status()
+    out["/start_session"] = (time.perf_counter() - t) * 1000
+    t = time.perf_counter()
+    client.post("/answer", data={"session_id": start.json()["session_id"], "question": start.json()["first_question"],
+                                 "text": "I just haven't been feeling well lately", "no_cache": "true"}).raise_for_status()
+    out["/answer"] = (time.perf_counter() - t) * 1000
+    t = time.perf_counter()
+    client.get("/tts", params={"text": start.json()["first_question"]}).raise_for_status()
+    out["/tts"] = (time.perf_counter() - t) * 1000
+    return out
+
+
+def measure(mode: str, args) -> Dict[str, float]:
+    import httpx
+
+    port = _free_port()
+    env = dict(os.environ, WARMUP=mode, TTS_PRERENDER="1")
+    cmd = [sys.executable, "-m", "bench.coldstart", "--serve", "--port", str(port),
+           "--connect-ms", str(args.connect_ms), "--llm-latency-ms", str(args.llm_latency_ms),
+           "--db-latency-ms", str(args.db_latency_ms), "--tts-ms-per-char", str(args.tts_ms_per_char)]
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, env=env, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=30) as client:
+            row = {"live": _wait(client, "/healthz", t0), "ready": _wait(client, "/readyz", t0)}
+            first = _turn(client)
+            row["first"] = (time.perf_counter() - t0) * 1000
+            row.update({f"cold {k}": v for k, v in first.items()})
+            row.update({f"warm {k}": v for k, v in _turn(client).items()})
+            return row
+    finally:
+        proc.terminate()
+        proc.wait(10)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--modes", nargs="+", default=["none", "db,llm,tts"], help="WARMUP values to compare")
+    parser.add_argument("--connect-ms", type=float, default=150, help="cost of a new connection to the LLM API")
+    parser.add_argument("--llm-latency-ms", type=float, default=600)
+    parser.add_argument("--db-latency-ms", type=float, default=2)
+    parser.add_argument("--tts-ms-per-char", type=float, default=4)
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        return serve(args)
+
+    results: Dict[str, Dict[str, List[float]]] = {}
+    for mode in args.modes:
+        for _ in range(args.runs):
+            for key, value in measure(mode, args).items():
+                results.setdefault(mode, {}).setdefault(key, []).append(value)
+
+    columns = ["live", "ready", "first"] + [f"{state} {p}" for state in ("cold", "warm") for p in TURN]
+    print("median ms over", args.runs, "runs, from process spawn (live/ready/first) or per request")
+    print(f"{'WARMUP':<12}" + "".join(f"{c.replace('/', '').replace('_session', ''):>13}" for c in columns))
+    for mode, row in results.items():
+        print(f"{mode or 'none':<12}" + "".join(f"{statistics.median(row[c]):>13.1f}" for c in columns))
+
+
+if __name__ == "__main__":
+    main()
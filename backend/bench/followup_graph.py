@@ -0,0 +1,151 @@
+"""LLM calls and latency of the follow-up phase with and without the question graphs.
+
+    cd backend && python -m bench.followup_graph [--sessions 200 --llm-latency-ms 600]
+
+Virtual patients fill a cardiac or dental questionnaire at random and answer the
+follow-up questions (the frontend's opening question, then /followup_answer until
+done or 5 questions) with a mix of yes, no and free text, like the frontend's
+PostFormFollowUp. Runs against app/fakes.py, three times over the same patients:
+
+  off    FOLLOWUP_GRAPH_MODE=off: every turn asks the LLM
+  seed   the graphs shipped in app/followup_graphs
+  built  graphs mined by `app.followup_graph build` from the "off" run's logged
+         sessions, on top of the seed branches (written to a temp dir only)
+
+and reports LLM calls per follow-up turn, the reduction against "off", and the
+p50/p95 latency of /followup_answer. The LLM response cache is bypassed so runs
+don't feed each other. The fake LLM always asks the same follow-up question, so
+"built" only shows the builder end to end; its numbers say little about real logs.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("TTS_PRERENDER", "0")
+os.environ.setdefault("WARMUP", "none")
+
+from bench.loadtest import summarize  # noqa: E402
+
+OPENERS = {
+    "cardiac": "Do you have a family history of heart disease or cardiac problems?",
+    "dentistry": "Have you had any previous dental treatments that you think might be related to this issue?",
+}
+CHOICE_FIELDS = {
+    "cardiac": {"chestPain": ["yes", "no"], "chestPainOnExertion": ["yes", "no", "unsure"], "palpitations": ["yes", "no"],
+                "shortnessBreath": ["yes", "no"], "fainting": ["yes", "no"]},
+    "dentistry": {"hasPain": ["yes", "no"], "temperatureSensitivity": ["hot", "cold", "both", "neither"],
+                  "spontaneousPain": ["yes", "no"], "throbbingPain": ["yes", "no"], "bitingPain": ["yes", "no"],
+                  "grindingClenching": ["yes", "maybe", "no"], "trauma": ["yes", "no"], "recentTreatment": ["yes", "no"]},
+}
+ANSWERS = ["Yes, I think so", "No", "Not really", "Yes", "It's hard to say, maybe a little",
+           "Mostly in the evenings after work", "About twice a week"]
+
+
+def patients(n: int, seed: int) -> List[Dict]:
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        form_type = "cardiac" if i % 2 else "dentistry"
+        form = {field: rng.choice(values) for field, values in CHOICE_FIELDS[form_type].items()}
+        form.update(fullName=f"Patient {i}", submittedAt="2026-10-17T09:41:12.402Z")
+        out.append({"form_type": form_type, "form": form, "answers": [rng.choice(ANSWERS) for _ in range(6)]})
+    return out
+
+
+async def _session(client, patient: Dict, latencies: List[float]) -> int:
+    resp = await client.post("/start_session", json={"patient_name": "bench",
+                                                      "domain_questions": [OPENERS[patient["form_type"]]]})
+    session_id, question = resp.json()["session_id"], resp.json()["first_question"]
+    turns = 0
+    for answer in patient["answers"][:5]:
+        t0 = time.perf_counter()
+        resp = await client.post("/followup_answer", data={
+            "session_id": session_id, "question": question, "text": answer, "form_data": json.dumps(patient["form"]),
+            "no_cache": "true"})
+        latencies.append((time.perf_counter() - t0) * 1000)
+        resp.raise_for_status()
+        turns += 1
+        if resp.json().get("done") or not resp.json().get("next_question"):
+            break
+        question = resp.json()["next_question"]
+    return turns
+
+
+async def run(mode: str, graphs_dir: str, cohort: List[Dict], args) -> Dict:
+    import httpx
+    from app import fakes, followup_graph
+    from app.main import app
+
+    followup_graph.FOLLOWUP_GRAPH_MODE = "off" if mode == "off" else "on"
+    followup_graph.FOLLOWUP_GRAPH_DIR = graphs_dir
+    followup_graph.set_graphs(None)
+    fake = fakes.install(
+        openai=fakes.FakeOpenAI(latency=args.llm_latency_ms / 1000, jitter=args.llm_latency_ms / 5000,
+                                done_rate=args.done_rate, seed=args.seed),
+        mongo=fakes.FakeMongoClient(latency=0.002),
+    )
+    from app import session_store
+    session_store.set_store(None)
+    await app.router.startup()
+    latencies: List[float] = []
+    sem = asyncio.Semaphore(args.concurrency)
+    async with httpx.AsyncClient(app=app, base_url="http://bench", timeout=120) as client:
+        async def one(patient):
+            async with sem:
+                return await _session(client, patient, latencies)
+
+        turns = sum(await asyncio.gather(*(one(p) for p in cohort)))
+    logged = await followup_graph.logged_sessions()
+    await app.router.shutdown()
+    calls = fake["openai"].calls["chat"] + fake["openai"].calls["stream"]
+    return {"turns": turns, "llm_calls": calls, "latency": summarize(latencies), "logged": logged}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--llm-latency-ms", type=float, default=600)
+    parser.add_argument("--done-rate", type=float, default=0.2, help="chance the fake LLM ends the follow-up")
+    parser.add_argument("--min-support", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    from app import followup_graph
+
+    cohort = patients(args.sessions, args.seed)
+    seed_dir = followup_graph.FOLLOWUP_GRAPH_DIR
+    results = {"off": asyncio.run(run("off", seed_dir, cohort, args))}
+    results["seed"] = asyncio.run(run("seed", seed_dir, cohort, args))
+
+    with tempfile.TemporaryDirectory() as built_dir:
+        for form_type in OPENERS:
+            with open(os.path.join(seed_dir, f"{form_type}.json")) as f:
+                previous = json.load(f)
+            logged = [doc for doc in results["off"]["logged"] if (doc.get("followup") or {}).get("form_type") == form_type]
+            graph = followup_graph.build(logged, previous, min_support=args.min_support)
+            with open(os.path.join(built_dir, f"{form_type}.json"), "w") as f:
+                json.dump(graph, f)
+            built = sum(1 for b in graph["branches"] if b.get("source") == "built")
+            print(f"built {form_type} v{graph['version']}: {built} mined branches from {len(logged)} sessions")
+        results["built"] = asyncio.run(run("built", built_dir, cohort, args))
+
+    base = results["off"]["llm_calls"] / max(1, results["off"]["turns"])
+    print(f"\n{'graphs':<8} {'turns':>6} {'llm calls':>10} {'per turn':>9} {'reduction':>10} {'p50 ms':>8} {'p95 ms':>8}")
+    for mode, r in results.items():
+        per_turn = r["llm_calls"] / max(1, r["turns"])
+        print(f"{mode:<8} {r['turns']:>6} {r['llm_calls']:>10} {per_turn:>9.2f} {1 - per_turn / base:>10.1%} "
+              f"{r['latency']['p50_ms']:>8.1f} {r['latency']['p95_ms']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
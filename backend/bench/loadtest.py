@@ -0,0 +1,274 @@
+"""Load test the API in-process against local fakes (no OpenAI, MongoDB or TTS engine).
+
+    cd backend
+    python -m bench.loadtest --sessions 200 --concurrency 20 --out results/base.json
+    # ...change something...
+    python -m bench.loadtest --sessions 200 --concurrency 20 --out results/new.json --compare results/base.json
+
+Each virtual patient runs a scripted interview: /start_session, spoken answers
+(/transcribe, then /answer with the transcription_id) or typed ones, /tts for every
+question, then /followup_answer until the model is done. Latencies are reported
+per endpoint (client side) and per stage (from the Server-Timing header). The
+fakes' latency and jitter are configurable, so runs are repeatable with --seed.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import datetime
+import subprocess
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# module-level settings are read at import time
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("TTS_PRERENDER", "0")
+
+from app.fakes import SCRIPTS  # noqa: E402
+
+FORM_DATA = {"fullName": "Bench Patient", "age": "54", "symptoms": "intermittent pain", "medications": "none"}
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[k]
+
+
+def summarize(samples: List[float]) -> Dict:
+    values = sorted(samples)
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values), 2) if values else 0.0,
+        "p50_ms": round(percentile(values, 50), 2),
+        "p95_ms": round(percentile(values, 95), 2),
+        "p99_ms": round(percentile(values, 99), 2),
+        "max_ms": round(values[-1], 2) if values else 0.0,
+    }
+
+
+class Recorder:
+    def __init__(self):
+        self.endpoints: Dict[str, List[float]] = defaultdict(list)
+        self.stages: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.sessions = 0
+
+    def record(self, endpoint: str, elapsed_ms: float, resp):
+        self.endpoints[endpoint].append(elapsed_ms)
+        if resp.status_code >= 400:
+            self.errors[endpoint][str(resp.status_code)] += 1
+        for item in filter(None, (resp.headers.get("server-timing") or "").split(",")):
+            name, _, dur = item.strip().partition(";dur=")
+            try:
+                self.stages[f"{endpoint} {name}"].append(float(dur))
+            except ValueError:
+                pass
+
+
+async def _call(client, rec: Recorder, method: str, endpoint: str, **kwargs):
+    t0 = time.perf_counter()
+    resp = await client.request(method, endpoint, **kwargs)
+    rec.record(endpoint, (time.perf_counter() - t0) * 1000, resp)
+    return resp
+
+
+async def run_session(client, rec: Recorder, n: int, args, rng: random.Random):
+    from app.fakes import silent_wav
+
+    script = SCRIPTS[n % len(SCRIPTS)]
+    resp = await _call(client, rec, "POST", "/start_session", json={"patient_name": f"patient-{n}"})
+    if resp.status_code != 200:
+        return
+    session_id = resp.json()["session_id"]
+    question = resp.json()["first_question"]
+    answer_route = "/answer/stream" if args.stream else "/answer"
+
+    for turn, answer in enumerate(script):
+        if args.tts:
+            await _call(client, rec, "GET", "/tts", params={"text": question})
+        data = {"session_id": session_id, "question": question}
+        if rng.random() < args.audio_ratio:
+            # every recording is unique, so the transcription cache only helps the /answer re-use
+            clip = silent_wav(0.5 + rng.random()) + f"{n}-{turn}".encode()
+            resp = await _call(client, rec, "POST", "/transcribe", files={"audio": ("answer.wav", clip, "audio/wav")},
+                               data={"session_id": session_id, "question": question} if args.prefetch else None)
+            if resp.status_code != 200:
+                return
+            data["transcription_id"] = resp.json()["transcription_id"]
+            # the patient reads the transcript back before submitting it
+            await asyncio.sleep(args.review_ms / 1000)
+        else:
+            data["text"] = answer
+        resp = await _call(client, rec, "POST", answer_route, data=data)
+        if resp.status_code != 200:
+            return
+        result = _final_event(resp.text) if args.stream else resp.json()
+        if args.stream and result.get("ttft_ms") is not None:
+            rec.stages[f"{answer_route} llm_ttft(sse)"].append(result["ttft_ms"])
+        if result.get("done") or not result.get("next_question"):
+            break
+        question = result["next_question"]
+
+    question = "Is there anything else about your symptoms you would like to add?"
+    for _ in range(args.followups):
+        data = {"session_id": session_id, "question": question, "text": rng.choice(script),
+                "form_data": json.dumps(FORM_DATA)}
+        resp = await _call(client, rec, "POST", "/followup_answer", data=data)
+        if resp.status_code != 200 or resp.json().get("done") or not resp.json().get("next_question"):
+            break
+        question = resp.json()["next_question"]
+    rec.sessions += 1
+
+
+def _final_event(body: str) -> Dict:
+    """The `done` event of an SSE answer stream."""
+    for block in body.split("\n\n"):
+        if block.startswith("event: done"):
+            return json.loads(block.split("data: ", 1)[1])
+    return {}
+
+
+async def run(args) -> Dict:
+    import httpx
+    from app import fakes
+    from app.main import app
+
+    fake = fakes.install(
+        openai=fakes.FakeOpenAI(
+            latency=args.llm_latency_ms / 1000, jitter=args.llm_jitter_ms / 1000,
+            stt_latency=args.stt_latency_ms / 1000, done_rate=args.done_rate, seed=args.seed,
+            transcripts=[answer for script in SCRIPTS for answer in script],
+            error_rate=args.llm_error_rate,
+        ),
+        mongo=fakes.FakeMongoClient(latency=args.db_latency_ms / 1000),
+        tts_engine=fakes.FakeTTS(seconds_per_char=args.tts_ms_per_char / 1000),
+    )
+    await app.router.startup()
+    rec = Recorder()
+    rng = random.Random(args.seed)
+    queue: asyncio.Queue = asyncio.Queue()
+    for n in range(args.sessions):
+        queue.put_nowait(n)
+
+    async def worker(client):
+        while not queue.empty():
+            n = queue.get_nowait()
+            await run_session(client, rec, n, args, random.Random(rng.random()))
+
+    started = time.perf_counter()
+    async with httpx.AsyncClient(app=app, base_url="http://bench", timeout=120) as client:
+        await asyncio.gather(*(worker(client) for _ in range(args.concurrency)))
+        wall = time.perf_counter() - started
+        server_stats = (await client.get("/stats")).json()
+    await app.router.shutdown()
+
+    total_requests = sum(len(v) for v in rec.endpoints.values())
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.datetime.utcnow().isoformat() + "Z",
+            "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        },
+        "throughput": {
+            "wall_s": round(wall, 3),
+            "sessions": rec.sessions,
+            "requests": total_requests,
+            "requests_per_s": round(total_requests / wall, 2) if wall else 0.0,
+            "sessions_per_s": round(rec.sessions / wall, 3) if wall else 0.0,
+        },
+        "endpoints": {name: dict(summarize(v), errors=dict(rec.errors.get(name, {}))) for name, v in sorted(rec.endpoints.items())},
+        "stages": {name: summarize(v) for name, v in sorted(rec.stages.items())},
+        "fakes": {"openai": fake["openai"].calls, "tts_renders": fake["tts"].renders},
+        "server_stats": server_stats,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except Exception:
+        return None
+
+
+def print_report(result: Dict):
+    t = result["throughput"]
+    print(f"{t['sessions']} sessions, {t['requests']} requests in {t['wall_s']}s "
+          f"({t['requests_per_s']} req/s, {t['sessions_per_s']} sessions/s)")
+    for title, rows in (("endpoint", result["endpoints"]), ("stage", result["stages"])):
+        print(f"\n{title:<40} {'n':>6} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+        for name, s in rows.items():
+            errors = sum(s.get("errors", {}).values())
+            suffix = f"  ({errors} errors)" if errors else ""
+            print(f"{name:<40} {s['count']:>6} {s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f} {s['p99_ms']:>9.1f} {s['max_ms']:>9.1f}{suffix}")
+    print(f"\nfake OpenAI calls: {result['fakes']['openai']}, TTS renders: {result['fakes']['tts_renders']}")
+
+
+def compare(result: Dict, baseline: Dict, threshold: float, min_delta_ms: float = 1.0) -> bool:
+    """Print p50/p95/p99 changes against a baseline run; True if a p95/p99 regressed by
+    more than threshold (and by at least min_delta_ms, so sub-ms noise doesn't count)."""
+    print(f"\ncompared with {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')}), threshold {threshold:.0%}")
+    regressed = False
+    for section in ("endpoints", "stages"):
+        for name, now in result[section].items():
+            before = baseline.get(section, {}).get(name)
+            if not before:
+                continue
+            cells = []
+            for key in ("p50_ms", "p95_ms", "p99_ms"):
+                change = (now[key] - before[key]) / before[key] if before[key] else 0.0
+                flag = ""
+                if change > threshold and now[key] - before[key] >= min_delta_ms and key != "p50_ms":
+                    flag = " !"
+                    regressed = True
+                cells.append(f"{key[:3]} {before[key]:.1f}->{now[key]:.1f} ({change:+.0%}){flag}")
+            print(f"{name:<40} " + "  ".join(cells))
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-process load test against stubbed OpenAI, Mongo and TTS")
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--followups", type=int, default=2, help="max /followup_answer turns per session")
+    parser.add_argument("--audio-ratio", type=float, default=0.5, help="fraction of answers sent as audio")
+    parser.add_argument("--stream", action="store_true", help="use /answer/stream instead of /answer")
+    parser.add_argument("--no-prefetch", dest="prefetch", action="store_false",
+                        help="don't pass session_id/question to /transcribe (no speculative next question)")
+    parser.add_argument("--review-ms", type=float, default=0, help="pause between /transcribe and /answer")
+    parser.add_argument("--no-tts", dest="tts", action="store_false", help="skip /tts requests")
+    parser.add_argument("--llm-latency-ms", type=float, default=600)
+    parser.add_argument("--llm-jitter-ms", type=float, default=200)
+    parser.add_argument("--stt-latency-ms", type=float, default=800)
+    parser.add_argument("--db-latency-ms", type=float, default=2)
+    parser.add_argument("--tts-ms-per-char", type=float, default=4)
+    parser.add_argument("--done-rate", type=float, default=0.35)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="fraction of OpenAI calls answered with 429")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="write results as JSON")
+    parser.add_argument("--compare", help="baseline JSON from an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.10, help="p95/p99 regression that fails --compare")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="ignore smaller absolute regressions")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    print_report(result)
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2, default=str)
+        print(f"\nwrote {args.out}")
+    if args.compare:
+        with open(args.compare) as f:
+            if compare(result, json.load(f), args.threshold, args.min_delta_ms):
+                sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""Measure the prompts sent for next-question and follow-up calls.
+
+    cd backend && python -m bench.prompt_size [--turns 4]
+
+Builds the messages for scripted sessions at every turn (with realistic
+timestamps and a full saved questionnaire as form_data) and reports tokens per
+call, and how many leading tokens are byte-identical across every call of a kind
+(the part a provider-side prompt cache can reuse). Tokens are counted with
+tiktoken when it is installed, otherwise estimated at ~4 characters per token.
+"""
+import os
+import sys
+import argparse
+import datetime
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+
+from app import prompts  # noqa: E402
+from app.fakes import SCRIPTS  # noqa: E402
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("o200k_base")
+except Exception:  # not installed, or no encoding data offline
+    _ENCODING = None
+
+QUESTIONS = [
+    "What is the main reason for your visit today?",
+    "How long has this been going on?",
+    "Does anyone in your family have a similar problem?",
+    "Is there anything else about your symptoms you would like to add?",
+]
+# what the frontend posts after a cardiac questionnaire was saved
+FORM_DATA = {
+    "type": "cardiac",
+    "clinic": "Cardiology Clinic",
+    "appointmentDate": "2026-10-20",
+    "appointmentTime": "TBD",
+    "chestPain": "yes",
+    "chestPainOnExertion": "yes",
+    "palpitations": "no",
+    "shortnessBreath": "unsure",
+    "fainting": "no",
+    "medications": "Atorvastatin 20mg daily, aspirin",
+    "historyHeartDisease": "father had a heart attack at 60",
+    "submittedAt": "2026-10-17T09:41:12.402Z",
+}
+
+
+def count_tokens(text: str) -> int:
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    return max(1, len(text) // 4)
+
+
+def _flatten(messages: List[Dict]) -> str:
+    return "".join(f"<{m['role']}>{m['content']}" for m in messages)
+
+
+def _sessions(turns: int) -> List[List[Dict]]:
+    start = datetime.datetime(2026, 10, 17, 9, 30)
+    out = []
+    for script in SCRIPTS:
+        qas = []
+        for i in range(turns):
+            qas.append({
+                "question": QUESTIONS[i % len(QUESTIONS)],
+                "answer": script[i % len(script)],
+                "timestamp": start + datetime.timedelta(seconds=37 * len(out) + 21 * i),
+            })
+            out.append(list(qas))
+    return out
+
+
+def _common_prefix(texts: List[str]) -> str:
+    prefix = texts[0]
+    for text in texts[1:]:
+        n = 0
+        for a, b in zip(prefix, text):
+            if a != b:
+                break
+            n += 1
+        prefix = prefix[:n]
+    return prefix
+
+
+def measure(kind: str, builds: List[List[Dict]]) -> Dict:
+    texts = [_flatten(messages) for messages in builds]
+    tokens = [count_tokens(text) for text in texts]
+    return {
+        "kind": kind,
+        "calls": len(texts),
+        "mean_tokens": round(sum(tokens) / len(tokens), 1),
+        "max_tokens": max(tokens),
+        "stable_prefix_tokens": count_tokens(_common_prefix(texts)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=4, help="answers per scripted session")
+    args = parser.parse_args()
+
+    sessions = _sessions(args.turns)
+    rows = [
+        measure("next_question", [prompts.next_question_messages(qas) for qas in sessions]),
+        measure("followup", [prompts.followup_messages(qas, prompts.relevant_form_fields(FORM_DATA, qas)) for qas in sessions]),
+    ]
+    print(f"token counts via {'tiktoken o200k_base' if _ENCODING is not None else '~4 chars/token estimate'}")
+    print(f"{'kind':<16} {'calls':>6} {'mean':>8} {'max':>8} {'stable prefix':>14}")
+    for r in rows:
+        print(f"{r['kind']:<16} {r['calls']:>6} {r['mean_tokens']:>8} {r['max_tokens']:>8} {r['stable_prefix_tokens']:>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""Throughput and cross-worker correctness with 1..N uvicorn workers sharing state.
+
+    cd backend && python -m bench.scaleout [--workers 1 2 4 --sessions 120 --concurrency 24]
+
+For each worker count a fresh `uvicorn --workers N` is started over the fakes
+(app/fakes.py, one set per worker) with SHARED_STATE_URL and SESSION_BACKEND=redis
+pointing at one Redis-compatible server: --redis-url, or by default an in-memory
+fakeredis server in its own process (`pip install fakeredis lupa`). Clients open a
+new connection per request, so consecutive requests of a session land on
+different workers, as behind a load balancer without sticky sessions.
+
+Each virtual patient: /start_session, then per answer /transcribe (audio) and the
+same /answer twice at once with one Idempotency-Key (a double submit). Checked:
+every transcription_id resolves on whichever worker gets the /answer, exactly one
+of each duplicate pair is not a replay, and each session ends with one recorded
+qa per answer. Throughput is answers per second; on a host with fewer cores than
+workers expect it to flatten rather than grow (see the nproc line).
+"""
+import os
+import sys
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+import statistics
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT = ["I've had a sharp pain in my chest when I climb stairs", "About two weeks",
+          "Yes, my father had heart problems"]
+
+
+def fake_app():
+    """uvicorn app factory: runs once in every worker, so each gets its own fakes."""
+    from app import fakes
+
+    latency = float(os.environ.get("BENCH_LLM_LATENCY_MS", "100")) / 1000
+    fakes.install(
+        openai=fakes.FakeOpenAI(latency=latency, jitter=latency / 4, stt_latency=latency, done_rate=0.0,
+                                transcripts=SCRIPT),
+        mongo=fakes.FakeMongoClient(latency=0.002),
+        tts_engine=fakes.FakeTTS(),
+    )
+    from app.main import app
+
+    return app
+
+
+def serve(args):
+    import uvicorn
+
+    uvicorn.run("bench.scaleout:fake_app", factory=True, host="127.0.0.1", port=args.port,
+                workers=args.serve, log_level="warning")
+
+
+def redis_server(port: int):
+    import threading
+    import redis
+    from fakeredis import TcpFakeServer
+    from app.session_store import _REDIS_APPEND
+
+    server = TcpFakeServer(("127.0.0.1", port))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    # fakeredis' TCP server drops the connection after an error reply, so the
+    # NOSCRIPT -> SCRIPT LOAD retry of a first EVALSHA never happens: preload
+    redis.Redis(port=port).script_load(_REDIS_APPEND)
+    threading.Event().wait()
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _spawn(extra: List[str], env: Dict) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, "-m", "bench.scaleout"] + extra, env=env, cwd=BACKEND_DIR)
+
+
+async def _wait_ready(base_url: str, timeout: float = 60):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get("/readyz")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.05)
+    raise TimeoutError(f"{base_url} not ready after {timeout}s")
+
+
+async def _patient(client, n: int, out: Dict):
+    from app.fakes import silent_wav
+
+    resp = await client.post("/start_session", json={"patient_name": f"patient-{n}"})
+    resp.raise_for_status()
+    session_id, question = resp.json()["session_id"], resp.json()["first_question"]
+    answered = 0
+    for turn in range(len(SCRIPT)):
+        clip = silent_wav(0.5) + f"{n}-{turn}".encode()
+        resp = await client.post("/transcribe", files={"audio": ("answer.wav", clip, "audio/wav")})
+        resp.raise_for_status()
+        data = {"session_id": session_id, "question": question, "transcription_id": resp.json()["transcription_id"]}
+        headers = {"Idempotency-Key": f"{session_id}-{turn}"}
+        t0 = time.perf_counter()
+        pair = await asyncio.gather(*(client.post("/answer", data=data, headers=headers) for _ in range(2)))
+        out["latency"].append((time.perf_counter() - t0) * 1000)
+        for r in pair:
+            if r.status_code != 200:
+                out["errors"].append(f"/answer {r.status_code}: {r.text[:80]}")
+        if any(r.status_code != 200 for r in pair):
+            break
+        if sum(r.headers.get("Idempotent-Replayed") != "true" for r in pair) != 1:
+            out["not_deduplicated"] += 1
+        answered += 1
+        out["answers"] += 1
+        result = pair[0].json()
+        if result.get("done") or not result.get("next_question"):
+            break
+        question = result["next_question"]
+    doc = (await client.get(f"/sessions/{session_id}")).json()
+    if doc.get("qa_count") != answered:
+        out["errors"].append(f"{session_id}: qa_count {doc.get('qa_count')} != {answered}")
+
+
+async def _load(base_url: str, args) -> Dict:
+    import httpx
+
+    out: Dict = {"answers": 0, "not_deduplicated": 0, "latency": [], "errors": []}
+    # no keep-alive: every request is a new connection, accepted by any worker
+    limits = httpx.Limits(max_keepalive_connections=0)
+    sem = asyncio.Semaphore(args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        async def one(n: int):
+            async with sem:
+                try:
+                    await _patient(client, n, out)
+                except Exception as e:
+                    out["errors"].append(repr(e))
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(n) for n in range(args.sessions)))
+        out["seconds"] = time.perf_counter() - t0
+        pids = {(await client.get("/healthz")).json()["pid"] for _ in range(8 * args.max_workers)}
+    out["pids"] = len(pids)
+    return out
+
+
+def measure(workers: int, redis_url: str, args) -> Dict:
+    port = _free_port()
+    env = dict(os.environ, OPENAI_API_KEY="bench", SHARED_STATE_URL=redis_url, SESSION_BACKEND="redis",
+               SESSION_REDIS_URL=redis_url, SHARED_STATE_PREFIX=f"scaleout{workers}:", TTS_PRERENDER="0",
+               BENCH_LLM_LATENCY_MS=str(args.llm_latency_ms), LOG_LEVEL="WARNING")
+    proc = _spawn(["--serve", str(workers), "--port", str(port)], env)
+    try:
+        base_url = f"http://127.0.0.1:{port}"
+        asyncio.run(_wait_ready(base_url))
+        return asyncio.run(_load(base_url, args))
+    finally:
+        proc.terminate()
+        proc.wait(20)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--sessions", type=int, default=120)
+    parser.add_argument("--concurrency", type=int, default=24, help="patients in flight at once")
+    parser.add_argument("--llm-latency-ms", type=float, default=100, help="fake LLM and STT latency")
+    parser.add_argument("--redis-url", help="use this server instead of a local fakeredis one")
+    parser.add_argument("--serve", type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument("--redis-server", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.serve:
+        return serve(args)
+    if args.redis_server:
+        return redis_server(args.port)
+    args.max_workers = max(args.workers)
+
+    redis_proc = None
+    redis_url = args.redis_url
+    if not redis_url:
+        port = _free_port()
+        redis_proc = _spawn(["--redis-server", "--port", str(port)], dict(os.environ))
+        redis_url = f"redis://127.0.0.1:{port}/0"
+        time.sleep(1.0)
+    try:
+        print(f"nproc={os.cpu_count()} sessions={args.sessions} concurrency={args.concurrency} "
+              f"llm_latency={args.llm_latency_ms:.0f}ms redis={'fakeredis' if redis_proc else redis_url}")
+        print(f"{'workers':>7} {'pids':>5} {'answers/s':>10} {'p50 ms':>8} {'p95 ms':>8} {'dup ok':>7} {'errors':>7}")
+        failed = False
+        for workers in args.workers:
+            r = measure(workers, redis_url, args)
+            lat = sorted(r["latency"]) or [0.0]
+            dedup = "yes" if not r["not_deduplicated"] else f"{r['not_deduplicated']} no"
+            print(f"{workers:>7} {r['pids']:>5} {r['answers'] / r['seconds']:>10.1f} {statistics.median(lat):>8.1f} "
+                  f"{lat[int(0.95 * (len(lat) - 1))]:>8.1f} {dedup:>7} {len(r['errors']):>7}")
+            for error in r["errors"][:5]:
+                print("   ", error)
+            failed = failed or bool(r["errors"] or r["not_deduplicated"])
+    finally:
+        if redis_proc is not None:
+            redis_proc.terminate()
+            redis_proc.wait(10)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Measure what the telemetry layer costs per instrumented stage.
+
+    cd backend && python -m bench.telemetry_overhead [--iterations 200000]
+
+Compares an empty loop with `with span(...)` (outside a request, and inside one
+with a span list the way TraceMiddleware sets it up) and with the print-based
+[TIMER] lines it replaced (written to /dev/null, so this understates a real tty).
+"""
+import os
+import sys
+import time
+import argparse
+import contextlib
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import telemetry  # noqa: E402
+
+
+def _bench(fn, iterations: int) -> float:
+    t0 = time.perf_counter()
+    fn(iterations)
+    return (time.perf_counter() - t0) / iterations * 1e9
+
+
+def _baseline(n):
+    for _ in range(n):
+        pass
+
+
+def _span(n):
+    for _ in range(n):
+        with telemetry.span("llm", "/answer"):
+            pass
+
+
+def _span_in_request(n):
+    spans = []
+    token = telemetry._spans.set(spans)
+    try:
+        for _ in range(n):
+            with telemetry.span("llm", "/answer"):
+                pass
+            if len(spans) > 16:
+                spans.clear()
+    finally:
+        telemetry._spans.reset(token)
+
+
+def _print_timer(n):
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(n):
+            t0 = time.time()
+            print(f"[TIMER] /answer OpenAI LLM call ({time.time() - t0:.2f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=200000)
+    args = parser.parse_args()
+
+    baseline = _bench(_baseline, args.iterations)
+    rows = [
+        ("span()", _bench(_span, args.iterations)),
+        ("span() inside a request", _bench(_span_in_request, args.iterations)),
+        ("print [TIMER] to /dev/null", _bench(_print_timer, args.iterations)),
+    ]
+    print(f"{'case':<30} {'ns/op':>10}")
+    for name, ns in rows:
+        print(f"{name:<30} {ns - baseline:>10.0f}")
+    started = time.perf_counter()
+    telemetry.render_prometheus()
+    print(f"render /metrics: {(time.perf_counter() - started) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""/answer latency with session outcome writes inline vs. queued, and what the queue loses.
+
+    cd backend && python -m bench.write_behind [--sessions 200 --db-latency-ms 20]
+
+Virtual patients type bench.loadtest's scripted answers (/start_session, then
+/answer until the fake LLM is done) against app/fakes.py, twice over the same
+script:
+
+  sync     WRITE_BEHIND_ENABLED=0: /answer waits for its done/form_type $set
+  queued   the write-behind queue (app/write_behind.py), flushed every
+           --interval-ms and on shutdown
+
+After each run's shutdown every session document is checked against the last
+/answer response (done, form_type) and the answer count; "lost" counts those
+that don't match. A third check kills a process holding queued updates
+(os._exit, no shutdown) with WRITE_BEHIND_LOG set and has a new queue replay
+its log. --max-pending/--full-policy exercise a full queue.
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from typing import Dict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("TTS_PRERENDER", "0")
+os.environ.setdefault("WARMUP", "none")
+
+from app.fakes import SCRIPTS  # noqa: E402
+from bench.loadtest import summarize  # noqa: E402
+
+
+async def _session(client, n: int, out: Dict):
+    resp = await client.post("/start_session", json={"patient_name": f"patient-{n}"})
+    session_id, question = resp.json()["session_id"], resp.json()["first_question"]
+    answered, last = 0, {}
+    for answer in SCRIPTS[n % len(SCRIPTS)]:
+        t0 = time.perf_counter()
+        resp = await client.post("/answer", data={"session_id": session_id, "question": question, "text": answer,
+                                                  "no_cache": "true"})
+        out["latency"].append((time.perf_counter() - t0) * 1000)
+        resp.raise_for_status()
+        answered += 1
+        last = resp.json()
+        if last.get("done") or not last.get("next_question"):
+            break
+        question = last["next_question"]
+    out["expected"][session_id] = (answered, bool(last.get("done")), last.get("form_type"))
+
+
+async def run(mode: str, args) -> Dict:
+    import httpx
+    from app import fakes, session_store, write_behind
+    from app.main import app
+
+    fake = fakes.install(
+        openai=fakes.FakeOpenAI(latency=args.llm_latency_ms / 1000, jitter=args.llm_latency_ms / 5000,
+                                done_rate=args.done_rate, seed=args.seed),
+        mongo=fakes.FakeMongoClient(latency=args.db_latency_ms / 1000),
+    )
+    store = session_store.MongoSessionStore(queue_writes=mode == "queued")
+    if mode == "queued":
+        store._queue = write_behind.WriteBehindQueue(store._bulk_set, interval_ms=args.interval_ms,
+                                                     max_pending=args.max_pending, full_policy=args.full_policy)
+    session_store.set_store(session_store.FallbackSessionStore(store, session_store.MemorySessionStore()))
+    await app.router.startup()
+    out: Dict = {"latency": [], "expected": {}}
+    sem = asyncio.Semaphore(args.concurrency)
+    async with httpx.AsyncClient(app=app, base_url="http://bench", timeout=120) as client:
+        async def one(n: int):
+            async with sem:
+                await _session(client, n, out)
+
+        await asyncio.gather(*(one(n) for n in range(args.sessions)))
+    await app.router.shutdown()
+    stats = store.stats()
+    session_store.set_store(None)
+
+    docs = {d["session_id"]: d for d in fake["mongo"].get_default_database()["sessions"].docs}
+    lost = 0
+    for session_id, (answered, done, form_type) in out["expected"].items():
+        doc = docs.get(session_id, {})
+        if (doc.get("qa_count"), bool(doc.get("done")), doc.get("form_type")) != (answered, done, form_type):
+            lost += 1
+    return {"latency": summarize(out["latency"]), "sessions": len(out["expected"]), "lost": lost,
+            "write_behind": stats.get("write_behind") or {}}
+
+
+def crash_child(log_path: str, n: int):
+    """Queue n updates that are never flushed, then die without shutting down."""
+    from app.write_behind import WriteBehindQueue
+
+    async def never(batch):
+        raise ConnectionError("DB unreachable")
+
+    async def main():
+        queue = WriteBehindQueue(never, interval_ms=60_000, log_path=log_path, fsync=True)
+        for i in range(n):
+            await queue.put(f"s{i}", {"done": True, "form_type": "cardiac"})
+            await queue.put(f"s{i}", {"followup": {"form_type": "cardiac", "done": False}})
+            await queue.put(f"s{i}", {"followup.done": True})
+        os._exit(1)
+
+    asyncio.run(main())
+
+
+def crash_check(n: int) -> Dict:
+    from app.write_behind import WriteBehindQueue
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log_path = os.path.join(tmp, "sessions.log")
+        subprocess.run([sys.executable, "-m", "bench.write_behind", "--crash-child", log_path, "--sessions", str(n)],
+                       cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        written: Dict[str, Dict] = {}
+
+        async def write(batch):
+            written.update(batch)
+
+        async def replay():
+            queue = WriteBehindQueue(write, log_path=log_path)
+            await queue.start()
+            await queue.close()
+            return queue.stats()
+
+        stats = asyncio.run(replay())
+        expected = {"done": True, "form_type": "cardiac", "followup": {"form_type": "cardiac", "done": True}}
+        recovered = sum(1 for fields in written.values() if fields == expected)
+        return {"queued": n, "recovered": recovered, "replayed_lines": stats["replayed"],
+                "logs_left": [p for p in os.listdir(tmp) if os.path.getsize(os.path.join(tmp, p))]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--llm-latency-ms", type=float, default=200)
+    parser.add_argument("--db-latency-ms", type=float, default=20)
+    parser.add_argument("--done-rate", type=float, default=0.35)
+    parser.add_argument("--interval-ms", type=float, default=200)
+    parser.add_argument("--max-pending", type=int, default=10000)
+    parser.add_argument("--full-policy", default="sync", choices=["sync", "drop"])
+    parser.add_argument("--seed", type=int, default=3)
+    parser.add_argument("--crash-child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.crash_child:
+        return crash_child(args.crash_child, args.sessions)
+
+    results = {mode: asyncio.run(run(mode, args)) for mode in ("sync", "queued")}
+    print(f"sessions={args.sessions} concurrency={args.concurrency} db_latency={args.db_latency_ms:.0f}ms "
+          f"llm_latency={args.llm_latency_ms:.0f}ms interval={args.interval_ms:.0f}ms")
+    print(f"{'writes':<8} {'answers':>8} {'p50 ms':>8} {'p95 ms':>8} {'lost':>5} {'flushes':>8} {'folded':>7} "
+          f"{'full':>5}")
+    for mode, r in results.items():
+        wb = r["write_behind"]
+        full = wb.get("full_sync", 0) + wb.get("dropped", 0)
+        print(f"{mode:<8} {r['latency']['count']:>8} {r['latency']['p50_ms']:>8.1f} {r['latency']['p95_ms']:>8.1f} "
+              f"{r['lost']:>5} {wb.get('flushes', 0):>8} {wb.get('folded', 0):>7} {full:>5}")
+    crash = crash_check(min(args.sessions, 100))
+    print(f"crash replay: {crash['recovered']}/{crash['queued']} sessions recovered from "
+          f"{crash['replayed_lines']} logged updates, non-empty logs left: {crash['logs_left'] or 'none'}")
+    if results["queued"]["lost"] and args.full_policy == "sync" or crash["recovered"] != crash["queued"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+"""Compare per-turn latency of the HTTP flow with the voice WebSocket, in-process against fakes.
+
+    cd backend && python -m bench.ws_turn [--sessions 20 --concurrency 5 --turns 3]
+
+HTTP turn: POST /transcribe (with session_id/question, so the next question is
+prefetched), POST /answer with the transcription_id, GET /tts for the next question.
+WebSocket turn: audio streams as 20 ms PCM frames in real time while the patient
+speaks, then a short pause and an "end" message.
+
+Latency is measured from the moment the answer is complete on the client (upload
+starts / "end" is sent) to the next question's text and to its last audio byte.
+"""
+import os
+import sys
+import json
+import math
+import time
+import random
+import struct
+import asyncio
+import argparse
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("TTS_PRERENDER", "0")
+
+from app.fakes import SCRIPTS  # noqa: E402
+from bench.loadtest import summarize  # noqa: E402
+
+FRAME_MS = 20
+RATE = 16000
+
+
+class ASGIWebSocket:
+    """Minimal in-process WebSocket client speaking ASGI to the app."""
+
+    def __init__(self, app, path: str):
+        self.app = app
+        self.path = path
+        self._in: asyncio.Queue = asyncio.Queue()
+        self._out: asyncio.Queue = asyncio.Queue()
+        self._task = None
+        self.received: asyncio.Queue = asyncio.Queue()  # (arrival time, message)
+        self._reader = None
+
+    async def __aenter__(self):
+        path, _, query = self.path.partition("?")
+        scope = {
+            "type": "websocket", "asgi": {"version": "3.0"}, "scheme": "ws", "path": path,
+            "raw_path": path.encode(), "query_string": query.encode(), "root_path": "", "headers": [],
+            "server": ("bench", 80), "client": ("bench", 1), "subprotocols": [],
+        }
+        self._in.put_nowait({"type": "websocket.connect"})
+        self._task = asyncio.create_task(self.app(scope, self._in.get, self._out.put))
+        accepted = await self._out.get()
+        if accepted["type"] != "websocket.accept":
+            raise RuntimeError(f"websocket rejected: {accepted}")
+        # read continuously, like a browser would, so arrival times are real
+        self._reader = asyncio.create_task(self._read())
+        return self
+
+    async def __aexit__(self, *exc):
+        self._in.put_nowait({"type": "websocket.disconnect", "code": 1000})
+        await asyncio.wait_for(self._task, 10)
+        self._reader.cancel()
+
+    async def send_json(self, data: Dict):
+        await self._in.put({"type": "websocket.receive", "text": json.dumps(data)})
+
+    async def send_bytes(self, data: bytes):
+        await self._in.put({"type": "websocket.receive", "bytes": data})
+
+    async def _read(self):
+        while True:
+            message = await self._out.get()
+            if message["type"] == "websocket.close":
+                decoded = ConnectionError(f"closed {message.get('code')}")
+            elif message.get("bytes") is not None:
+                decoded = message["bytes"]
+            else:
+                decoded = json.loads(message["text"])
+            self.received.put_nowait((time.perf_counter(), decoded))
+
+    async def receive(self):
+        """(arrival time, decoded JSON message (dict) or binary frame (bytes))."""
+        at, message = await self.received.get()
+        if isinstance(message, Exception):
+            raise message
+        return at, message
+
+
+def speech_frames(seconds: float, rng: random.Random) -> List[bytes]:
+    """Voiced PCM frames (a tone with random pitch, so every answer hashes differently)."""
+    step = rng.uniform(0.05, 0.3)
+    n = RATE * FRAME_MS // 1000
+    frames, t = [], 0
+    for _ in range(int(seconds * 1000 / FRAME_MS)):
+        frames.append(b"".join(struct.pack("<h", int(4000 * math.sin((t + i) * step))) for i in range(n)))
+        t += n
+    return frames
+
+
+def pcm_to_wav(frames: List[bytes]) -> bytes:
+    from app.voice_ws import pcm16_to_wav
+    return pcm16_to_wav(b"".join(frames), RATE)
+
+
+async def http_turn(client, session_id: str, question: str, clip: bytes) -> Dict:
+    t0 = time.perf_counter()
+    resp = await client.post("/transcribe", files={"audio": ("answer.wav", clip, "audio/wav")},
+                             data={"session_id": session_id, "question": question})
+    resp = await client.post("/answer", data={"session_id": session_id, "question": question,
+                                              "transcription_id": resp.json()["transcription_id"]})
+    result = resp.json()
+    t_text = time.perf_counter()
+    if result.get("next_question"):
+        await client.get("/tts", params={"text": result["next_question"]})
+    return {"text_ms": (t_text - t0) * 1000, "audio_ms": (time.perf_counter() - t0) * 1000, "result": result}
+
+
+async def ws_turn(ws: ASGIWebSocket, frames: List[bytes], pause_frames: int) -> Dict:
+    for frame in frames:
+        await ws.send_bytes(frame)
+        await asyncio.sleep(FRAME_MS / 1000)
+    silence = b"\x00\x00" * (RATE * FRAME_MS // 1000)
+    for _ in range(pause_frames):
+        await ws.send_bytes(silence)
+        await asyncio.sleep(FRAME_MS / 1000)
+    t0 = time.perf_counter()
+    await ws.send_json({"type": "end"})
+    out: Dict = {}
+    while True:
+        at, message = await ws.receive()
+        if isinstance(message, bytes):
+            continue
+        if message["type"] == "done":
+            out["text_ms"] = (at - t0) * 1000
+            out["result"] = message
+            if not message.get("next_question"):
+                out["audio_ms"] = out["text_ms"]
+                return out
+        elif message["type"] == "audio_end":
+            out["audio_ms"] = (at - t0) * 1000
+            return out
+        elif message["type"] == "error":
+            raise RuntimeError(message)
+
+
+async def run(args) -> Dict:
+    import httpx
+    from app import fakes
+    from app.main import app
+
+    fakes.install(
+        openai=fakes.FakeOpenAI(latency=args.llm_latency_ms / 1000, jitter=args.llm_jitter_ms / 1000,
+                                stt_latency=args.stt_latency_ms / 1000, done_rate=0.0, seed=args.seed,
+                                transcripts=[answer for script in SCRIPTS for answer in script]),
+        mongo=fakes.FakeMongoClient(latency=args.db_latency_ms / 1000),
+        tts_engine=fakes.FakeTTS(seconds_per_char=args.tts_ms_per_char / 1000),
+    )
+    await app.router.startup()
+    samples: Dict[str, List[float]] = {k: [] for k in ("http text", "http audio", "ws text", "ws audio")}
+    sem = asyncio.Semaphore(args.concurrency)
+
+    async def session(client, n: int, mode: str):
+        # distinct audio per mode, or the WS clips would hit the transcripts cached by the HTTP run
+        rng = random.Random(f"{args.seed}-{mode}-{n}")
+        async with sem:
+            start = (await client.post("/start_session", json={"patient_name": f"{mode}-{n}"})).json()
+            question = start["first_question"]
+            if mode == "http":
+                for _ in range(args.turns):
+                    frames = speech_frames(args.speech_s, rng)
+                    # the HTTP client uploads only after the patient stops recording
+                    await asyncio.sleep(args.speech_s)
+                    turn = await http_turn(client, start["session_id"], question, pcm_to_wav(frames))
+                    samples["http text"].append(turn["text_ms"])
+                    samples["http audio"].append(turn["audio_ms"])
+                    question = turn["result"].get("next_question") or question
+                return
+            async with ASGIWebSocket(app, f"/ws/session/{start['session_id']}") as ws:
+                await ws.receive()  # ready
+                await ws.send_json({"type": "start", "question": question, "format": "pcm16", "sample_rate": RATE})
+                for _ in range(args.turns):
+                    turn = await ws_turn(ws, speech_frames(args.speech_s, rng), args.pause_ms // FRAME_MS)
+                    samples["ws text"].append(turn["text_ms"])
+                    samples["ws audio"].append(turn["audio_ms"])
+
+    async with httpx.AsyncClient(app=app, base_url="http://bench", timeout=60) as client:
+        for mode in ("http", "ws"):
+            await asyncio.gather(*(session(client, n, mode) for n in range(args.sessions)))
+        server_stats = (await client.get("/stats")).json()
+    await app.router.shutdown()
+    return {"latency": {name: summarize(v) for name, v in samples.items()},
+            "prefetch": server_stats.get("prefetch"), "ws": server_stats.get("ws")}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=5)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--speech-s", type=float, default=2.0, help="length of each spoken answer")
+    parser.add_argument("--pause-ms", type=int, default=300, help="silence before the client sends end")
+    parser.add_argument("--llm-latency-ms", type=float, default=600)
+    parser.add_argument("--llm-jitter-ms", type=float, default=200)
+    parser.add_argument("--stt-latency-ms", type=float, default=800)
+    parser.add_argument("--db-latency-ms", type=float, default=2)
+    parser.add_argument("--tts-ms-per-char", type=float, default=4)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    print(f"{'per turn':<12} {'n':>5} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for name, s in result["latency"].items():
+        print(f"{name:<12} {s['count']:>5} {s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f} {s['p99_ms']:>9.1f}")
+    print(f"\nprefetch: {result['prefetch']}")
+    print(f"ws: {result['ws']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# module-level settings are read at import time
+os.environ["OPENAI_API_KEY"] = "test"
+os.environ["TTS_PRERENDER"] = "0"
+os.environ["WARMUP"] = "none"
+os.environ["SHARED_STATE_URL"] = ""
+os.environ["SESSION_BACKEND"] = "mongo"
+
+
+def _reset_state():
+    """Drop what one test leaves in module-level caches and per-loop objects."""
+    from app import idempotency, llm_cache, prefetch, scheduler, session_store, shared, transcripts
+    from app.utils import tts
+
+    idempotency._results.clear()
+    llm_cache._cache.clear()
+    transcripts._cache.clear()
+    transcripts._counters.update(dict.fromkeys(transcripts._counters, 0))
+    tts._memory_cache.clear()
+    for speculation in prefetch._pending.values():
+        speculation.task.cancel()
+    prefetch._pending.clear()
+    prefetch._counters.update(dict.fromkeys(prefetch._counters, 0))
+    scheduler._schedulers.clear()
+    session_store.set_store(None)
+    session_store._totals.update(requests=0, round_trips=0)
+    shared.set_redis(None)
+
+
+@pytest.fixture
+def fakes():
+    """The app pointed at app/fakes.py: an instant, deterministic LLM that never
+    ends the interview on its own, and an empty in-memory Mongo."""
+    from app import fakes as app_fakes
+
+    _reset_state()
+    installed = app_fakes.install(
+        openai=app_fakes.FakeOpenAI(latency=0, jitter=0, stt_latency=0, done_rate=0, seed=1),
+        mongo=app_fakes.FakeMongoClient(),
+    )
+    yield installed
+    _reset_state()
+
+
+@pytest.fixture
+async def client(fakes):
+    import httpx
+    from app.main import app
+
+    await app.router.startup()
+    try:
+        async with httpx.AsyncClient(app=app, base_url="http://test", timeout=30) as c:
+            yield c
+    finally:
+        await app.router.shutdown()
+
+
+@pytest.fixture
+def start_session(client):
+    """Start a session through the API; returns (session_id, first_question)."""
+    async def start(**body):
+        resp = await client.post("/start_session", json=dict({"patient_name": "test"}, **body))
+        resp.raise_for_status()
+        return resp.json()["session_id"], resp.json()["first_question"]
+
+    return start
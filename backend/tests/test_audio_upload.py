@@ -0,0 +1,39 @@
+import pytest
+from starlette.formparsers import MultiPartParser
+
+from app import routes
+from app.fakes import silent_wav
+from app.utils import audio_upload
+
+
+@pytest.fixture
+def spooled(monkeypatch):
+    """Record, for each ingested upload, whether it had rolled over to disk."""
+    on_disk = []
+    ingest = routes.ingest_audio
+
+    async def recorded(upload, *args, **kwargs):
+        on_disk.append(getattr(upload.file, "name", None) is not None)
+        return await ingest(upload, *args, **kwargs)
+
+    monkeypatch.setattr(routes, "ingest_audio", recorded)
+    monkeypatch.setattr(audio_upload._AudioMultiPartParser, "max_file_size", 16 * 1024)
+    return on_disk
+
+
+def test_starlette_parser_is_left_alone():
+    assert MultiPartParser.max_file_size == 1024 * 1024
+    assert audio_upload._AudioMultiPartParser.max_file_size == audio_upload.AUDIO_SPOOL_THRESHOLD
+
+
+@pytest.mark.parametrize("seconds, on_disk", [(0.1, False), (2.0, True)])
+async def test_audio_routes_spool_at_the_threshold(client, spooled, seconds, on_disk):
+    wav = silent_wav(seconds)  # 3.2 KB and 64 KB
+    resp = await client.post("/transcribe", files={"audio": ("answer.wav", wav, "audio/wav")})
+    assert resp.status_code == 200
+    assert spooled == [on_disk]
+
+
+async def test_a_non_audio_upload_is_refused(client):
+    resp = await client.post("/transcribe", files={"audio": ("notes.txt", b"hello", "text/plain")})
+    assert resp.status_code == 415
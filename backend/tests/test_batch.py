@@ -0,0 +1,84 @@
+import json
+import asyncio
+
+import pytest
+
+from app import batch, db, fakes as app_fakes, openai_client
+from app.routes import DEFAULT_QUESTIONS
+
+SESSIONS = 40
+
+
+@pytest.fixture
+async def seeded(fakes, monkeypatch):
+    await app_fakes.seed_sessions(db.get_db(), SESSIONS, DEFAULT_QUESTIONS)
+    await openai_client.startup()
+    calls = []
+    retriage = batch._retriage
+
+    async def counted(doc, bypass_cache):
+        calls.append(doc["session_id"])
+        await asyncio.sleep(0.005)
+        return await retriage(doc, bypass_cache)
+
+    monkeypatch.setattr(batch, "_retriage", counted)
+    yield calls
+    await openai_client.shutdown()
+
+
+def _tagged(run_id):
+    docs = db.get_db()["sessions"].docs
+    return {d["session_id"] for d in docs if (d.get("retriage") or {}).get("run_id") == run_id}
+
+
+async def test_full_run_writes_every_session(seeded):
+    totals = await batch.run(run_id="r1", concurrency=4, write_size=5)
+    assert totals == {"processed": SESSIONS, "written": SESSIONS, "failed": 0, "skipped": 0}
+    assert len(_tagged("r1")) == SESSIONS
+    doc = db.get_db()["sessions"].docs[0]
+    assert set(doc["retriage"]) >= {"next_question", "done", "form_type", "local_form_type", "run_id", "at"}
+    assert doc["done"] is False  # the live verdict is left alone
+
+
+async def test_interrupted_run_resumes_from_the_checkpoint(seeded, tmp_path):
+    calls = seeded
+    checkpoint = str(tmp_path / "batch-r2.checkpoint.json")
+    first = asyncio.create_task(batch.run(run_id="r2", concurrency=4, write_size=5, checkpoint_path=checkpoint))
+    while len(calls) < SESSIONS // 2:
+        await asyncio.sleep(0.001)
+    first.cancel()  # a crash mid-run: sessions in flight and unflushed results are lost
+    with pytest.raises(asyncio.CancelledError):
+        await first
+
+    written_before = _tagged("r2")
+    with open(checkpoint) as f:
+        saved = json.load(f)
+    assert 0 < len(written_before) < SESSIONS
+    assert saved["totals"]["written"] == len(written_before)
+    calls_before = list(calls)
+    calls.clear()
+
+    totals = await batch.run(run_id="r2", concurrency=4, write_size=5, checkpoint_path=checkpoint)
+
+    # nothing already written is generated again, and nothing is skipped
+    assert not written_before & set(calls)
+    assert _tagged("r2") == {f"fake-{i}" for i in range(SESSIONS)}
+    assert set(calls_before) | set(calls) == {f"fake-{i}" for i in range(SESSIONS)}
+    assert totals["written"] == SESSIONS and totals["failed"] == 0
+
+
+async def test_rerun_without_checkpoint_skips_tagged_sessions(seeded):
+    calls = seeded
+    await batch.run(run_id="r3", concurrency=4, write_size=5, limit=10)
+    calls.clear()
+    totals = await batch.run(run_id="r3", concurrency=4, write_size=5)
+    assert len(calls) == SESSIONS - 10
+    assert totals["processed"] == SESSIONS - 10
+    assert len(_tagged("r3")) == SESSIONS
+
+
+async def test_checkpoint_of_another_run_is_refused(seeded, tmp_path):
+    checkpoint = str(tmp_path / "batch.checkpoint.json")
+    await batch.run(run_id="r4", concurrency=4, write_size=5, limit=5, checkpoint_path=checkpoint)
+    with pytest.raises(SystemExit):
+        await batch.run(run_id="r5", checkpoint_path=checkpoint)
@@ -0,0 +1,169 @@
+import json
+
+import pytest
+
+from app import followup_graph
+from app.followup_graph import answer_class, build, infer_form_type, load, walk
+
+GRAPH = {
+    "form_type": "cardiac",
+    "version": 2,
+    "fields": ["chestPain", "chestPainOnExertion", "palpitations"],
+    "questions": {
+        "family": "Do you have a family history of heart disease?",
+        "who": "Which relatives were affected?",
+        "pattern": "When do the symptoms occur?",
+        "exercise": "How much do you exercise?",
+        "other": "Any other symptoms?",
+    },
+    "nodes": {"tail": {"ask": "exercise", "next": {"*": {"ask": "other", "next": {"no": {"ask": None}}}}}},
+    "branches": [
+        {"when": {"chestPainOnExertion": "yes"},
+         "root": {"ask": "family", "next": {"yes": {"ask": "who", "next": {"*": {"$ref": "tail"}}},
+                                            "no": {"$ref": "tail"}}}},
+        {"when": {"palpitations": ["yes", "unsure"]},
+         "root": {"ask": "pattern", "next": {"*": {"$ref": "tail"}}}},
+        {"when": {}, "root": {"ask": "family", "next": {"*": {"ask": "pattern"}}}},
+    ],
+}
+EXERTION = {"chestPainOnExertion": "Yes"}
+
+
+def _qas(*pairs):
+    return [{"question": GRAPH["questions"][qid], "answer": answer} for qid, answer in pairs]
+
+
+def _load(tmp_path, graph=GRAPH):
+    path = tmp_path / f"{graph['form_type']}.json"
+    path.write_text(json.dumps(graph))
+    return load(str(path))
+
+
+@pytest.fixture(autouse=True)
+def graphs(tmp_path, monkeypatch):
+    monkeypatch.setattr(followup_graph, "FOLLOWUP_GRAPH_MODE", "on")
+    followup_graph._counters.clear()
+    followup_graph.set_graphs({"cardiac": _load(tmp_path)})
+    yield
+    followup_graph._counters.clear()
+    followup_graph.set_graphs(None)
+
+
+@pytest.mark.parametrize("answer, cls", [
+    ("Yes, my father", "yes"), ("yeah", "yes"), ("I do.", "yes"), ("No", "no"), ("never", "no"),
+    ("I don't think so", "no"), ("Not really", "no"), ("My father did", "*"), ("", "*"), (None, "*"),
+])
+def test_answer_class(answer, cls):
+    assert answer_class(answer) == cls
+
+
+def test_each_answer_picks_the_matching_child():
+    yes = walk("cardiac", _qas(("family", "Yes, my mother")), EXERTION)
+    no = walk("cardiac", _qas(("family", "No")), EXERTION)
+    assert yes == {"next_question": GRAPH["questions"]["who"], "done": False}
+    assert no == {"next_question": GRAPH["questions"]["exercise"], "done": False}
+
+
+def test_a_shared_subtree_is_walked_to_done():
+    qas = _qas(("family", "yes"), ("who", "my uncle, at 50"), ("exercise", "twice a week"), ("other", "no"))
+    assert walk("cardiac", qas, EXERTION) == {"next_question": None, "done": True}
+    assert followup_graph.stats()["cardiac"]["graph_done"] == 1
+
+
+def test_question_wording_is_matched_after_normalization():
+    qas = [{"question": "  do you have a FAMILY history of heart disease ", "answer": "no"}]
+    assert walk("cardiac", qas, EXERTION)["next_question"] == GRAPH["questions"]["exercise"]
+
+
+def test_a_conversation_that_leaves_a_branch_tries_the_next_one():
+    # "who" is only asked after a yes on the exertion branch; the catch-all branch asks "pattern"
+    form = {"chestPainOnExertion": "no"}
+    assert walk("cardiac", _qas(("family", "maybe")), form)["next_question"] == GRAPH["questions"]["pattern"]
+    # on the exertion branch "maybe" is neither yes nor no and there is no "*" child
+    assert walk("cardiac", _qas(("family", "maybe")), EXERTION)["next_question"] == GRAPH["questions"]["pattern"]
+
+
+def test_list_values_in_when_match_any_of_them():
+    form = {"palpitations": "UNSURE"}
+    assert walk("cardiac", _qas(("pattern", "after coffee")), form)["next_question"] == GRAPH["questions"]["exercise"]
+
+
+def test_an_uncovered_conversation_is_left_to_the_llm():
+    qas = _qas(("family", "no"), ("pattern", "mornings"))
+    assert walk("cardiac", qas, {"chestPainOnExertion": "no"}) is None
+    qas = [{"question": "How is your sleep?", "answer": "fine"}]
+    assert walk("cardiac", qas, EXERTION) is None
+    assert followup_graph.stats()["cardiac"]["uncovered"] == 2
+
+
+def test_a_node_past_the_end_of_the_tree_is_uncovered():
+    # the catch-all branch ends at "pattern" without children
+    qas = _qas(("family", "no"), ("pattern", "mornings"))
+    assert walk("cardiac", qas, {}) is None
+
+
+def test_when_the_graph_is_not_consulted():
+    qas = _qas(("family", "no"))
+    assert walk("cardiac", [], EXERTION) is None
+    assert walk("cardiac", qas, EXERTION, max_questions=1) is None
+    assert walk("dentistry", qas, EXERTION) is None
+    assert followup_graph.stats()["dentistry"]["no_graph"] == 1
+
+
+def test_mode_off(monkeypatch):
+    monkeypatch.setattr(followup_graph, "FOLLOWUP_GRAPH_MODE", "off")
+    assert walk("cardiac", _qas(("family", "no")), EXERTION) is None
+
+
+def test_stats_count_llm_calls_saved():
+    walk("cardiac", _qas(("family", "no")), EXERTION)
+    walk("cardiac", [{"question": "How is your sleep?", "answer": "fine"}], EXERTION)
+    stats = followup_graph.stats()
+    assert stats["versions"] == {"cardiac": 2}
+    assert stats["cardiac"]["llm_calls_saved"] == 1 and stats["cardiac"]["reduction"] == 0.5
+
+
+def test_infer_form_type():
+    assert infer_form_type({"type": "Cardiac"}) == "cardiac"
+    assert infer_form_type({"type": "other", "chestPain": "yes", "palpitations": "no"}) == "cardiac"
+    assert infer_form_type({"toothache": "yes"}) is None
+
+
+def test_a_ref_cycle_is_rejected(tmp_path):
+    graph = dict(GRAPH, nodes={"loop": {"ask": "family", "next": {"*": {"$ref": "loop"}}}},
+                 branches=[{"when": {}, "root": {"$ref": "loop"}}])
+    with pytest.raises(ValueError):
+        _load(tmp_path, graph)
+
+
+def test_build_mines_the_common_path_and_keeps_seed_branches():
+    seed = dict(GRAPH, branches=[dict(b, source="seed") for b in GRAPH["branches"][:1]])
+    form = {"palpitations": "yes"}
+    sessions = [{"qas": _qas(("pattern", "at night"), ("exercise", "no")),
+                 "followup": {"form_type": "cardiac", "form": form, "done": True}} for _ in range(5)]
+    graph = build(sessions, seed, min_support=5)
+
+    assert graph["version"] == 3 and graph["sessions"] == 5
+    built = [b for b in graph["branches"] if b["source"] == "built"]
+    assert built[0]["when"] == form and built[0]["support"] == 5
+    assert built[0]["root"] == {"ask": "pattern", "next": {"*": {"ask": "exercise", "next": {"no": {"ask": None, "next": {}}}}}}
+    assert graph["branches"][-1]["source"] == "seed"
+    assert set(graph["questions"]) == {"pattern", "exercise", "family", "who", "other"}
+
+
+def test_build_skips_paths_below_min_support():
+    sessions = [{"qas": _qas(("pattern", "at night")), "followup": {"form": {"palpitations": "yes"}}} for _ in range(4)]
+    graph = build(sessions, {"form_type": "cardiac", "questions": {}, "branches": []}, min_support=5)
+    assert graph["branches"] == [] and graph["questions"] == {}
+
+
+async def test_followup_answer_is_served_from_the_graph(client, start_session, fakes):
+    session_id, _ = await start_session()
+    resp = await client.post("/followup_answer", data={
+        "session_id": session_id, "question": GRAPH["questions"]["family"], "text": "No, nobody",
+        "form_data": json.dumps(EXERTION), "form_type": "cardiac"})
+
+    assert resp.json()["next_question"] == GRAPH["questions"]["exercise"]
+    assert fakes["openai"].calls["chat"] == 0
+    got = (await client.get(f"/sessions/{session_id}")).json()
+    assert got["followup"]["form_type"] == "cardiac"
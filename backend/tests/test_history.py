@@ -0,0 +1,61 @@
+import pytest
+
+from app.session_store import QAS_LIVE_WINDOW
+
+TOTAL = QAS_LIVE_WINDOW + 5
+
+
+@pytest.fixture
+async def answered(client, start_session):
+    """A session answered past the live window; returns (session_id, answers)."""
+    session_id, question = await start_session()
+    answers = [f"Answer {n}" for n in range(TOTAL)]
+    for text in answers:
+        resp = await client.post("/answer", data={"session_id": session_id, "question": question, "text": text})
+        resp.raise_for_status()
+        question = resp.json()["next_question"]
+    return session_id, answers
+
+
+async def test_the_session_keeps_only_the_live_window(client, answered):
+    session_id, answers = answered
+    got = (await client.get(f"/sessions/{session_id}")).json()
+    assert got["qa_count"] == TOTAL
+    assert [qa["answer"] for qa in got["qas"]] == answers[-QAS_LIVE_WINDOW:]
+
+
+async def test_history_pages_through_every_answer(client, answered):
+    session_id, answers = answered
+    seen, offset = [], 0
+    while offset is not None:
+        page = (await client.get(f"/sessions/{session_id}/history", params={"offset": offset, "limit": 7})).json()
+        assert page["offset"] == offset and page["limit"] == 7
+        seen += [qa["answer"] for qa in page["items"]]
+        offset = page["next_offset"]
+    assert seen == answers
+
+
+async def test_a_full_last_page_is_followed_by_an_empty_one(client, answered):
+    session_id, _ = answered
+    page = (await client.get(f"/sessions/{session_id}/history", params={"offset": TOTAL - 5, "limit": 5})).json()
+    assert page["next_offset"] == TOTAL
+    page = (await client.get(f"/sessions/{session_id}/history", params={"offset": TOTAL})).json()
+    assert page["items"] == [] and page["next_offset"] is None
+
+
+async def test_a_new_session_has_an_empty_history(client, start_session):
+    session_id, _ = await start_session()
+    page = (await client.get(f"/sessions/{session_id}/history")).json()
+    assert page == {"session_id": session_id, "items": [], "offset": 0, "limit": 50, "next_offset": None}
+
+
+@pytest.mark.parametrize("params", [{"offset": -1}, {"limit": 0}, {"limit": 201}])
+async def test_bad_paging_params_are_rejected(client, start_session, params):
+    session_id, _ = await start_session()
+    resp = await client.get(f"/sessions/{session_id}/history", params=params)
+    assert resp.status_code == 400
+
+
+async def test_history_of_an_unknown_session(client):
+    resp = await client.get("/sessions/missing/history")
+    assert resp.status_code == 404
@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+from app import triage
+
+
+@pytest.fixture(autouse=True)
+def slow_llm(fakes, monkeypatch):
+    # every answer goes to the (fake) LLM, slowly enough for duplicates to overlap
+    monkeypatch.setattr(triage, "TRIAGE_MODE", "off")
+    fakes["openai"].latency = 0.05
+
+
+@pytest.mark.parametrize("headers", [{}, {"Idempotency-Key": "submit-1"}], ids=["derived-key", "client-key"])
+async def test_concurrent_duplicate_answers_run_once(client, fakes, start_session, headers):
+    session_id, question = await start_session()
+    data = {"session_id": session_id, "question": question, "text": "I keep getting headaches"}
+
+    pair = await asyncio.gather(*(client.post("/answer", data=data, headers=headers) for _ in range(2)))
+
+    assert [r.status_code for r in pair] == [200, 200]
+    assert pair[0].json() == pair[1].json()
+    assert sum(r.headers.get("Idempotent-Replayed") != "true" for r in pair) == 1
+    assert fakes["openai"].calls["chat"] == 1
+    assert (await client.get(f"/sessions/{session_id}")).json()["qa_count"] == 1
+
+
+async def test_a_late_duplicate_is_replayed(client, fakes, start_session):
+    session_id, question = await start_session()
+    data = {"session_id": session_id, "question": question, "text": "My knee hurts when I walk"}
+
+    first = await client.post("/answer", data=data)
+    again = await client.post("/answer", data=data)
+
+    assert again.json() == first.json()
+    assert again.headers.get("Idempotent-Replayed") == "true"
+    assert fakes["openai"].calls["chat"] == 1
+    assert (await client.get(f"/sessions/{session_id}")).json()["qa_count"] == 1
+
+
+async def test_a_different_answer_is_not_deduplicated(client, fakes, start_session):
+    session_id, question = await start_session()
+    for text in ("Yes", "No"):
+        resp = await client.post("/answer", data={"session_id": session_id, "question": question, "text": text})
+        assert resp.headers.get("Idempotent-Replayed") is None
+    assert fakes["openai"].calls["chat"] == 2
+    assert (await client.get(f"/sessions/{session_id}")).json()["qa_count"] == 2
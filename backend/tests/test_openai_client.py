@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+from app.openai_client import _JsonStringField
+
+QUESTION = 'Does it hurt "here" \\ or\tthere?\nSay café \U0001F600 / done'
+REPLY = json.dumps({"summary": "n/a", "next_question": QUESTION, "done": False})
+
+
+def _decode(chunks):
+    field = _JsonStringField("next_question")
+    return "".join(field.feed(chunk) for chunk in chunks), field
+
+
+def test_escapes_are_decoded():
+    text, field = _decode([REPLY])
+    assert text == QUESTION
+    assert field.closed and field.text == REPLY
+
+
+@pytest.mark.parametrize("cut", range(1, len(REPLY)))
+def test_any_split_decodes_the_same(cut):
+    # every cut point, including inside \", \\, \uXXXX and a \uXXXX\uXXXX pair
+    text, field = _decode([REPLY[:cut], REPLY[cut:]])
+    assert text == QUESTION
+    assert field.closed
+
+
+def test_one_char_at_a_time():
+    text, _ = _decode(list(json.dumps({"next_question": "é\U0001F600\\"})))
+    assert text == "é\U0001F600\\"
+
+
+def test_a_split_unicode_escape_is_held_back():
+    field = _JsonStringField("next_question")
+    assert field.feed('{"next_question": "caf\\u00') == "caf"
+    assert field.feed("e9!") == "é!"
+    assert field.feed('\\ud83d') == ""
+    assert field.feed('\\ude00"}') == "\U0001F600"
+
+
+def test_decoding_stops_at_the_end_of_the_field():
+    field = _JsonStringField("next_question")
+    assert field.feed('{"next_question": "Any fever?", "summary": "cough"') == "Any fever?"
+    assert field.closed
+    assert field.feed(', "done": false}') == ""
+    assert json.loads(field.text) == {"next_question": "Any fever?", "summary": "cough", "done": False}
+
+
+def test_nothing_is_emitted_before_the_field():
+    field = _JsonStringField("next_question")
+    assert field.feed('{"summary": "next_question", "next_') == ""
+    assert field.feed('question" :  "Why?"}') == "Why?"
@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+from app import prefetch, triage
+
+
+@pytest.fixture(autouse=True)
+def slow_llm(fakes, monkeypatch):
+    # every answer goes to the (fake) LLM, slowly enough to catch a speculation in flight
+    monkeypatch.setattr(triage, "TRIAGE_MODE", "off")
+    fakes["openai"].latency = 0.05
+
+
+async def _prefetch(client, session_id, question, text):
+    resp = await client.post("/prefetch", data={"session_id": session_id, "question": question, "text": text})
+    assert resp.json() == {"prefetching": True}
+    await asyncio.sleep(0.01)  # the speculative call is now in flight
+
+
+async def _answer(client, session_id, question, text):
+    resp = await client.post("/answer", data={"session_id": session_id, "question": question, "text": text,
+                                              "no_cache": "true"})
+    assert resp.status_code == 200
+    return resp.json()
+
+
+async def test_matching_answer_takes_the_speculation(client, fakes, start_session):
+    session_id, question = await start_session()
+    await _prefetch(client, session_id, question, "I have a sore throat")
+
+    reply = await _answer(client, session_id, question, "I have a sore throat")
+
+    assert reply["next_question"]
+    assert fakes["openai"].calls["chat"] == 1
+    assert (prefetch._counters["hits"], prefetch._counters["hits_in_flight"]) == (1, 1)
+
+
+async def test_different_answer_falls_through_to_a_fresh_call(client, fakes, start_session):
+    session_id, question = await start_session()
+    await _prefetch(client, session_id, question, "I have a sore throat")
+
+    reply = await _answer(client, session_id, question, "Actually it is my ear that hurts")
+
+    assert reply["next_question"] and reply["user_answer"] == "Actually it is my ear that hurts"
+    assert fakes["openai"].calls["chat"] == 2
+    assert (prefetch._counters["mismatched"], prefetch._counters["hits"]) == (1, 0)
+    assert not prefetch._pending
+    doc = (await client.get(f"/sessions/{session_id}")).json()
+    assert [qa["answer"] for qa in doc["qas"]] == ["Actually it is my ear that hurts"]
+
+
+async def test_expired_speculation_is_not_used(client, fakes, start_session, monkeypatch):
+    monkeypatch.setattr(prefetch, "PREFETCH_TTL", 0.05)
+    session_id, question = await start_session()
+    await _prefetch(client, session_id, question, "I have a sore throat")
+    await asyncio.sleep(0.1)
+
+    reply = await _answer(client, session_id, question, "I have a sore throat")
+
+    assert reply["next_question"]
+    assert fakes["openai"].calls["chat"] == 2
+    assert (prefetch._counters["expired"], prefetch._counters["hits"]) == (1, 0)
+
+
+async def test_newer_prefetch_supersedes_the_older_one(client, fakes, start_session):
+    session_id, question = await start_session()
+    await _prefetch(client, session_id, question, "I have a sore")
+    await _prefetch(client, session_id, question, "I have a sore throat")
+
+    await _answer(client, session_id, question, "I have a sore throat")
+
+    assert prefetch._counters["superseded"] == 1 and prefetch._counters["hits"] == 1
+
+
+async def test_reply_for_an_older_context_is_stale(fakes):
+    older = [{"question": "Why are you here?", "answer": "Headache"}, {"question": "Since when?", "answer": "Monday"}]
+    current = [{"question": "Why are you here?", "answer": "Back pain"}, {"question": "Since when?", "answer": "Monday"}]
+
+    async def run():
+        return older, {"next_question": "Is it getting worse?", "done": False}
+
+    assert prefetch.start("s1", "Since when?", "Monday", run)
+    assert await prefetch.claim("s1", current) is None
+    assert prefetch._counters["stale"] == 1
+
+    assert prefetch.start("s1", "Since when?", "Monday", run)
+    assert await prefetch.claim("s1", older) == {"next_question": "Is it getting worse?", "done": False}
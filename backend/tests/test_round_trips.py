@@ -0,0 +1,45 @@
+import json
+
+FORM = json.dumps({"fullName": "Test Patient", "chestPain": "yes"})
+
+
+async def test_start_session_is_one_round_trip(client):
+    resp = await client.post("/start_session", json={"patient_name": "test"})
+    assert resp.status_code == 200
+    assert resp.headers["X-DB-Round-Trips"] == "1"
+
+
+# /answer and /followup_answer update the live session and insert the history
+# entry concurrently: two writes, one round trip of latency
+
+
+async def test_answer_is_two_concurrent_writes(client, start_session):
+    session_id, question = await start_session()
+    for text in ["I have had a headache for a while", "It started about two weeks ago"]:
+        resp = await client.post("/answer", data={"session_id": session_id, "question": question, "text": text})
+        assert resp.status_code == 200
+        assert resp.headers["X-DB-Round-Trips"] == "2"
+        question = resp.json()["next_question"]
+
+
+async def test_followup_answer_is_two_concurrent_writes(client, start_session):
+    session_id, _ = await start_session()
+    for question, text in [("Do you have any allergies?", "No"), ("Do you take any medication?", "Only vitamins")]:
+        resp = await client.post("/followup_answer", data={"session_id": session_id, "question": question,
+                                                           "text": text, "form_data": FORM})
+        assert resp.status_code == 200
+        assert resp.headers["X-DB-Round-Trips"] == "2"
+
+
+async def test_an_unknown_session_also_removes_its_history_entry(client):
+    resp = await client.post("/answer", data={"session_id": "missing", "question": "Q?", "text": "A"})
+    assert resp.status_code == 404
+    assert resp.headers["X-DB-Round-Trips"] == "3"
+
+
+async def test_round_trips_are_reported_in_stats(client, start_session):
+    session_id, question = await start_session()
+    await client.post("/answer", data={"session_id": session_id, "question": question, "text": "A sore throat"})
+    stats = (await client.get("/stats")).json()
+    assert stats["session_db"]["requests"] == 2
+    assert stats["session_db"]["avg_round_trips"] == 1.5
@@ -0,0 +1,139 @@
+import time
+import asyncio
+
+import httpx
+import pytest
+
+from app import fakes, scheduler
+from app.scheduler import PRIORITY_BATCH, PRIORITY_FOLLOWUP, PRIORITY_IN_SESSION, ModelScheduler, TokenBucket
+
+CHAT = {"model": "fake", "messages": [{"role": "user", "content": "Next question?"}]}
+
+
+@pytest.fixture
+async def upstream():
+    fake = fakes.FakeOpenAI(latency=0.01, jitter=0, done_rate=0, seed=1)
+    async with httpx.AsyncClient(transport=fake.transport(), base_url="https://api.openai.test/v1") as http:
+        yield fake, http
+
+
+def _sender(http, log=None, name=None):
+    async def send():
+        if log is not None:
+            log.append((name, time.monotonic()))
+        return await http.send(http.build_request("POST", "/chat/completions", json=CHAT), stream=True)
+    return send
+
+
+async def test_followups_are_served_before_batch_jobs(upstream):
+    fake, http = upstream
+    sched = ModelScheduler("fake", concurrency=1)
+    served = []
+    # hold the only slot so everything below has to queue
+    await sched.acquire(PRIORITY_IN_SESSION)
+    calls = [asyncio.create_task(sched.call(_sender(http, served, f"batch-{n}"), priority=PRIORITY_BATCH))
+             for n in range(3)]
+    calls += [asyncio.create_task(sched.call(_sender(http, served, f"followup-{n}"), priority=PRIORITY_FOLLOWUP))
+              for n in range(3)]
+    await asyncio.sleep(0)
+    assert sched.stats()["queued"] == 6
+
+    sched.release()
+    responses = await asyncio.gather(*calls)
+
+    assert [r.status_code for r in responses] == [200] * 6
+    assert [name for name, _ in served] == ["followup-0", "followup-1", "followup-2", "batch-0", "batch-1", "batch-2"]
+    assert sched.stats()["wait"]["followup"]["count"] == 3
+
+
+async def test_priority_follows_the_request_context(upstream):
+    fake, http = upstream
+    sched = ModelScheduler("fake", concurrency=1)
+    served = []
+
+    async def from_request(priority, name):
+        scheduler.set_priority(priority)
+        return await sched.call(_sender(http, served, name))
+
+    await sched.acquire(PRIORITY_IN_SESSION)
+    calls = [asyncio.create_task(from_request(PRIORITY_BATCH, "batch")),
+             asyncio.create_task(from_request(PRIORITY_FOLLOWUP, "followup"))]
+    await asyncio.sleep(0)
+    sched.release()
+    await asyncio.gather(*calls)
+    assert [name for name, _ in served] == ["followup", "batch"]
+
+
+def test_token_bucket_admits_a_burst_then_paces():
+    bucket = TokenBucket(per_minute=60)  # 1/s, 10 s burst
+    now = bucket.updated
+    for _ in range(10):
+        assert bucket.delay(1, now) == 0.0
+        bucket.take(1)
+    assert bucket.delay(1, now) == pytest.approx(1.0)
+    assert bucket.delay(1, now + 0.5) == pytest.approx(0.5)
+    assert bucket.delay(1, now + 1.0) == 0.0
+
+
+async def test_rate_limit_holds_calls_past_the_burst():
+    sched = ModelScheduler("fake", concurrency=1000, rpm=600)  # 10/s, burst of 100
+    t0 = time.monotonic()
+    for _ in range(100):
+        await sched.acquire(PRIORITY_IN_SESSION)
+    assert time.monotonic() - t0 < 0.05
+    late = asyncio.create_task(sched.acquire(PRIORITY_IN_SESSION))
+    await asyncio.sleep(0.03)
+    assert not late.done()
+    await asyncio.wait_for(late, 1)
+    assert time.monotonic() - t0 >= 0.08
+
+
+async def test_429_pauses_the_model_and_retries(upstream, monkeypatch):
+    fake, http = upstream
+    monkeypatch.setattr(scheduler, "OPENAI_BACKOFF_BASE", 0.01)
+    fake.error_rate, fake.retry_after = 1.0, 0.2
+    sched = ModelScheduler("fake", concurrency=4)
+    sent = []
+    send = _sender(http, sent, "first")
+
+    async def first_then_ok():
+        resp = await send()
+        fake.error_rate = 0.0  # only the first attempt is throttled
+        return resp
+
+    first = asyncio.create_task(sched.call(first_then_ok))
+    while not fake.calls["throttled"]:
+        await asyncio.sleep(0.005)
+    # a call arriving during the pause waits for it too, though slots are free
+    other = asyncio.create_task(sched.call(_sender(http, sent, "other")))
+    responses = await asyncio.gather(first, other)
+
+    assert [r.status_code for r in responses] == [200, 200]
+    assert fake.calls["throttled"] == 1 and fake.calls["chat"] == 2
+    stats = sched.stats()
+    assert (stats["throttled"], stats["retries"], stats["failed"]) == (1, 1, 0)
+    throttled_at = sent[0][1]
+    assert all(at - throttled_at >= 0.2 for name, at in sent[1:])
+
+
+async def test_429_gives_up_after_the_retries(upstream, monkeypatch):
+    fake, http = upstream
+    monkeypatch.setattr(scheduler, "OPENAI_BACKOFF_BASE", 0.001)
+    monkeypatch.setattr(scheduler, "OPENAI_MAX_RETRIES", 2)
+    fake.error_rate, fake.retry_after = 1.0, 0.001
+    sched = ModelScheduler("fake", concurrency=1)
+    with pytest.raises(httpx.HTTPStatusError):
+        await sched.call(_sender(http))
+    assert fake.calls["throttled"] == 3
+    assert sched.stats()["in_flight"] == 0
+
+
+async def test_full_queue_is_rejected():
+    sched = ModelScheduler("fake", concurrency=1, queue_depth=1)
+    await sched.acquire(PRIORITY_IN_SESSION)
+    waiting = asyncio.create_task(sched.acquire(PRIORITY_BATCH))
+    await asyncio.sleep(0)
+    with pytest.raises(scheduler.SchedulerQueueFull):
+        await sched.acquire(PRIORITY_FOLLOWUP)
+    sched.release()
+    await waiting
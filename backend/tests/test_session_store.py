@@ -0,0 +1,156 @@
+import uuid
+from datetime import datetime
+
+import pytest
+
+from app import db, session_store
+from app.session_store import QAS_CONTEXT_WINDOW, QAS_LIVE_WINDOW
+
+BACKENDS = ["memory", "redis", "mongo", "cached"]
+
+
+@pytest.fixture(params=BACKENDS)
+async def store(request, fakes):
+    if request.param == "memory":
+        yield session_store.MemorySessionStore()
+    elif request.param == "redis":
+        from fakeredis import FakeAsyncRedis
+
+        client = FakeAsyncRedis()
+        yield session_store.RedisSessionStore(client=client)
+        await client.aclose()
+    else:
+        backend = session_store.MongoSessionStore()
+        store = backend if request.param == "mongo" else session_store.CachedSessionStore(backend)
+        yield store
+        await store.close()
+
+
+def _doc(**fields):
+    return dict({
+        "session_id": str(uuid.uuid4()),
+        "patient_name": "test",
+        "domain_questions": ["What brings you in today?"],
+        "qas": [],
+        "qa_count": 0,
+        "created_at": datetime.utcnow(),
+        "done": False,
+    }, **fields)
+
+
+def _qa(n: int):
+    return {"question": f"Question {n}?", "answer": f"Answer {n}", "timestamp": f"2026-10-17T09:00:{n:02d}"}
+
+
+async def test_create_and_get(store):
+    doc = _doc()
+    await store.create(doc)
+    got = await store.get(doc["session_id"])
+    for field in ("session_id", "patient_name", "domain_questions", "qas", "qa_count", "done"):
+        assert got[field] == doc[field]
+
+
+async def test_unknown_session(store):
+    assert await store.get("missing") is None
+    assert await store.append_qa("missing", _qa(0)) is None
+    assert await store.history("missing") is None
+    assert await store.recent_qas("missing") is None
+
+
+async def test_append_qa_counts_and_returns_context_window(store):
+    doc = _doc()
+    await store.create(doc)
+    for n in range(QAS_CONTEXT_WINDOW + 3):
+        result = await store.append_qa(doc["session_id"], _qa(n))
+        assert result["qa_count"] == n + 1
+    assert [qa["answer"] for qa in result["qas"]] == [f"Answer {n}" for n in range(3, QAS_CONTEXT_WINDOW + 3)]
+    assert len(await store.recent_qas(doc["session_id"])) == QAS_CONTEXT_WINDOW
+
+
+async def test_append_qa_caps_the_live_window(store):
+    doc = _doc()
+    await store.create(doc)
+    total = QAS_LIVE_WINDOW + 5
+    for n in range(total):
+        await store.append_qa(doc["session_id"], _qa(n))
+    got = await store.get(doc["session_id"])
+    assert got["qa_count"] == total
+    assert len(got["qas"]) == QAS_LIVE_WINDOW
+    assert got["qas"][-1]["answer"] == f"Answer {total - 1}"
+
+
+async def test_opening_answer_goes_into_the_summary(store):
+    doc = _doc()
+    await store.create(doc)
+    for n in range(3):
+        await store.append_qa(doc["session_id"], _qa(n))
+    got = await store.get(doc["session_id"])
+    assert got["summary"]["opening"] == {"question": "Question 0?", "answer": "Answer 0"}
+
+
+async def test_append_qa_applies_set_fields(store):
+    doc = _doc()
+    await store.create(doc)
+    result = await store.append_qa(doc["session_id"], _qa(0), set_fields={"form_type": "cardiac"})
+    assert result["form_type"] == "cardiac"
+    assert (await store.get(doc["session_id"]))["form_type"] == "cardiac"
+
+
+@pytest.mark.parametrize("defer", [False, True])
+async def test_set_fields_with_dotted_paths(store, defer):
+    doc = _doc()
+    await store.create(doc)
+    await store.set_fields(doc["session_id"], {"followup": {"form_type": "cardiac", "done": False}}, defer=defer)
+    await store.set_fields(doc["session_id"], {"followup.done": True, "form_type": "cardiac"}, defer=defer)
+    got = await store.get(doc["session_id"])
+    assert got["followup"] == {"form_type": "cardiac", "done": True}
+    assert got["form_type"] == "cardiac"
+
+
+async def test_deferred_fields_survive_the_next_append(store):
+    doc = _doc()
+    await store.create(doc)
+    await store.set_fields(doc["session_id"], {"form_type": "dentistry"}, defer=True)
+    result = await store.append_qa(doc["session_id"], _qa(0))
+    assert result["qa_count"] == 1
+    await store.set_fields(doc["session_id"], {"done": True}, defer=True)
+    got = await store.get(doc["session_id"])
+    assert (got["form_type"], got["done"], got["qa_count"]) == ("dentistry", True, 1)
+
+
+async def test_history_pages(store):
+    doc = _doc()
+    await store.create(doc)
+    assert await store.history(doc["session_id"]) == []
+    for n in range(7):
+        await store.append_qa(doc["session_id"], _qa(n))
+    pages = [await store.history(doc["session_id"], offset=offset, limit=3) for offset in (0, 3, 6, 9)]
+    assert [[qa["answer"] for qa in page] for page in pages] == [
+        ["Answer 0", "Answer 1", "Answer 2"], ["Answer 3", "Answer 4", "Answer 5"], ["Answer 6"], []]
+
+
+async def test_history_is_not_capped_by_the_live_window(store):
+    doc = _doc()
+    await store.create(doc)
+    total = QAS_LIVE_WINDOW + 2
+    for n in range(total):
+        await store.append_qa(doc["session_id"], _qa(n))
+    history = await store.history(doc["session_id"], limit=total + 10)
+    assert [qa["answer"] for qa in history] == [f"Answer {n}" for n in range(total)]
+
+
+async def test_deferred_fields_reach_the_fallback_while_mongo_is_down(fakes, monkeypatch):
+    store = session_store.FallbackSessionStore(session_store.MongoSessionStore(), session_store.MemorySessionStore())
+
+    def down():
+        raise ConnectionError("mongo unreachable")
+
+    monkeypatch.setattr(db, "get_db", down)
+    doc = _doc()
+    await store.create(doc)
+    await store.append_qa(doc["session_id"], _qa(0))
+    await store.set_fields(doc["session_id"], {"done": True, "form_type": "cardiac"}, defer=True)
+
+    got = await store.get(doc["session_id"])
+    assert (got["qa_count"], got["done"], got["form_type"]) == (1, True, "cardiac")
+    await store.close()
@@ -0,0 +1,112 @@
+import pytest
+from fakeredis import FakeAsyncRedis, FakeServer
+
+from app import idempotency, llm_cache, session_store, shared, transcripts
+from app.utils.lru import LRUCache
+
+CACHES = [(idempotency, "_results"), (transcripts, "_cache"), (llm_cache, "_cache")]
+
+
+def _empty_like(cache: LRUCache) -> LRUCache:
+    return LRUCache(max_items=cache.max_items, max_bytes=cache.max_bytes, ttl=cache.ttl, sizeof=cache._sizeof)
+
+
+class Worker:
+    """One app process's local state over a Redis server every worker shares.
+
+    The tests run a single copy of the app, so a request is sent "to" a worker
+    by swapping its caches, session store and Redis connection in first."""
+
+    def __init__(self, server: FakeServer, backend: str):
+        self.redis = FakeAsyncRedis(server=server)
+        self.backend = backend
+        self.caches = {(module, name): _empty_like(getattr(module, name)) for module, name in CACHES}
+        self.store = None
+
+    def use(self):
+        for (module, name), cache in self.caches.items():
+            setattr(module, name, cache)
+        shared.set_redis(self.redis)
+        if self.store is None:
+            if self.backend == "redis":
+                self.store = session_store.RedisSessionStore(client=self.redis)
+            else:
+                self.store = session_store.build_store(self.backend)
+        session_store.set_store(self.store)
+
+
+@pytest.fixture(params=["mongo", "redis"])
+async def workers(request, client, monkeypatch):
+    for module, name in CACHES:
+        monkeypatch.setattr(module, name, getattr(module, name))
+    server = FakeServer()
+    pair = [Worker(server, request.param) for _ in range(2)]
+
+    async def send(worker, method, url, **kwargs):
+        worker.use()
+        return await client.request(method, url, **kwargs)
+
+    yield pair, send
+    for worker in pair:
+        if worker.store is not None:
+            await worker.store.close()
+        await worker.redis.aclose()
+
+
+async def _start(send, worker):
+    resp = await send(worker, "POST", "/start_session", json={"patient_name": "test"})
+    resp.raise_for_status()
+    return resp.json()["session_id"], resp.json()["first_question"]
+
+
+async def test_a_session_started_on_one_worker_is_served_by_another(workers):
+    (a, b), send = workers
+    session_id, question = await _start(send, a)
+
+    resp = await send(b, "POST", "/answer", data={"session_id": session_id, "question": question, "text": "Headaches"})
+    assert resp.status_code == 200
+
+    got = (await send(a, "GET", f"/sessions/{session_id}")).json()
+    assert got["qa_count"] == 1
+    assert got["qas"][-1]["answer"] == "Headaches"
+
+
+async def test_an_idempotency_key_is_honoured_by_another_worker(workers, fakes):
+    (a, b), send = workers
+    session_id, question = await _start(send, a)
+    data = {"session_id": session_id, "question": question, "text": "My knee hurts"}
+
+    first = await send(a, "POST", "/answer", data=data, headers={"Idempotency-Key": "submit-1"})
+    chat_calls = fakes["openai"].calls["chat"]
+    again = await send(b, "POST", "/answer", data=data, headers={"Idempotency-Key": "submit-1"})
+
+    assert again.json() == first.json()
+    assert again.headers.get("Idempotent-Replayed") == "true"
+    assert fakes["openai"].calls["chat"] == chat_calls
+    assert (await send(b, "GET", f"/sessions/{session_id}")).json()["qa_count"] == 1
+
+
+async def test_a_transcript_cached_on_one_worker_is_found_by_another(workers, fakes):
+    (a, b), send = workers
+    session_id, question = await _start(send, a)
+
+    resp = await send(a, "POST", "/transcribe", files={"audio": ("answer.wav", b"RIFF....WAVEfmt fake audio", "audio/wav")})
+    resp.raise_for_status()
+    transcription = resp.json()
+
+    resp = await send(b, "POST", "/answer", data={
+        "session_id": session_id, "question": question, "transcription_id": transcription["transcription_id"]})
+
+    assert resp.status_code == 200
+    assert fakes["openai"].calls["transcribe"] == 1
+    got = (await send(a, "GET", f"/sessions/{session_id}")).json()
+    assert got["qas"][-1]["answer"] == transcription["transcription"]
+
+
+async def test_a_deferred_session_write_is_visible_to_another_worker(workers):
+    (a, b), send = workers
+    session_id, _ = await _start(send, a)
+    await a.store.set_fields(session_id, {"form_type": "cardiac"}, defer=True)
+
+    got = (await send(b, "GET", f"/sessions/{session_id}")).json()
+    assert got["form_type"] == "cardiac"
@@ -0,0 +1,7 @@
+from app import warmup
+
+
+async def test_indexes_are_created_without_the_db_warmup_step(client, fakes):
+    assert warmup._names(warmup.WARMUP) == []  # WARMUP=none in conftest
+    sessions = fakes["mongo"].get_default_database()["sessions"]
+    assert sessions.indexes["session_id_1"] == {"unique": True}
@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+
+from app import transcripts
+
+AUDIO = ("answer.wav", b"RIFF....WAVEfmt fake audio", "audio/wav")
+
+
+async def _transcribe(client, audio=AUDIO):
+    resp = await client.post("/transcribe", files={"audio": audio})
+    resp.raise_for_status()
+    return resp.json()
+
+
+async def test_answer_by_transcription_id_skips_the_upload_and_stt(client, start_session, fakes):
+    session_id, question = await start_session()
+    transcription = await _transcribe(client)
+
+    resp = await client.post("/answer", data={
+        "session_id": session_id, "question": question, "transcription_id": transcription["transcription_id"]})
+
+    assert resp.status_code == 200
+    assert fakes["openai"].calls["transcribe"] == 1
+    got = (await client.get(f"/sessions/{session_id}")).json()
+    assert got["qas"][-1]["answer"] == transcription["transcription"]
+
+
+async def test_the_same_audio_uploaded_again_is_a_cache_hit(client, start_session, fakes):
+    session_id, question = await start_session()
+    transcription = await _transcribe(client)
+
+    resp = await client.post("/answer", data={"session_id": session_id, "question": question}, files={"audio": AUDIO})
+
+    assert resp.status_code == 200
+    assert fakes["openai"].calls["transcribe"] == 1
+    assert (await _transcribe(client))["transcription_id"] == transcription["transcription_id"]
+    assert fakes["openai"].calls["transcribe"] == 1
+
+
+async def test_different_audio_is_transcribed_again(client, fakes):
+    first = await _transcribe(client)
+    second = await _transcribe(client, ("other.wav", b"RIFF....WAVEfmt other audio", "audio/wav"))
+    assert first["transcription_id"] != second["transcription_id"]
+    assert fakes["openai"].calls["transcribe"] == 2
+
+
+async def test_an_unknown_transcription_id_is_gone(client, start_session):
+    session_id, question = await start_session()
+    resp = await client.post("/answer", data={"session_id": session_id, "question": question, "transcription_id": "0" * 64})
+    assert resp.status_code == 410
+    assert transcripts.stats()["id_lookups"] == transcripts.stats()["id_hits"] + 1
+
+
+async def test_concurrent_uploads_of_the_same_audio_share_one_transcription(client, start_session, fakes):
+    session_id, question = await start_session()
+    fakes["openai"].stt_latency = 0.1
+    transcription, answer = await asyncio.gather(
+        _transcribe(client),
+        client.post("/answer", data={"session_id": session_id, "question": question}, files={"audio": AUDIO}),
+    )
+    assert answer.status_code == 200
+    assert fakes["openai"].calls["transcribe"] == 1
+    assert transcripts.stats()["coalesced"] == 1
+    got = (await client.get(f"/sessions/{session_id}")).json()
+    assert got["qas"][-1]["answer"] == transcription["transcription"]
+
+
+async def test_concurrent_misses_run_the_transcription_once(fakes):
+    calls = []
+
+    async def stt():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return "Hello"
+
+    results = await asyncio.gather(*[transcripts.transcribe("same-audio", stt) for _ in range(3)])
+    assert results == ["Hello"] * 3
+    assert len(calls) == 1 and transcripts.stats()["coalesced"] == 2
+
+
+async def test_a_failed_transcription_reaches_every_waiter_and_is_not_cached(fakes):
+    calls = []
+
+    async def broken():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        raise RuntimeError("STT down")
+
+    results = await asyncio.gather(*[transcripts.transcribe("broken-audio", broken) for _ in range(2)], return_exceptions=True)
+    assert [type(r) for r in results] == [RuntimeError, RuntimeError]
+    assert len(calls) == 1
+
+    async def working():
+        return "Hello"
+
+    assert await transcripts.transcribe("broken-audio", working) == "Hello"
+    assert await transcripts.get("broken-audio") == "Hello"
+
+
+async def test_a_cancelled_transcription_cancels_the_waiters_and_caches_nothing(fakes):
+    started = asyncio.Event()
+
+    async def slow():
+        started.set()
+        await asyncio.sleep(10)
+        return "never"
+
+    owner = asyncio.create_task(transcripts.transcribe("slow-audio", slow))
+    await started.wait()
+    waiter = asyncio.create_task(transcripts.transcribe("slow-audio", slow))
+    await asyncio.sleep(0)
+    owner.cancel()
+    for task in (owner, waiter):
+        with pytest.raises(asyncio.CancelledError):
+            await task
+    assert await transcripts.get("slow-audio") is None and not transcripts._inflight
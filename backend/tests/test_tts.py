@@ -0,0 +1,61 @@
+import asyncio
+
+import pytest
+
+from app.utils import tts
+
+
+@pytest.fixture
+def engine(fakes):
+    fakes["tts"].seconds_per_char = 0.002
+    return fakes["tts"]
+
+
+async def test_concurrent_misses_share_one_render(engine):
+    text = "Do you have any allergies?"
+    first, second = await asyncio.gather(tts.text_to_speech_bytes(text), tts.text_to_speech_bytes(text))
+    assert first == second
+    assert engine.renders == 1
+    assert not tts._inflight
+
+
+async def test_a_cancelled_caller_does_not_fail_the_others(engine):
+    text = "How long have you had the headache?"
+    owner = asyncio.create_task(tts.text_to_speech_bytes(text))
+    await asyncio.sleep(0.01)
+    waiter = asyncio.create_task(tts.text_to_speech_bytes(text))
+    await asyncio.sleep(0.01)
+    owner.cancel()  # e.g. a stream's lookahead after the client disconnected
+
+    data = await waiter
+    assert data.startswith(b"RIFF")
+    assert owner.cancelled()
+    assert engine.renders == 1
+    # the render finished for the cache even though the caller that started it left
+    assert await tts.text_to_speech_bytes(text) == data and engine.renders == 1
+
+
+async def test_a_segment_in_another_format_is_converted_not_dropped(engine):
+    from app.fakes import silent_wav
+
+    first, second = "Thanks for waiting.", "Where does it hurt?"
+    assert tts.split_segments(f"{first} {second}") == [first, second]
+    # cached earlier at a different sample rate than the engine renders now
+    tts._memory_cache.set(tts.cache_key(second), silent_wav(0.5, rate=8000))
+
+    chunks = [chunk async for chunk in tts.stream_speech(f"{first} {second}")]
+
+    header, first_frames, second_frames = chunks
+    params, frames = tts._read_wav(await tts.text_to_speech_bytes(first))
+    assert params == (1, 2, 16000)
+    assert header == tts._streaming_wav_header(*params) and first_frames == frames
+    assert len(second_frames) == 2 * 16000 // 2  # 0.5 s of 16-bit mono at 16 kHz
+
+
+def test_convert_frames():
+    from array import array
+
+    stereo = array("h", [100, -100, 2000, 1000, 300, 300]).tobytes()
+    assert array("h", tts._convert_frames(stereo, (2, 2, 8000), (1, 2, 16000))).tolist() == [0, 0, 1500, 1500, 300, 300]
+    assert tts._convert_frames(stereo, (2, 2, 8000), (2, 2, 8000)) == stereo
+    assert array("h", tts._convert_frames(bytes([128, 255, 0]), (1, 1, 8000), (1, 2, 8000))).tolist() == [0, 32512, -32768]
@@ -0,0 +1,103 @@
+import time
+import asyncio
+import threading
+import multiprocessing as mp
+
+import pytest
+
+from app.utils import tts_pool
+from app.utils.tts_pool import TTSRenderError, TTSWorkerPool
+
+
+class ThreadWorker:
+    """In-process stand-in for a pyttsx3 worker process, serving the same pipe
+    protocol. "die" closes the pipe, "slow" takes a while, anything else is
+    answered with a WAV-sized payload."""
+
+    payload = b"\x00" * (2 << 20)
+
+    def __init__(self, ctx):
+        self.conn, child = mp.Pipe()
+        self.process = threading.Thread(target=self._serve, args=(child,), daemon=True)
+        self.process.start()
+        self.jobs = 0
+        self.killed = False
+
+    def _serve(self, conn):
+        while True:
+            try:
+                job = conn.recv()
+            except (EOFError, OSError):
+                break
+            if job is None or job[0] == "die":
+                conn.close()
+                break
+            if job[0] == "slow":
+                time.sleep(0.2)
+            try:
+                conn.send(("ok", self.payload))
+            except OSError:
+                break
+
+    def kill(self):
+        self.killed = True
+        self.conn.close()
+
+
+@pytest.fixture
+async def pool(monkeypatch):
+    monkeypatch.setattr(tts_pool, "_Worker", ThreadWorker)
+    pool = TTSWorkerPool(size=2, job_timeout=2)
+    await pool.start()
+    yield pool
+    await pool.stop()
+
+
+async def _settle(pool, idle):
+    for _ in range(100):
+        if pool.stats()["idle"] == idle and not pool._respawning:
+            return
+        await asyncio.sleep(0.01)
+
+
+async def test_a_render_returns_the_whole_payload(pool):
+    assert await pool.render("Hello there.") == ThreadWorker.payload
+    assert pool.stats()["idle"] == 2
+
+
+async def test_a_dead_worker_is_replaced_not_reused(pool):
+    workers = list(pool._workers)
+    with pytest.raises(TTSRenderError):
+        await pool.render("die")
+    await _settle(pool, 2)
+
+    assert pool.stats()["recycled"] == 1
+    dead = [w for w in workers if w not in pool._workers]
+    assert len(dead) == 1 and dead[0].killed
+    assert dead[0] not in list(pool._idle._queue)
+    assert await pool.render("Still working?") == ThreadWorker.payload
+
+
+async def test_a_worker_that_cannot_be_restarted_is_dropped(pool, monkeypatch):
+    def broken(ctx):
+        raise OSError("cannot spawn")
+
+    monkeypatch.setattr(tts_pool, "_Worker", broken)
+    with pytest.raises(TTSRenderError):
+        await pool.render("die")
+    await _settle(pool, 1)
+
+    assert pool.stats()["idle"] == 1 and len(pool._workers) == 1
+    assert not pool._workers[0].killed
+    assert await pool.render("One left.") == ThreadWorker.payload
+
+
+async def test_a_worker_cancelled_mid_render_is_replaced(pool):
+    render = asyncio.create_task(pool.render("slow"))
+    await asyncio.sleep(0.05)
+    render.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await render
+    await _settle(pool, 2)
+    assert pool.stats()["recycled"] == 1
+    assert all(not w.killed for w in pool._workers)
@@ -0,0 +1,51 @@
+import pytest
+
+from app import triage
+from app.main import app
+from bench.ws_turn import ASGIWebSocket
+
+
+@pytest.fixture
+def slow_llm(fakes, monkeypatch):
+    monkeypatch.setattr(triage, "TRIAGE_MODE", "off")
+    fakes["openai"].latency = 0.3
+
+
+async def _until(ws, kind):
+    seen = []
+    while True:
+        _, message = await ws.receive()
+        if isinstance(message, dict):
+            seen.append(message["type"])
+            if message["type"] == kind:
+                return seen
+
+
+async def test_pings_are_answered_while_a_turn_runs(client, start_session, slow_llm):
+    session_id, question = await start_session()
+    async with ASGIWebSocket(app, f"/ws/session/{session_id}?speak=false") as ws:
+        await _until(ws, "ready")
+        await ws.send_json({"type": "start", "question": question})
+        await ws.send_json({"type": "text", "text": "My head hurts"})
+        # the second answer has to wait for the first turn; the connection doesn't
+        await ws.send_json({"type": "text", "text": "Since Monday"})
+        await ws.send_json({"type": "ping"})
+
+        seen = await _until(ws, "done")
+        assert "pong" in seen
+        await _until(ws, "done")
+
+
+async def test_answers_sent_during_a_turn_run_in_order(client, start_session, slow_llm):
+    session_id, question = await start_session()
+    async with ASGIWebSocket(app, f"/ws/session/{session_id}?speak=false") as ws:
+        await _until(ws, "ready")
+        await ws.send_json({"type": "start", "question": question})
+        await ws.send_json({"type": "text", "text": "My head hurts"})
+        await ws.send_json({"type": "text", "text": "Since Monday"})
+        await _until(ws, "done")
+        await _until(ws, "done")
+
+    history = (await client.get(f"/sessions/{session_id}/history")).json()["items"]
+    answers = [qa["answer"] for qa in history]
+    assert answers == ["My head hurts", "Since Monday"]
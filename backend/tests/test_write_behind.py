@@ -0,0 +1,81 @@
+import asyncio
+import threading
+
+from app.write_behind import WriteBehindQueue, merge
+
+
+def test_merge_keeps_paths_and_sub_paths_apart():
+    pending = merge({}, {"followup": {"form_type": "cardiac", "done": False}})
+    merge(pending, {"followup.done": True, "done": True})
+    assert pending == {"followup": {"form_type": "cardiac", "done": True}, "done": True}
+    merge(pending, {"followup": "n/a"})
+    merge(pending, {"followup.done": False})
+    assert pending == {"followup.done": False, "done": True}
+
+
+async def test_batches_are_flushed():
+    written = []
+
+    async def write(batch):
+        written.extend(batch)
+
+    queue = WriteBehindQueue(write, interval_ms=10, batch=2)
+    for n in range(3):
+        assert await queue.put(f"s{n}", {"done": True})
+    await queue.put("s0", {"form_type": "cardiac"})
+    assert queue.peek("s0") == {"done": True, "form_type": "cardiac"}
+    await asyncio.sleep(0.05)
+    assert sorted(written) == [("s0", {"done": True, "form_type": "cardiac"}), ("s1", {"done": True}),
+                               ("s2", {"done": True})]
+    assert queue.stats()["flushes"] == 2
+    await queue.close()
+
+
+async def test_a_failed_write_is_retried():
+    attempts = []
+
+    async def flaky(batch):
+        attempts.append(batch)
+        if len(attempts) == 1:
+            raise ConnectionError("DB unreachable")
+
+    queue = WriteBehindQueue(flaky, interval_ms=60_000)
+    await queue.put("s0", {"done": True})
+    assert not await queue.flush()
+    assert queue.peek("s0") == {"done": True}
+    await queue.close()
+    assert attempts[-1] == [("s0", {"done": True})] and len(queue) == 0
+
+
+async def test_the_log_is_written_off_the_event_loop_and_replayed(tmp_path, monkeypatch):
+    log_path = str(tmp_path / "sessions.log")
+    threads = set()
+    append = WriteBehindQueue._log_append
+
+    def recorded(self, line):
+        threads.add(threading.current_thread())
+        append(self, line)
+
+    monkeypatch.setattr(WriteBehindQueue, "_log_append", recorded)
+
+    async def down(batch):
+        raise ConnectionError("DB unreachable")
+
+    crashed = WriteBehindQueue(down, interval_ms=60_000, log_path=log_path)
+    await crashed.put("s0", {"followup": {"form_type": "cardiac", "done": False}})
+    await crashed.put("s0", {"followup.done": True})
+    await crashed.put("s1", {"done": True})
+    crashed._task.cancel()  # the process dies: no flush, no close
+    assert threads and threading.main_thread() not in threads
+
+    written = {}
+
+    async def write(batch):
+        written.update(batch)
+
+    restarted = WriteBehindQueue(write, log_path=log_path)
+    await restarted.start()
+    await restarted.close()
+    assert written == {"s0": {"followup": {"form_type": "cardiac", "done": True}}, "s1": {"done": True}}
+    assert restarted.stats()["replayed"] == 3
+    assert not list(tmp_path.iterdir())
@@ -138,7 +138,8 @@ const PostFormFollowUp = ({ formType, voiceHistory, formData, onComplete }) => {
         currentQuestion,
         currentAnswer,
         formData,
-        5 // max questions
+        5, // max questions
+        formType
       );
 
       setConversationHistory((prev) => [
@@ -59,7 +59,7 @@ const VoiceAssistant = ({ onSessionComplete, domainQuestions = null }) => {
 
         try {
           // Transcribe the audio
-          const transcriptionResult = await voiceAssistantService.transcribeAudio(audioBlob);
+          const transcriptionResult = await voiceAssistantService.transcribeAudio(audioBlob, sessionId, currentQuestion);
           setCurrentAnswer(transcriptionResult.transcription);
         } catch (err) {
           setError(`Transcription failed: ${err.message}`);
@@ -70,12 +70,18 @@ export const voiceAssistantService = {
   /**
    * Transcribe an audio blob using the backend
    * @param {Blob} audioBlob - Audio blob to transcribe
+   * @param {string} sessionId - Optional; with question, lets the backend prefetch the next question
+   * @param {string} question - Optional question being answered
    * @returns {Promise<{transcription: string}>}
    */
-  transcribeAudio: async (audioBlob) => {
+  transcribeAudio: async (audioBlob, sessionId = null, question = null) => {
     try {
       const formData = new FormData();
       formData.append('audio', audioBlob, 'answer.webm');
+      if (sessionId && question) {
+        formData.append('session_id', sessionId);
+        formData.append('question', question);
+      }
 
       const response = await fetch(`${BACKEND_BASE_URL}/transcribe`, {
         method: 'POST',
@@ -142,9 +148,10 @@ export const voiceAssistantService = {
    * @param {string} answer - Text answer or transcribed answer
    * @param {object} formData - The written form data (object)
    * @param {number} maxQuestions - Maximum number of follow-up questions (default 5)
+   * @param {string} formType - 'dentistry' or 'cardiac' (optional; inferred from formData otherwise)
    * @returns {Promise<{next_question: string|null, done: boolean, user_answer: string}>}
    */
-  submitFollowupAnswer: async (sessionId, question, answer, formDataObj = {}, maxQuestions = 5) => {
+  submitFollowupAnswer: async (sessionId, question, answer, formDataObj = {}, maxQuestions = 5, formType = null) => {
     try {
       const formData = new FormData();
       formData.append('session_id', sessionId);
@@ -152,6 +159,7 @@ export const voiceAssistantService = {
       formData.append('text', answer);
       formData.append('form_data', JSON.stringify(formDataObj));
       formData.append('max_questions', maxQuestions);
+      if (formType) formData.append('form_type', formType);
 
       const response = await fetch(`${BACKEND_BASE_URL}/followup_answer`, {
         method: 'POST',